@@ -0,0 +1,187 @@
+"""
+Resumable caption generation over a directory of screenshots.
+
+Every finished image is appended to `<output_path>.log.jsonl`, so a restarted run skips whatever is
+already captioned. Images are pulled from one shared queue by `--threads_per_server` threads per
+caption server, which keeps every server busy regardless of how fast it is. At the end (or with
+`--merge_only`) the log is merged into `output_path` in the `{image_name: caption}` format read by
+UniTrajectoryDataset.
+
+    python caption_pipeline.py --images_path .../images --output_path .../captions/name.json \
+        --servers http://localhost:3070 http://localhost:3071 --only-last-two
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from tqdm import tqdm
+
+from agent_eval.clients import CaptionClient
+from agent_eval.domains.unified import image_key
+
+SKIP_CAPTION = "SKIP, NOT LAST TWO"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+
+
+def log_path_for(output_path: str) -> str:
+    return output_path + ".log.jsonl"
+
+
+def read_log(path: str) -> Dict[str, str]:
+    captions = {}
+    if not os.path.exists(path):
+        return captions
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line may be truncated if the previous run was killed mid-write
+                continue
+            captions[entry["image"]] = entry["caption"]
+    return captions
+
+
+def merge_captions(sources: Iterable[str], output_path: str) -> Dict[str, str]:
+    """Merge caption logs (.jsonl) and caption dicts (.json), later sources win."""
+    merged = {}
+    for source in sources:
+        if source.endswith(".jsonl"):
+            merged.update(read_log(source))
+        else:
+            with open(source, "r") as f:
+                merged.update(json.load(f))
+    with open(output_path, "w") as f:
+        json.dump(merged, f, indent=2)
+    return merged
+
+
+def last_two_filter(files: List[str]):
+    total_images_per_traj = defaultdict(int)
+    for file in files:
+        traj_name = "_".join(file.split("_")[:-1])
+        idx = int(file.split("_")[-1].split(".")[0])
+        total_images_per_traj[traj_name] = max(idx + 1, total_images_per_traj[traj_name])
+
+    def is_last_two(file):
+        traj_name = "_".join(file.split("_")[:-1])
+        traj_idx = int(file.split("_")[-1].split(".")[0])
+        return traj_idx >= total_images_per_traj[traj_name] - 2
+
+    return is_last_two
+
+
+class CaptionLog:
+    def __init__(self, path: str) -> None:
+        self._f = open(path, "a")
+        self._lock = threading.Lock()
+
+    def write(self, image_name: str, caption: str) -> None:
+        with self._lock:
+            self._f.write(json.dumps({"image": image_name, "caption": caption}) + "\n")
+            self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def caption_images(images_path, output_path, servers, threads_per_server=4, batch_size=1, only_last_two=False):
+    log_path = log_path_for(output_path)
+    done = read_log(log_path)
+    if not only_last_two:
+        # images skipped by an earlier --only-last-two run still need a caption
+        done = {k: v for k, v in done.items() if v != SKIP_CAPTION}
+    files = sorted(
+        f
+        for f in os.listdir(images_path)
+        if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS
+        and os.path.isfile(os.path.join(images_path, f))
+    )
+    is_last_two = last_two_filter(files) if only_last_two else None
+    todo = [f for f in files if image_key(f) not in done]
+    print(f"{len(files)} images, {len(files) - len(todo)} already captioned, {len(todo)} to go")
+
+    log = CaptionLog(log_path)
+    pending = queue.Queue()
+    for f in todo:
+        if is_last_two is not None and not is_last_two(f):
+            log.write(image_key(f), SKIP_CAPTION)
+        else:
+            pending.put(f)
+
+    pbar = tqdm(total=pending.qsize())
+    failed = []
+
+    def work(client):
+        while True:
+            batch = []
+            while len(batch) < batch_size:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                captions = client.caption([os.path.join(images_path, f) for f in batch])
+            except Exception as e:
+                print(f"Error processing {batch} on {client.url}: {e}")
+                failed.extend(batch)
+                pbar.update(len(batch))
+                continue
+            for f, caption in zip(batch, captions):
+                log.write(image_key(f), caption)
+            pbar.update(len(batch))
+
+    threads = [
+        threading.Thread(target=work, args=(CaptionClient(url),))
+        for url in servers
+        for _ in range(threads_per_server)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pbar.close()
+    log.close()
+    if failed:
+        print(f"{len(failed)} images failed, rerun to retry them")
+    return failed
+
+
+def main(args):
+    if not args.merge_only:
+        caption_images(
+            args.images_path,
+            args.output_path,
+            args.servers,
+            threads_per_server=args.threads_per_server,
+            batch_size=args.batch_size,
+            only_last_two=args.only_last_two,
+        )
+    merged = merge_captions(args.merge_with + [log_path_for(args.output_path)], args.output_path)
+    print(f"Saved {len(merged)} captions to {args.output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images_path", type=str)
+    parser.add_argument("--output_path", type=str)
+    parser.add_argument("--servers", type=str, nargs="+", default=["http://localhost:3070"])
+    parser.add_argument("--threads_per_server", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--only-last-two", action="store_true")
+    parser.add_argument("--merge_only", action="store_true")
+    parser.add_argument(
+        "--merge_with",
+        type=str,
+        nargs="*",
+        default=[],
+        help="existing caption json/jsonl files to fold into the output (e.g. old per-shard outputs)",
+    )
+    args = parser.parse_args()
+    main(args)
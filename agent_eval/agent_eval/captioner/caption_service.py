@@ -0,0 +1,289 @@
+"""
+HTTP/JSON caption service with micro-batching.
+
+Requests are queued and grouped into batches of up to `--max_batch_size` images (waiting at most
+`--max_wait_ms` for a batch to fill), so OCR and generation run batched on the model instead of one
+screenshot at a time. Images are sent as raw bytes, no temp files are written on the client side.
+
+Endpoints:
+    POST /caption   {"images": [<base64 encoded png/jpeg>, ...]} -> {"captions": [...]}
+    GET  /health    -> {"status": "ok", "backend": ..., "queue_size": ...}
+
+Start with
+    python caption_service.py --port 3070 --max_batch_size 8
+    python caption_service.py --port 3070 --backend stub --num_workers 4   # CPU only, for testing
+"""
+import argparse
+import base64
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+CAPTION_PROMPT = "Please describe the screenshot above in details.\nOCR Result:\n{ocr_result}"
+
+
+class StubCaptioner:
+    """CPU-only stand-in for the captioner that returns a deterministic description of the image."""
+
+    name = "stub"
+
+    def __init__(self, device=None):
+        pass
+
+    def caption_batch(self, images: List[Image.Image]) -> List[str]:
+        captions = []
+        for image in images:
+            mean_color = np.asarray(image.convert("RGB")).reshape(-1, 3).mean(axis=0)
+            captions.append(
+                f"A {image.width}x{image.height} screenshot with mean color "
+                f"({mean_color[0]:.0f}, {mean_color[1]:.0f}, {mean_color[2]:.0f})."
+            )
+        return captions
+
+
+class QwenVLCaptioner:
+    """
+    EasyOCR + the Qwen-VL based captioner, batched. The Qwen-VL visual encoder only accepts
+    image paths, so images are written to shared memory (/dev/shm) for the duration of a batch.
+    """
+
+    name = "qwen-vl"
+
+    def __init__(self, device=None, model_name="DigitalAgent/Captioner"):
+        import easyocr
+        import importlib
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, GenerationConfig, __version__
+
+        assert (
+            __version__ == "4.32.0"
+        ), "Please use transformers version 4.32.0, pip install transformers==4.32.0"
+        self.torch = torch
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.reader = easyocr.Reader(["en"], gpu=device != "cpu")
+        self.model = (
+            AutoModelForCausalLM.from_pretrained(model_name, trust_remote_code=True)
+            .to(device)
+            .eval()
+            .half()
+        )
+        # left padding so every prompt ends right where generation starts
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            model_name,
+            trust_remote_code=True,
+            padding_side="left",
+            pad_token="<|endoftext|>",
+        )
+        self.generation_config = GenerationConfig.from_dict(
+            {
+                "chat_format": "chatml",
+                "do_sample": True,
+                "eos_token_id": 151643,
+                "max_new_tokens": 2048,
+                "max_window_size": 6144,
+                "pad_token_id": 151643,
+                "repetition_penalty": 1.2,
+                "top_k": 0,
+                "top_p": 0.3,
+                "transformers_version": "4.31.0",
+            }
+        )
+        self.qwen_utils = importlib.import_module(
+            self.model.__class__.__module__.rsplit(".", 1)[0] + ".qwen_generation_utils"
+        )
+        self.stop_words_ids = self.qwen_utils.get_stop_words_ids("chatml", self.tokenizer)
+        self.tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+    def ocr_batch(self, images: List[Image.Image]) -> List[str]:
+        arrays = [np.asarray(image.convert("RGB")) for image in images]
+        # readtext_batched needs images of one size, screenshots of a dataset usually share it
+        if len({a.shape for a in arrays}) == 1:
+            outs = self.reader.readtext_batched(arrays, detail=0, paragraph=True)
+        else:
+            outs = [self.reader.readtext(a, detail=0, paragraph=True) for a in arrays]
+        return ["\n".join(out) if isinstance(out, list) else out for out in outs]
+
+    def caption_batch(self, images: List[Image.Image]) -> List[str]:
+        ocr_results = self.ocr_batch(images)
+        files = []
+        try:
+            raw_texts = []
+            for image, ocr_result in zip(images, ocr_results):
+                f = tempfile.NamedTemporaryFile(suffix=".png", dir=self.tmp_dir, delete=False)
+                image.save(f, format="PNG")
+                f.close()
+                files.append(f.name)
+                query = self.tokenizer.from_list_format(
+                    [{"image": f.name}, {"text": CAPTION_PROMPT.format(ocr_result=ocr_result)}]
+                )
+                raw_text, _ = self.qwen_utils.make_context(
+                    self.tokenizer,
+                    query,
+                    history=[],
+                    system="You are a helpful assistant.",
+                    max_window_size=self.generation_config.max_window_size,
+                    chat_format="chatml",
+                )
+                raw_texts.append(raw_text)
+            batch = self.tokenizer(raw_texts, padding="longest", return_tensors="pt")
+            input_ids = batch["input_ids"].to(self.model.device)
+            with self.torch.no_grad():
+                out_ids = self.model.generate(
+                    input_ids,
+                    attention_mask=batch["attention_mask"].to(self.model.device),
+                    stop_words_ids=self.stop_words_ids,
+                    generation_config=self.generation_config,
+                    return_dict_in_generate=False,
+                )
+            captions = []
+            for i, raw_text in enumerate(raw_texts):
+                padding_len = int((batch["attention_mask"][i] == 0).sum())
+                captions.append(
+                    self.qwen_utils.decode_tokens(
+                        out_ids[i][padding_len:],
+                        self.tokenizer,
+                        raw_text_len=len(raw_text),
+                        context_length=input_ids.size(1) - padding_len,
+                        chat_format="chatml",
+                        verbose=False,
+                        errors="replace",
+                    )
+                )
+            return captions
+        finally:
+            for name in files:
+                os.remove(name)
+
+
+BACKENDS = {"qwen-vl": QwenVLCaptioner, "stub": StubCaptioner}
+
+
+class BatchingQueue:
+    """
+    Collects single-image requests into micro-batches. Every worker owns one backend instance
+    and takes up to `max_batch_size` queued images, waiting at most `max_wait_ms` for more.
+    """
+
+    def __init__(self, backends, max_batch_size=8, max_wait_ms=20):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.workers = [
+            threading.Thread(target=self._work, args=(backend,), daemon=True)
+            for backend in backends
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, image: Image.Image) -> Future:
+        future = Future()
+        self.queue.put((image, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=max(0, remaining)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self, backend):
+        while True:
+            batch = self._next_batch()
+            images = [image for image, _ in batch]
+            try:
+                captions = backend.caption_batch(images)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), caption in zip(batch, captions):
+                future.set_result(caption)
+
+
+def make_handler(batcher: BatchingQueue, backend_name: str):
+    class CaptionHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, obj):
+            data = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._send_json(404, {"error": f"unknown path {self.path}"})
+            self._send_json(
+                200,
+                {"status": "ok", "backend": backend_name, "queue_size": batcher.queue.qsize()},
+            )
+
+        def do_POST(self):
+            if self.path != "/caption":
+                return self._send_json(404, {"error": f"unknown path {self.path}"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                images = [Image.open(BytesIO(base64.b64decode(img))) for img in body["images"]]
+            except Exception as e:
+                return self._send_json(400, {"error": f"bad request: {e}"})
+            futures = [batcher.submit(image) for image in images]
+            try:
+                captions = [future.result() for future in futures]
+            except Exception as e:
+                return self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            self._send_json(200, {"captions": captions})
+
+        def log_message(self, format, *args):
+            pass
+
+    return CaptionHandler
+
+
+def build_backends(backend, num_workers):
+    backend_cls = BACKENDS[backend]
+    if backend == "stub":
+        return [backend_cls() for _ in range(num_workers)]
+    import torch
+
+    # one model replica per worker, spread over the visible GPUs
+    num_gpus = torch.cuda.device_count()
+    return [
+        backend_cls(device=f"cuda:{i % num_gpus}" if num_gpus else "cpu")
+        for i in range(num_workers)
+    ]
+
+
+def main(args):
+    backends = build_backends(args.backend, args.num_workers)
+    batcher = BatchingQueue(backends, args.max_batch_size, args.max_wait_ms)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, args.backend))
+    print(f"Caption service ({args.backend} x{args.num_workers}) listening on {args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--backend", type=str, choices=list(BACKENDS), default="qwen-vl")
+    parser.add_argument("--num_workers", type=int, default=1)
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument("--max_wait_ms", type=int, default=20)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,112 @@
+"""
+Caption reuse for exact-duplicate screenshots.
+
+Screenshots are keyed by a content digest (sha256 of the decoded pixels), the caption of a frame
+that was already captioned is reused. This covers repeated actions, early stops and the end-state
+pages that recur across Reflexion trials. Near-duplicates are captioned again: perceptual hashes
+can't tell apart pages that only differ in their text, which is what the captions describe.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from agent_eval.domains.unified import LazyImage, load_image
+
+
+def content_digest(image: Union[str, Image.Image, np.ndarray, LazyImage]) -> str:
+    """sha256 of the decoded RGB pixels and the size, the same for any lossless encoding of the image."""
+    if isinstance(image, str):
+        image = Image.open(image)
+    image = load_image(image)
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    image = image.convert("RGB")
+    digest = hashlib.sha256(f"{image.width}x{image.height}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class CaptionDedupeCache:
+    """
+    Map from screenshot content digest to caption. With `path` set, entries are appended to a
+    jsonl file and reloaded on start.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.captions: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.path = path
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "digest" not in entry:
+                        # keyed by a perceptual hash only, may be the caption of another page
+                        continue
+                    self.captions[entry["digest"]] = entry["caption"]
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            caption = self.captions.get(digest)
+            if caption is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return caption
+
+    def put(self, digest: str, caption: str) -> None:
+        with self._lock:
+            self.captions[digest] = caption
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"digest": digest, "caption": caption}) + "\n")
+
+
+class DedupeCaptioner:
+    """
+    Captions a list of screenshots with `CaptionClient`s, reusing cached captions for
+    duplicate frames and sending the remaining ones to the servers concurrently.
+    """
+
+    def __init__(self, clients, cache: Optional[CaptionDedupeCache] = None):
+        assert clients, "at least one caption client is required"
+        self.clients = clients
+        self.cache = cache if cache is not None else CaptionDedupeCache()
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(clients))
+        self._next_client = cycle(clients)
+
+    def caption_many(self, images: List[Union[str, Image.Image, np.ndarray, LazyImage]]) -> List[str]:
+        digests = [content_digest(image) for image in images]
+        captions: List[Optional[str]] = [self.cache.get(digest) for digest in digests]
+
+        # frames that are duplicates of each other within the request are captioned once
+        todo = {}
+        leaders = {}
+        for idx, (digest, caption) in enumerate(zip(digests, captions)):
+            if caption is not None:
+                continue
+            leader = leaders.setdefault(digest, idx)
+            todo.setdefault(leader, []).append(idx)
+
+        futures = {
+            leader: self._executor.submit(next(self._next_client).one_step_caption, images[leader])
+            for leader in todo
+        }
+        for leader, future in futures.items():
+            caption = future.result()
+            self.cache.put(digests[leader], caption)
+            for idx in todo[leader]:
+                captions[idx] = caption
+        return captions
@@ -19,9 +19,9 @@ trap cleanup SIGINT
 export gpu="python3 /shared/cathychen/gpu_scheduler/reserve.py"
 
 
-# Start captioner_server.py on different ports
+# Start caption_service.py on different ports
 captioner_pids=()
 for (( i=0; i<NUM_WORKERS; i++ )); do
-    $gpu "python captioner_server.py --port $((PORT_INIT+i)) --share" &
+    $gpu "python caption_service.py --port $((PORT_INIT+i))" &
     captioner_pids+=($!)
 done
\ No newline at end of file
@@ -9,57 +9,180 @@ from io import BytesIO
 import base64
 
 # from openai.types.chat.chat_completion import ChatCompletion
+import hashlib
 import os
 import requests
 import json
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
 
+from agent_eval.cache import ResponseCache
+from agent_eval.domains.unified import LazyImage, load_image
+from agent_eval.transport import APIError, RateLimitError, estimate_tokens, get_transport
 
-def query_anyscale_api(messages, model, temperature=0):
-    # Set the base URL and API key for the OpenAI API
-    try:
-        base_url = "https://api.endpoints.anyscale.com/v1"
-        api_key = ""
 
-        # Endpoint for chat completions
-        url = f"{base_url}/chat/completions"
+ANYSCALE_BASE_URL = "https://api.endpoints.anyscale.com/v1"
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+_USAGE_HOOKS = []
+
+
+def add_usage_hook(hook):
+    """
+    Call `hook(model=..., usage=..., latency=..., retries=..., cached=..., error=...)` after
+    every chat completion, `usage` is the usage block of the response (None on errors).
+    """
+    _USAGE_HOOKS.append(hook)
 
-        # Headers for the request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
 
-        # Data payload for the request
-        data = {"model": model, "messages": messages, "temperature": temperature}
+def _report_usage(**kwargs):
+    for hook in _USAGE_HOOKS:
+        hook(**kwargs)
 
-        # Make the POST request and return the response
-        response = requests.post(url, headers=headers, data=json.dumps(data)).json()
-        return response["choices"][0]["message"]["content"].lstrip(), response
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        import traceback
-        print(traceback.format_exc())
-        return f"API_ERROR: {e}", None
 
-def query_openai_api(messages, model, temperature=0, api_key=None):
+def _chat_completion(transport, messages, model, temperature=0, max_tokens=None, json_mode=False, cache: Optional[ResponseCache] = None):
+    """
+    POST a chat completion through the shared `transport`. Errors are raised as
+    `APIError` / `RateLimitError` after retries, and never cached.
+    """
+    data = {"model": model, "messages": messages, "temperature": temperature}
+    if max_tokens is not None:
+        data["max_tokens"] = max_tokens
+    if json_mode:
+        data["response_format"] = {"type": "json_object"}
+
+    # only deterministic requests are safe to serve from the cache
+    cache_key = None
+    if cache is not None and temperature == 0:
+        cache_key = cache.make_key(
+            model, messages, temperature=temperature, max_tokens=max_tokens, json_mode=json_mode
+        )
+        response = cache.get(cache_key)
+        if response is not None:
+            _report_usage(
+                model=model, usage=response.get("usage"), latency=0.0, retries=0, cached=True, error=None
+            )
+            return response["choices"][0]["message"]["content"].lstrip(), response
+
+    stats = {"retries": 0}
+    start_t = time.perf_counter()
     try:
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-        data = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": 4096}
-
-        # Make the POST request and return the response
-        response = requests.post(url, headers=headers, data=json.dumps(data)).json()
-        # return response
-        from pprint import pprint
-        return response["choices"][0]["message"]["content"].lstrip(), response
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return f"API_ERROR: {e}", None
-    
+        response = transport.post_json(
+            "/chat/completions", data, num_tokens=estimate_tokens(messages, max_tokens), stats=stats
+        )
+        response_str = response["choices"][0]["message"]["content"].lstrip()
+    except (APIError, KeyError, IndexError, TypeError) as e:
+        _report_usage(
+            model=model, usage=None, latency=time.perf_counter() - start_t,
+            retries=stats["retries"], cached=False, error=repr(e),
+        )
+        if isinstance(e, APIError):
+            raise
+        raise APIError(f"Malformed response from {model}: {response}", body=response) from e
+    _report_usage(
+        model=model, usage=response.get("usage"), latency=time.perf_counter() - start_t,
+        retries=stats["retries"], cached=False, error=None,
+    )
+    if cache_key is not None:
+        cache.put(cache_key, response)
+    return response_str, response
+
+
+def query_anyscale_api(messages, model, temperature=0, api_key="", cache: Optional[ResponseCache] = None):
+    transport = get_transport(ANYSCALE_BASE_URL, api_key)
+    return _chat_completion(transport, messages, model, temperature, cache=cache)
+
+
+def query_openai_api(messages, model, temperature=0, api_key=None, max_tokens=4096, json_mode=False, cache: Optional[ResponseCache] = None):
+    transport = get_transport(OPENAI_BASE_URL, api_key)
+    return _chat_completion(
+        transport, messages, model, temperature, max_tokens=max_tokens, json_mode=json_mode, cache=cache
+    )
+
+# size limits documented for gpt-4-vision, larger images are downscaled server side anyway
+IMAGE_LIMITS = {"low": (512, 512), "high": (768, 2000)}
+
+
+class ImagePayloadCache:
+    """
+    LRU of base64 data urls keyed by image identity and encoding parameters, bounded by the
+    total size of the stored payloads. Screenshots handed out as `LazyImage` are keyed by
+    their location, in-memory images by a hash of their pixels.
+    """
+
+    def __init__(self, max_size_bytes=256 * 1024**2):
+        self.max_size_bytes = max_size_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, payload):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = payload
+            self._size += len(payload)
+            while self._size > self.max_size_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+IMAGE_PAYLOAD_CACHE = ImagePayloadCache()
+
+
+def _image_identity(image):
+    if isinstance(image, LazyImage):
+        return ("lazy", image.path, image.span)
+    if isinstance(image, np.ndarray):
+        image = np.ascontiguousarray(image)
+        return ("array", image.shape, str(image.dtype), hashlib.sha1(image.data).hexdigest())
+    return ("pil", image.mode, image.size, hashlib.sha1(image.tobytes()).hexdigest())
+
+
+def _fit_to_limits(image: Image.Image, detail) -> Image.Image:
+    short_limit, long_limit = IMAGE_LIMITS["low" if detail == "low" else "high"]
+    scale = min(
+        1.0, short_limit / min(image.size), long_limit / max(image.size)
+    )
+    if scale < 1.0:
+        image = image.resize(
+            (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+            Image.LANCZOS,
+        )
+    return image
+
+
+def encode_image(image, detail="high", quality=75) -> str:
+    """
+    Encode an image (PIL, numpy array or `LazyImage`) as a JPEG data url, resized to the
+    limits of `detail`. Results are memoized in `IMAGE_PAYLOAD_CACHE`.
+    """
+    key = (_image_identity(image), "JPEG", quality, detail)
+    payload = IMAGE_PAYLOAD_CACHE.get(key)
+    if payload is not None:
+        return payload
+
+    image = load_image(image)
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    image = _fit_to_limits(image.convert("RGB"), detail)
+    jpeg_buffer = BytesIO()
+    image.save(jpeg_buffer, format="JPEG", quality=quality)
+    jpg_base64_str = base64.b64encode(jpeg_buffer.getvalue()).decode("utf-8")
+    payload = f"data:image/jpeg;base64,{jpg_base64_str}"
+    IMAGE_PAYLOAD_CACHE.put(key, payload)
+    return payload
+
+
 #     curl https://api.openai.com/v1/chat/completions \
 #   -H "Content-Type: application/json" \
 #   -H "Authorization: Bearer $OPENAI_API_KEY" \
@@ -88,8 +211,9 @@ def query_openai_api(messages, model, temperature=0, api_key=None):
 
 
 class LM_Client:
-    def __init__(self, api_key, model_name="local"):
+    def __init__(self, api_key, model_name="local", cache: Optional[ResponseCache] = None, rpm=None, tpm=None):
         # self.client = OpenAI(api_key=api_key)
+        self.cache = cache
         if model_name == "local":
             # TODO: The 'openai.api_base' option isn't read in the client API. You will need to pass it when you instantiate the client, e.g. 'OpenAI(api_base="http://localhost:8082/v1")'
             # openai.api_base = "http://localhost:8082/v1"
@@ -115,6 +239,15 @@ class LM_Client:
             # )
         else:
             raise ValueError(f"Invalid model name: {model_name}")
+        # clients of the same endpoint share one connection pool and rate limiter
+        if "mistral" in self.model:
+            self.transport = get_transport(ANYSCALE_BASE_URL, api_key, rpm=rpm, tpm=tpm)
+        else:
+            self.transport = get_transport(
+                OPENAI_BASE_URL, openai.api_key, rpm=rpm, tpm=tpm
+            )
+            if openai.organization:
+                self.transport.session.headers["OpenAI-Organization"] = openai.organization
 
     def chat(self, messages, json_mode=False) -> Tuple[str, ChatCompletion]:
         """
@@ -127,17 +260,11 @@ class LM_Client:
         ])
         """
         if "mistral" in self.model:
-            model = "mistralai/Mixtral-8x7B-Instruct-v0.1"
-            response_str, chat_completion = query_anyscale_api(messages, self.model)
-        else:
-            chat_completion = openai.ChatCompletion.create(
-                model=self.model,
-                messages=messages,
-                response_format={"type": "json_object"} if json_mode else None,
-                temperature=0,
-            )
-            response_str = chat_completion["choices"][0]["message"]["content"]
-        return response_str, chat_completion
+            # anyscale endpoints do not support response_format
+            json_mode = False
+        return _chat_completion(
+            self.transport, messages, self.model, json_mode=json_mode, cache=self.cache
+        )
 
     def one_step_chat(
         self, text, system_msg: Optional[str] = None, json_mode=False
@@ -152,6 +279,7 @@ class LM_Client:
 class VLM_Client:
     def __init__(self, port=8083) -> None:
         self.url = f"http://localhost:{port}"
+        self.transport = get_transport(self.url)
 
     def chat(self, data: List[Dict[str, Union[str, None]]]) -> str:
         """
@@ -166,50 +294,65 @@ class VLM_Client:
         :param data: List of dictionaries with keys "image" and/or "text"
         :return: Model's response as a string
         """
-        response = requests.post(f"{self.url}/get_response/", json=data)
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            return response.json()["response"]
-        else:
-            raise Exception(
-                f"Error with status code {response.status_code}: {response.text}"
-            )
+        return self.transport.post_json("/get_response/", data)["response"]
 
     def one_step_chat(self, img, text) -> str:
         data = [[{"image": img}, {"text": text}]]
         return self.chat(data)
 
 
+class CaptionClient:
+    """Client of `captioner/caption_service.py`, images are sent as their encoded file bytes."""
+
+    def __init__(self, url="http://localhost:3070", timeout=600):
+        self.url = url
+        self.transport = get_transport(url, timeout=timeout)
+
+    @staticmethod
+    def _image_bytes(image) -> bytes:
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                return f.read()
+        if isinstance(image, LazyImage) and image.span is None:
+            with open(image.path, "rb") as f:
+                return f.read()
+        image = load_image(image)
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def caption(self, images: List[Union[str, Image.Image, np.ndarray, LazyImage]]) -> List[str]:
+        data = {
+            "images": [
+                base64.b64encode(self._image_bytes(image)).decode("utf-8") for image in images
+            ]
+        }
+        return self.transport.post_json("/caption", data)["captions"]
+
+    def one_step_caption(self, image) -> str:
+        return self.caption([image])[0]
+
+
 class GPT4V_Client:
-    def __init__(self, api_key, model_name="gpt-4-vision-preview", max_tokens=512):
+    def __init__(self, api_key, model_name="gpt-4-vision-preview", max_tokens=512, cache: Optional[ResponseCache] = None, rpm=None, tpm=None):
         self.api_key = api_key
         # self.client = OpenAI(api_key=api_key)
         self.model_name = model_name
         self.max_tokens = max_tokens
+        self.cache = cache
+        self.transport = get_transport(OPENAI_BASE_URL, api_key, rpm=rpm, tpm=tpm)
 
     def chat(self, messages, json_mode=False) -> Tuple[str, ChatCompletion]:
-        return query_openai_api(messages, self.model_name, api_key=self.api_key)
+        return _chat_completion(
+            self.transport, messages, self.model_name, max_tokens=4096, cache=self.cache
+        )
 
     def one_step_chat(
-        self, text, image: Union[Image.Image, np.ndarray], system_msg: Optional[str] = None, json_mode=False
+        self, text, image: Union[Image.Image, np.ndarray, LazyImage], system_msg: Optional[str] = None, json_mode=False
     ) -> Tuple[str, ChatCompletion]:
-        jpeg_buffer = BytesIO()
-
-        # Save the image as JPEG to the buffer
-        if isinstance(image, np.ndarray):
-            image = Image.fromarray(image)
-        image = image.convert("RGB")
-        image.save(jpeg_buffer, format="JPEG")
-
-        # Get the byte data from the buffer
-        jpeg_data = jpeg_buffer.getvalue()
-
-        # Encode the JPEG image data in base64
-        jpg_base64 = base64.b64encode(jpeg_data)
-
-        # If you need it in string format
-        jpg_base64_str = jpg_base64.decode("utf-8")
+        img_str = encode_image(image, detail="high")
         messages = []
         if system_msg is not None:
             messages.append({"role": "system", "content": system_msg})
@@ -220,9 +363,7 @@ class GPT4V_Client:
                     {"type": "text", "text": text},
                     {
                         "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{jpg_base64_str}"
-                        },
+                        "image_url": {"url": img_str},
                     },
                 ],
             }
@@ -230,7 +371,7 @@ class GPT4V_Client:
         return self.chat(messages, json_mode=json_mode)
 
     def one_step_multi_image_chat(
-        self, text, images: list[Union[Image.Image, np.ndarray]], system_msg: Optional[str] = None, json_mode=False
+        self, text, images: list[Union[Image.Image, np.ndarray, LazyImage]], system_msg: Optional[str] = None, json_mode=False
     ) -> Tuple[str, ChatCompletion]:
         """
         images: [{"image": PIL.image, "detail": "high" or "low }]
@@ -238,26 +379,7 @@ class GPT4V_Client:
         For low res mode, we expect a 512px x 512px image. For high res mode, the short side of the image should be less than 768px and the long side should be less than 2,000px.
         """
         details = [i["detail"] for i in images]
-        img_strs = []
-        for img_info in images:
-            image = img_info["image"]
-            jpeg_buffer = BytesIO()
-
-            # Save the image as JPEG to the buffer
-            if isinstance(image, np.ndarray):
-                image = Image.fromarray(image)
-            image = image.convert("RGB")
-            image.save(jpeg_buffer, format="JPEG")
-
-            # Get the byte data from the buffer
-            jpeg_data = jpeg_buffer.getvalue()
-
-            # Encode the JPEG image data in base64
-            jpg_base64 = base64.b64encode(jpeg_data)
-
-            # If you need it in string format
-            jpg_base64_str = jpg_base64.decode("utf-8")
-            img_strs.append(f"data:image/jpeg;base64,{jpg_base64_str}")
+        img_strs = [encode_image(i["image"], detail=i["detail"]) for i in images]
         messages = []
         if system_msg is not None:
             messages.append({"role": "system", "content": system_msg})
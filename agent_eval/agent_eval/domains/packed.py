@@ -0,0 +1,119 @@
+"""
+Packed, indexed container for unified trajectory datasets.
+
+Layout of `trajectories.pack`:
+
+    MAGIC
+    for each trajectory: JSON record, then the encoded image file of every step (PNG/JPEG bytes as-is)
+    JSON index   {"uids": [...], "entries": {uid: {"record": [offset, length], "images": [[offset, length], ...]}}}
+    index offset (8 bytes, little endian) + MAGIC
+
+A record is the `trajectory_log.json` entry plus `"captions": {captioner_name: [caption per step]}`.
+Opening a pack only reads the footer, trajectories and images are read with random access via mmap.
+
+Convert an existing dataset with
+    python -m agent_eval.domains.packed /path/to/dataset/
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, List, Optional
+
+from tqdm import tqdm
+
+MAGIC = b"AEPACK01"
+PACK_NAME = "trajectories.pack"
+_FOOTER = struct.Struct("<Q")
+
+
+def image_key(file_name: str) -> str:
+    """Caption key of a step image, its file name without the extension"""
+    return os.path.splitext(file_name)[0]
+
+
+class PackedTrajectoryStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_size = _FOOTER.size + len(MAGIC)
+        if self._mm[: len(MAGIC)] != MAGIC or self._mm[-len(MAGIC) :] != MAGIC:
+            raise ValueError(f"{path} is not a trajectory pack")
+        (index_offset,) = _FOOTER.unpack(self._mm[-footer_size : -len(MAGIC)])
+        index = json.loads(self._mm[index_offset : len(self._mm) - footer_size])
+        self.uids: List[str] = index["uids"]
+        self.entries: Dict[str, Any] = index["entries"]
+
+    def __len__(self):
+        return len(self.uids)
+
+    def record(self, uid: str) -> Dict[str, Any]:
+        offset, length = self.entries[uid]["record"]
+        return json.loads(self._mm[offset : offset + length])
+
+    def image_span(self, uid: str, step_idx: int):
+        """(offset, length) of the step image, None if it was missing when packing"""
+        span = self.entries[uid]["images"][step_idx]
+        return tuple(span) if span is not None else None
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self._mm[offset : offset + length]
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+def pack_dataset(dataset_path: str, output_path: Optional[str] = None) -> str:
+    """Pack `trajectory_log.json`, `images/` and every `captions/*.json` of a unified dataset."""
+    assert dataset_path[-1] == "/", "dataset_path must end with a /"
+    output_path = output_path or dataset_path + PACK_NAME
+    data_log = json.load(open(dataset_path + "trajectory_log.json", "r"))
+
+    captions = {}
+    caption_dir = dataset_path + "captions/"
+    if os.path.isdir(caption_dir):
+        for name in sorted(os.listdir(caption_dir)):
+            if name.endswith(".json"):
+                captions[name[: -len(".json")]] = json.load(open(caption_dir + name, "r"))
+
+    entries = {}
+    uids = []
+    with open(output_path + ".partial", "wb") as f:
+        f.write(MAGIC)
+        for dp in tqdm(data_log):
+            record = dict(dp)
+            record["captions"] = {
+                captioner: [caps.get(image_key(step["img"])) for step in dp["steps"]]
+                for captioner, caps in captions.items()
+            }
+            data = json.dumps(record).encode("utf-8")
+            entry = {"record": [f.tell(), len(data)], "images": []}
+            f.write(data)
+            for step in dp["steps"]:
+                img_path = dataset_path + f"images/{step['img']}"
+                if not os.path.exists(img_path):
+                    entry["images"].append(None)
+                    continue
+                with open(img_path, "rb") as img_f:
+                    img_data = img_f.read()
+                entry["images"].append([f.tell(), len(img_data)])
+                f.write(img_data)
+            entries[dp["uid"]] = entry
+            uids.append(dp["uid"])
+        index_offset = f.tell()
+        f.write(json.dumps({"uids": uids, "entries": entries}).encode("utf-8"))
+        f.write(_FOOTER.pack(index_offset))
+        f.write(MAGIC)
+    os.replace(output_path + ".partial", output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset_path", type=str)
+    parser.add_argument("--output_path", type=str, default=None)
+    args = parser.parse_args()
+    print(f"Packed to {pack_dataset(args.dataset_path, args.output_path)}")
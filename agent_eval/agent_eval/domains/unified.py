@@ -1,12 +1,67 @@
 from PIL import Image
 import os
 import json
-from typing import List, Dict, Any, Tuple
+from functools import lru_cache
+from io import BytesIO
+from typing import List, Dict, Any, Optional, Tuple
 from collections import defaultdict
 from termcolor import cprint
 import re
 import numpy as np
 
+from agent_eval.domains.packed import PACK_NAME, PackedTrajectoryStore, image_key
+
+
+@lru_cache(maxsize=None)
+def _open_pack(path: str) -> PackedTrajectoryStore:
+    return PackedTrajectoryStore(path)
+
+
+@lru_cache(maxsize=16)
+def _decode_image(path: str, span: Optional[Tuple[int, int]] = None) -> Image.Image:
+    if span is None:
+        img = Image.open(path)
+    else:
+        img = Image.open(BytesIO(_open_pack(path).read(*span)))
+    img.load()
+    return img
+
+
+class LazyImage:
+    """
+    Handle to a screenshot on disk, either an image file or a (offset, length) span of a
+    trajectory pack. Only the location is stored (and pickled); the image is decoded on
+    `load()` and the most recently used frames are kept in a small per-process LRU.
+    """
+
+    __slots__ = ("path", "span")
+
+    def __init__(self, path: str, span: Optional[Tuple[int, int]] = None) -> None:
+        self.path = path
+        self.span = span
+
+    def load(self) -> Image.Image:
+        return _decode_image(self.path, self.span)
+
+    def __getstate__(self):
+        return self.path, self.span
+
+    def __setstate__(self, state):
+        self.path, self.span = state
+
+    def __repr__(self) -> str:
+        if self.span is None:
+            return f"LazyImage({self.path!r})"
+        return f"LazyImage({self.path!r}, span={self.span})"
+
+
+def load_image(image):
+    """Return a decoded image for a `LazyImage`, pass anything else through."""
+    if isinstance(image, LazyImage):
+        return image.load()
+    return image
+
+
 class UniTrajectoryDataset:
     def __init__(
         self,
@@ -14,17 +69,32 @@ class UniTrajectoryDataset:
         eval_log_names: List[str],
         captioner_name: str = "ocr-sft-qwenvl-v1",
         load_image=True,
+        last_k_images: Optional[int] = None,
     ) -> None:
+        """
+        load_image: return `LazyImage` handles for the step screenshots (decoded on first use).
+        last_k_images: only hand out handles for the last k steps, earlier entries are None.
+        """
         assert dataset_path[-1] == "/", "dataset_path must end with a /"
         self.dataset_path = dataset_path
-        self.data_log = json.load(open(dataset_path + "trajectory_log.json", "r"))
+        self.captioner_name = captioner_name
         cprint(f"Using dataset: {dataset_path}", "green")
-        if os.path.exists(dataset_path + "captions/" + captioner_name + ".json"):
-            self.captions = json.load(
-                open(dataset_path + "captions/" + captioner_name + ".json", "r")
-            )
-        else:
+        if os.path.exists(dataset_path + PACK_NAME):
+            # packed datasets only read the index here, records are fetched by uid
+            self.store = _open_pack(dataset_path + PACK_NAME)
+            self.data_log = None
             self.captions = None
+            uids = self.store.uids
+        else:
+            self.store = None
+            self.data_log = json.load(open(dataset_path + "trajectory_log.json", "r"))
+            if os.path.exists(dataset_path + "captions/" + captioner_name + ".json"):
+                self.captions = json.load(
+                    open(dataset_path + "captions/" + captioner_name + ".json", "r")
+                )
+            else:
+                self.captions = None
+            uids = [dp["uid"] for dp in self.data_log]
         cprint(f"Using eval logs from: {eval_log_names}", "green")
         self.evals = defaultdict(lambda: defaultdict())
         for eval_log_name in eval_log_names:
@@ -34,9 +104,10 @@ class UniTrajectoryDataset:
                     ann = json.loads(line)
                     if ann["task_uid"] != "" and ann["task_idx"] != -1:
                         self.evals[ann["task_uid"]][ann["user_uid"]] = ann
-        self.uid_to_idx_map = {dp["uid"]: idx for idx, dp in enumerate(self.data_log)}
-        self.idx_to_uid_map = {idx: dp["uid"] for idx, dp in enumerate(self.data_log)}
+        self.uid_to_idx_map = {uid: idx for idx, uid in enumerate(uids)}
+        self.idx_to_uid_map = {idx: uid for idx, uid in enumerate(uids)}
         self.load_image = load_image
+        self.last_k_images = last_k_images
 
     def uid_to_idx(self, uid):
         return self.uid_to_idx_map[uid]
@@ -48,27 +119,45 @@ class UniTrajectoryDataset:
         return [self.uid_to_idx(uid) for uid in self.evals.keys()]
 
     def __len__(self):
-        return len(self.data_log)
+        return len(self.uid_to_idx_map)
+
+    def _image(self, dp, step_idx, path):
+        if self.store is not None:
+            span = self.store.image_span(dp["uid"], step_idx)
+            if span is not None:
+                return LazyImage(self.store.path, span)
+        return LazyImage(path)
 
     def __getitem__(self, idx):
-        dp = self.data_log[idx]
+        if self.store is not None:
+            dp = self.store.record(self.idx_to_uid(idx))
+            captions = dp["captions"].get(self.captioner_name)
+        else:
+            dp = self.data_log[idx]
+            captions = (
+                [self.captions[image_key(step["img"])] for step in dp["steps"]]
+                if self.captions
+                else None
+            )
+        image_paths = [
+            self.dataset_path + f"images/{step['img']}" for step in dp["steps"]
+        ]
         imgs = None
         if self.load_image:
-            imgs = []
-            for step in dp["steps"]:
-                img = Image.open(self.dataset_path + f"images/{step['img']}")
-                img.load()
-                imgs.append(img)
+            # keep one entry per step so images stay aligned with captions and actions
+            first = 0
+            if self.last_k_images is not None:
+                first = max(0, len(image_paths) - self.last_k_images)
+            imgs = [
+                self._image(dp, i, path) if i >= first else None
+                for i, path in enumerate(image_paths)
+            ]
         info = {
             "intent": dp["intent"],
             "images": imgs,
-            "image_paths": [
-                self.dataset_path + f"images/{step['img']}" for step in dp["steps"]
-            ],
+            "image_paths": image_paths,
             "response": dp["response"],
-            "captions": [self.captions[f"{step['img'][:-4]}"] for step in dp["steps"]]
-            if self.captions
-            else None,
+            "captions": captions,
             "traj_name": dp["uid"],
             "eval": self.evals[dp["uid"]] if dp["uid"] in self.evals else None,
             "actions": self._get_actions(dp),
@@ -1,6 +1,11 @@
 # %%
 import agent_eval
-from agent_eval.domains.webarena import extract_trajectory_info, extract_eval_results
+from agent_eval.domains.webarena import (
+    extract_trajectory_info,
+    extract_eval_results,
+    load_run_records,
+    records_to_trajectory_log,
+)
 import json
 import os
 
@@ -25,10 +30,18 @@ os.makedirs(os.path.join(output_dataset_path, "captions"))
 
 # %% [markdown]
 # ### Record WebArena's Eval Results
+# Tasks run by run.py / run_concurrent.py / run_reflexion.py have a record in records/ with the eval results inline,
+# the other tasks (e.g. of older runs) only have the logs and render files.
+# The ground truth is the oracle score, the status of a reflexion record may come from the model-based evaluator
 
 # %%
-log_str = open(os.path.join(raw_dataset_path, "merged_log.txt")).read()
-eval_results = extract_eval_results(log_str)
+run_records = load_run_records(raw_dataset_path)
+recorded_uids = {str(r["uid"]) for r in run_records}
+eval_results = {str(r["uid"]): r["oracle_score"] == 1 for r in run_records}
+if os.path.exists(os.path.join(raw_dataset_path, "merged_log.txt")):
+    log_str = open(os.path.join(raw_dataset_path, "merged_log.txt")).read()
+    for uid, eval_result in extract_eval_results(log_str).items():
+        eval_results.setdefault(uid, eval_result)
 formated_eval_results = []
 for uid, eval_result in eval_results.items():
     formated_eval_results.append(
@@ -52,34 +65,28 @@ with open(os.path.join(output_dataset_path, "evals", "gt.jsonl"), "w") as file:
 # ### Get the Trajectory Log and Images
 
 # %%
-all_files = os.listdir(raw_dataset_path)
-trajs = [f for f in all_files if f.endswith(".html")]
-
-# %%
-html_content_str = open(os.path.join(raw_dataset_path, trajs[0])).read()
-
-# %%
-extract_trajectory_info(html_content_str)
-
-# %%
-trajs[0]
-
-# %%
-html_content_str = open(os.path.join(raw_dataset_path, "render_40.html")).read()
-info = extract_trajectory_info(html_content_str)
+# the records are already in the unified schema, only the screenshots are copied
+traj_log = records_to_trajectory_log(
+    run_records, raw_dataset_path, os.path.join(output_dataset_path, "images")
+)
 
 # %%
-info
+# the render files of the tasks without a record are parsed
+all_files = os.listdir(raw_dataset_path)
+trajs = [
+    f
+    for f in all_files
+    if f.endswith(".html") and f.replace(".html", "").replace("render_", "") not in recorded_uids
+]
 
 # %%
 from tqdm import tqdm
 import re
 
-traj_log = []
 for traj_name in tqdm(trajs):
     html_content_str = open(os.path.join(raw_dataset_path, traj_name)).read()
     traj_id = traj_name.replace(".html", "").replace("render_", "")
-    info = extract_trajectory_info(html_content_str)
+    info = extract_trajectory_info(html_content_str, raw_dataset_path)
     # save the image
     images = info["images"]
 
@@ -6,6 +6,8 @@ import os
 import json
 import re
 import random
+import glob
+import shutil
 
 def extract_eval_results(merged_log: str):
     """Extract the evaluation results from the merged log file."""
@@ -35,8 +37,9 @@ def extract_intent_from_text(html_content: str):
 
     return ""
 
-def extract_trajectory_info(html_content: str):
-    """Extract intent and Base64 encoded images from HTML content."""
+def extract_trajectory_info(html_content: str, base_dir: str = "."):
+    """Extract intent and images from HTML content.
+    Images are either inlined as Base64 or paths relative to `base_dir`, the folder of the render file."""
     # Parse the HTML content
     parsed_action_search = re.search(r"<div class='parsed_action'.*?><pre>stop \[(.*?)\]</pre></div>", html_content, re.DOTALL)
 
@@ -50,14 +53,16 @@ def extract_trajectory_info(html_content: str):
     # Find all image tags with src attributes
     image_tags = soup.find_all("img", src=True)
     
-    # Extract Base64 encoded images and convert to PIL Image objects
+    # Extract the images and convert to PIL Image objects
     images = []
     for img in image_tags:
         if img["src"].startswith("data:image/"):
             img_data = img["src"].split(",")[1]
             byte_data = base64.b64decode(img_data)
             image = Image.open(BytesIO(byte_data))
-            images.append(image)
+        else:
+            image = Image.open(os.path.join(base_dir, img["src"]))
+        images.append(image)
 
     # Extract parsed actions
     actions = re.findall(r"<div class='parsed_action'.*?<pre>(.*?)</pre>", html_content, re.DOTALL)
@@ -65,6 +70,56 @@ def extract_trajectory_info(html_content: str):
     return {"intent": intent, "images": images, "response": response, "actions": actions}
 
 
+def load_run_records(result_dir: str):
+    """Load the trajectory records of run.py / run_reflexion.py, records/{task_id}_{trail_idx}.json.
+    Only the last trial of a task is kept, returns an empty list for runs without records."""
+    last_trials = {}
+    for path in glob.glob(os.path.join(result_dir, "records", "*.json")):
+        with open(path, "r") as f:
+            r = json.load(f)
+        uid = str(r["uid"])
+        if uid not in last_trials or r["trail_idx"] > last_trials[uid]["trail_idx"]:
+            last_trials[uid] = r
+    return sorted(last_trials.values(), key=lambda r: int(r["uid"]))
+
+
+def record_image_dir(record, result_dir: str):
+    """Directory of the screenshots of a record, records without "image_dir" are from before it was stored:
+    run_reflexion.py saved them to images/, run.py to render_images/"""
+    if "image_dir" in record:
+        return os.path.join(result_dir, record["image_dir"])
+    if os.path.isdir(os.path.join(result_dir, "images")):
+        return os.path.join(result_dir, "images")
+    return os.path.join(result_dir, "render_images")
+
+
+def records_to_trajectory_log(records, result_dir: str, image_dir: str):
+    """Convert the run records to trajectory_log.json entries, copying the screenshots to `image_dir`.
+    Records with a step without screenshot are skipped."""
+    traj_log = []
+    for r in records:
+        if any(step["img"] is None for step in r["steps"]):
+            print(f"{r['uid']} has steps without screenshot | skip")
+            continue
+        # run_reflexion.py stores the path of the screenshot, run.py its name
+        img_names = [os.path.basename(step["img"]) for step in r["steps"]]
+        for img_name in img_names:
+            shutil.copy(os.path.join(record_image_dir(r, result_dir), img_name), image_dir)
+        traj_log.append(
+            {
+                "uid": str(r["uid"]),
+                "intent": r["intent"],
+                "response": r["response"],
+                "other": r["other"],
+                "steps": [
+                    {"img": img_name, "other": step["other"]}
+                    for img_name, step in zip(img_names, r["steps"])
+                ],
+            }
+        )
+    return traj_log
+
+
 class WebArenaData:
     def __init__(self, trajectory_root_path: str, caption_data_path: str, eval_dps_path: str, gt_results_path: str, configs_path: str = None) -> None:
         self.trajectory_root_path = trajectory_root_path
@@ -81,7 +136,7 @@ class WebArenaData:
         html_file = f"{self.trajectory_root_path}/render_{idx}.html"
         with open(html_file, 'r') as f:
             html_content = f.read()
-        info = extract_trajectory_info(html_content)
+        info = extract_trajectory_info(html_content, self.trajectory_root_path)
         info['captions'] = self.captions[f'render_{idx}.html']
         assert len(info['captions']) == len(info['images'])
         info['traj_name'] = f'render_{idx}.html'
@@ -4,7 +4,7 @@ import math
 import io
 from PIL import Image
 from numpy import asarray
-from agent_eval.domains.unified import UniTrajectoryDataset
+from agent_eval.domains.unified import UniTrajectoryDataset, load_image
 import time
 import json
 from collections import defaultdict
@@ -33,7 +33,7 @@ def main(dataset_abs_path, log_name):
         # Determine the size of the grid
         num_images = len(image_list)
         num_rows = math.ceil(num_images / max_columns)
-        image_list = [downsample_img(img, down_scale) for img in image_list]
+        image_list = [downsample_img(load_image(img), down_scale) for img in image_list]
 
         # Determine the size of the composite image
         max_width = max(img.width for img in image_list)
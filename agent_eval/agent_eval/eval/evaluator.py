@@ -1,6 +1,10 @@
+import asyncio
 import json
 import os
-from typing import Any, List, Tuple
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Iterable, List, Tuple
 
 from termcolor import cprint
 
@@ -8,9 +12,22 @@ from agent_eval.eval.prompts import *
 
 
 class Evaluator:
+    # number of trailing screenshots each eval version looks at, versions not listed use none
+    FRAMES_NEEDED = {
+        "final-v3-gpt4v": 1,
+        "android-gpt4v": 1,
+        "naive-last-frame-4v": 1,
+    }
+
+    @classmethod
+    def frames_needed(cls, version):
+        return cls.FRAMES_NEEDED.get(version, 0)
+
     def __init__(self, lm_clients, log_save_path=None):
         self.lm_clients = lm_clients
         self.log_save_path = log_save_path
+        # outputs.jsons is shared by all trajectories, guard it when evaluating concurrently
+        self._log_lock = threading.Lock()
 
     def __call__(self, info, client="gpt-3.5", version="naive"):
         assert (
@@ -30,7 +47,7 @@ class Evaluator:
             raise NotImplementedError(f"Version {version} not implemented")
 
         if self.log_save_path:
-            with open(self.log_save_path + "/outputs.jsons", "a") as f:
+            with self._log_lock, open(self.log_save_path + "/outputs.jsons", "a") as f:
                 f.write(
                     json.dumps(
                         {
@@ -63,6 +80,56 @@ class Evaluator:
                     md_file.write(f"```md\n{prompt}\n```\n")
         return eval_info, prompt
 
+    async def aevaluate_many(
+        self,
+        infos: Iterable[dict],
+        client="gpt-3.5",
+        version="naive",
+        concurrency=8,
+    ) -> AsyncIterator[Tuple[dict, Any, Any]]:
+        """
+        Evaluate many trajectories concurrently, yielding `(info, eval_info, prompt)` as each one finishes.
+
+        This is thread-based, not natively async: every trajectory runs the blocking `__call__` in a
+        pool of `concurrency` threads, the event loop only awaits their futures.
+
+        All trajectories share this evaluator's clients (and therefore their connection pools).
+        `infos` is consumed lazily, so at most `concurrency` trajectories are held in memory at once.
+        Failed trajectories are reported and yielded as `(info, None, None)`.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        info_iter = iter(infos)
+        pending = {}
+
+        def submit_next():
+            info = next(info_iter, None)
+            if info is None:
+                return
+            future = loop.run_in_executor(executor, self, info, client, version)
+            pending[future] = info
+
+        try:
+            for _ in range(concurrency):
+                submit_next()
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending.keys(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    info = pending.pop(future)
+                    submit_next()
+                    try:
+                        eval_info, prompt = future.result()
+                    except Exception as e:
+                        cprint(f"Error on {info['traj_name']}, {e}", "red")
+                        print(traceback.format_exc())
+                        yield info, None, None
+                    else:
+                        yield info, eval_info, prompt
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def naive_last_frame_eval_4v(self, info, client):
         assert client == "gpt-4v"
         prompt, sys_msg = build_naive_last_frame_4v_eval_prompt(
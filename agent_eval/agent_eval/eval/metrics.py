@@ -1,6 +1,15 @@
-import os
+"""
+Reward model metrics. Labels and predictions are boolean arrays, predictions of several
+evaluator configurations (runs) can be stacked along the first axis and are scored at once.
+
+    python -m agent_eval.eval.metrics outputs/run-a/rm_results.json outputs/run-b/rm_results.json
+"""
+import argparse
+import itertools
 import json
-import pandas as pd
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
 
 
 LABEL_CORRECTION = {
@@ -20,70 +29,160 @@ LABEL_CORRECTION = {
     "793": False,
 }
 
-def calculate_performance(dataframe):
-    # Initialize the counts
-    TP = FP = TN = FN = 0
-    # Iterate through each column (each category)
-    for column in dataframe.columns:
-        gt, rm = dataframe[column]
-
-        if gt and rm:
-            TP += 1
-        elif not gt and not rm:
-            TN += 1
-        elif not gt and rm:
-            FP += 1
-        elif gt and not rm:
-            FN += 1
-    return TP, FP, TN, FN
-
-
-
-def get_metrics_from_result_json(result_json_path):
-    data = pd.read_json(result_json_path)
-    # Calculate the performance metrics
-    classification_dict = {"TP": [], "TN": [], "FP": [], "FN": []}
+METRIC_NAMES = ["Accuracy", "Precision", "Recall", "F1 Score"]
+
+
+def load_result_json(result_json_path) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Read an rm_results.json into (keys, gt, rm), applying LABEL_CORRECTION."""
     with open(result_json_path, "r") as json_file:
         json_data = json.load(json_file)
-    # Classify each entry
-    for key, values in json_data.items():
-
-        gt = values["gt"]
-        if key in LABEL_CORRECTION:
-            gt = LABEL_CORRECTION[key]
-
-        if gt and values["rm"]:
-            classification_dict["TP"].append(key)
-        elif not gt and not values["rm"]:
-            classification_dict["TN"].append(key)
-        elif not gt and values["rm"]:
-            classification_dict["FP"].append(key)
-        elif gt and not values["rm"]:
-            classification_dict["FN"].append(key)
-    # TP, FP, TN, FN = calculate_performance(data)
-    TP = len(classification_dict["TP"])
-    FP = len(classification_dict["FP"])
-    TN = len(classification_dict["TN"])
-    FN = len(classification_dict["FN"])
-
-    # Calculate Accuracy, Precision, Recall, and F1 Score
-    accuracy = (TP + TN) / (TP + FP + TN + FN)
-    precision = TP / (TP + FP) if (TP + FP) > 0 else 0
-    recall = TP / (TP + FN) if (TP + FN) > 0 else 0
-    f1_score = (
-        2 * (precision * recall) / (precision + recall)
-        if (precision + recall) > 0
-        else 0
+    keys = list(json_data.keys())
+    gt = np.array(
+        [LABEL_CORRECTION.get(key, json_data[key]["gt"]) for key in keys], dtype=bool
     )
+    rm = np.array([json_data[key]["rm"] for key in keys], dtype=bool)
+    return keys, gt, rm
+
+
+def confusion_counts(gt: np.ndarray, rm: np.ndarray, weights: np.ndarray = None):
+    """
+    TP, FP, TN, FN of predictions `rm` (..., n) against labels `gt` (n,).
+    `weights` (b, n) counts every sample that many times, giving results of shape (b, ...).
+    """
+    gt = np.asarray(gt, dtype=bool)
+    rm = np.asarray(rm, dtype=bool)
+    cells = [rm & gt, rm & ~gt, ~rm & ~gt, ~rm & gt]
+    if weights is None:
+        return tuple(c.sum(axis=-1) for c in cells)
+    return tuple(weights @ c.astype(weights.dtype).T for c in cells)
+
+
+def _safe_div(a, b):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape), where=b > 0)
+
+
+def metrics_from_counts(tp, fp, tn, fn) -> Dict[str, np.ndarray]:
+    precision = _safe_div(tp, tp + fp)
+    recall = _safe_div(tp, tp + fn)
+    return {
+        "Accuracy": _safe_div(tp + tn, tp + fp + tn + fn),
+        "Precision": precision,
+        "Recall": recall,
+        "F1 Score": _safe_div(2 * precision * recall, precision + recall),
+    }
+
+
+def bootstrap_weights(n: int, n_resamples: int = 1000, seed: int = 0) -> np.ndarray:
+    """Multiplicity of each sample in `n_resamples` bootstrap resamples, shape (n_resamples, n)."""
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, n, size=(n_resamples, n))
+    # offset every resample into its own block of n bins so one bincount counts all of them
+    idx += np.arange(n_resamples)[:, None] * n
+    counts = np.bincount(idx.ravel(), minlength=n_resamples * n)
+    return counts.reshape(n_resamples, n).astype(np.float32)
+
+
+def bootstrap_ci(gt, rm, n_resamples=1000, alpha=0.05, seed=0) -> Dict[str, np.ndarray]:
+    """Percentile bootstrap intervals of every metric, each of shape rm.shape[:-1] + (2,)."""
+    weights = bootstrap_weights(len(gt), n_resamples, seed)
+    samples = metrics_from_counts(*confusion_counts(gt, rm, weights))
+    return {
+        name: np.moveaxis(
+            np.quantile(values, [alpha / 2, 1 - alpha / 2], axis=0), 0, -1
+        )
+        for name, values in samples.items()
+    }
+
+
+def paired_bootstrap(gt, rm_a, rm_b, n_resamples=1000, alpha=0.05, seed=0) -> Dict[str, Dict[str, float]]:
+    """
+    Compare two configurations on the same samples: observed difference (b - a) of every metric,
+    its bootstrap interval and a two-sided p-value for "no difference".
+    """
+    weights = bootstrap_weights(len(gt), n_resamples, seed)
+    rm = np.stack([rm_a, rm_b])
+    observed = metrics_from_counts(*confusion_counts(gt, rm))
+    samples = metrics_from_counts(*confusion_counts(gt, rm, weights))
+    out = {}
+    for name in METRIC_NAMES:
+        diff = samples[name][:, 1] - samples[name][:, 0]
+        low, high = np.quantile(diff, [alpha / 2, 1 - alpha / 2])
+        p_value = min(1.0, 2 * min((diff <= 0).mean(), (diff >= 0).mean()))
+        out[name] = {
+            "diff": float(observed[name][1] - observed[name][0]),
+            "ci": [float(low), float(high)],
+            "p_value": float(p_value),
+        }
+    return out
+
+
+def get_metrics_from_result_json(result_json_path, n_resamples=1000, alpha=0.05):
+    keys, gt, rm = load_result_json(result_json_path)
+    classification_dict = {
+        name: [key for key, hit in zip(keys, mask) if hit]
+        for name, mask in zip(["TP", "FP", "TN", "FN"], [rm & gt, rm & ~gt, ~rm & ~gt, ~rm & gt])
+    }
+    TP, FP, TN, FN = (int(c) for c in confusion_counts(gt, rm))
+    metrics = metrics_from_counts(TP, FP, TN, FN)
 
     performance_metrics = {
         "True Positives": TP,
         "False Positives": FP,
         "True Negatives": TN,
         "False Negatives": FN,
-        "Accuracy": accuracy,
-        "Precision": precision,
-        "Recall": recall,
-        "F1 Score": f1_score,
+        **{name: float(metrics[name]) for name in METRIC_NAMES},
     }
+    if n_resamples and len(keys) > 0:
+        cis = bootstrap_ci(gt, rm, n_resamples, alpha)
+        performance_metrics[f"{int(100 * (1 - alpha))}% CI"] = {
+            name: cis[name].tolist() for name in METRIC_NAMES
+        }
     return performance_metrics, classification_dict
+
+
+def compare_result_jsons(result_json_paths: Sequence[str], n_resamples=1000, alpha=0.05, seed=0):
+    """
+    Score several runs on the samples they share: metrics and intervals per run, and paired
+    bootstrap comparisons for every pair of runs.
+    """
+    loaded = [load_result_json(path) for path in result_json_paths]
+    shared = set(loaded[0][0]).intersection(*(set(keys) for keys, _, _ in loaded[1:]))
+    keys = sorted(shared)
+    gt = None
+    rms = []
+    for run_keys, run_gt, run_rm in loaded:
+        index = {key: i for i, key in enumerate(run_keys)}
+        order = np.array([index[key] for key in keys], dtype=int)
+        gt = run_gt[order] if gt is None else gt
+        rms.append(run_rm[order])
+    rm = np.stack(rms)
+
+    metrics = metrics_from_counts(*confusion_counts(gt, rm))
+    cis = bootstrap_ci(gt, rm, n_resamples, alpha, seed)
+    runs = {
+        path: {
+            **{name: float(metrics[name][i]) for name in METRIC_NAMES},
+            "ci": {name: cis[name][i].tolist() for name in METRIC_NAMES},
+        }
+        for i, path in enumerate(result_json_paths)
+    }
+    comparisons = {
+        f"{a} vs {b}": paired_bootstrap(gt, rm[i], rm[j], n_resamples, alpha, seed)
+        for (i, a), (j, b) in itertools.combinations(enumerate(result_json_paths), 2)
+    }
+    return {"num_samples": len(keys), "runs": runs, "comparisons": comparisons}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("result_jsons", type=str, nargs="+")
+    parser.add_argument("--n_resamples", type=int, default=1000)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    args = parser.parse_args()
+    print(
+        json.dumps(
+            compare_result_jsons(args.result_jsons, args.n_resamples, args.alpha), indent=2
+        )
+    )
@@ -0,0 +1,168 @@
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class APIError(Exception):
+    """Raised when an endpoint returns an error that is not worth (or no longer worth) retrying."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: Any = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+class RateLimitError(APIError):
+    """Raised when an endpoint keeps answering 429 after all retries are used up."""
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    Requests larger than the bucket capacity are let through once the bucket is full.
+    """
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one endpoint; either can be None."""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None) -> None:
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def acquire(self, num_tokens: int = 0) -> None:
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.tokens is not None and num_tokens > 0:
+            self.tokens.acquire(num_tokens)
+
+
+def estimate_tokens(messages, max_tokens: Optional[int] = None) -> int:
+    """
+    Rough token count of a chat request for TPM accounting: ~4 characters per token for text,
+    85 tokens for a low-detail image and 765 for a high-detail one, plus the completion budget.
+    """
+    num_tokens = max_tokens or 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            num_tokens += len(content) // 4 + 4
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                detail = part["image_url"].get("detail", "high")
+                num_tokens += 85 if detail == "low" else 765
+            else:
+                num_tokens += len(part.get("text", "")) // 4 + 4
+    return num_tokens
+
+
+class HTTPTransport:
+    """
+    Pooled keep-alive JSON client for a single endpoint, with client-side rate limiting
+    and exponential backoff on 429 / 5xx (honoring `Retry-After` when the server sends it).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_retries: int = 6,
+        timeout: float = 120,
+        pool_size: int = 64,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = RateLimiter(rpm, tpm)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "application/json"
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        return min(60.0, 2**attempt) * (0.5 + random.random() / 2)
+
+    def post_json(
+        self, path: str, payload: Dict[str, Any], num_tokens: int = 0, stats: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """`stats`, if given, is filled with the number of `retries` of the request."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            if stats is not None:
+                stats["retries"] = attempt
+            self.limiter.acquire(num_tokens)
+            response = None
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise APIError(f"Request to {url} failed: {e}") from e
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    error_cls = RateLimitError if response.status_code == 429 else APIError
+                    raise error_cls(
+                        f"Error with status code {response.status_code}: {response.text}",
+                        status_code=response.status_code,
+                        body=response.text,
+                    )
+            time.sleep(self._backoff(attempt, response))
+        raise AssertionError("unreachable")
+
+
+_TRANSPORTS: Dict[Tuple[str, Optional[str]], HTTPTransport] = {}
+_TRANSPORTS_LOCK = threading.Lock()
+
+
+def get_transport(base_url: str, api_key: Optional[str] = None, **kwargs) -> HTTPTransport:
+    """
+    Return the transport shared by every client talking to `base_url` with `api_key`, so that
+    connections are reused and rate limits are enforced across clients. `kwargs` (rpm, tpm, ...)
+    only take effect when the transport is first created.
+    """
+    with _TRANSPORTS_LOCK:
+        key = (base_url, api_key)
+        if key not in _TRANSPORTS:
+            _TRANSPORTS[key] = HTTPTransport(base_url, api_key, **kwargs)
+        return _TRANSPORTS[key]
@@ -3,9 +3,9 @@ import json
 from human_id import generate_id
 import os
 import argparse
-import multiprocessing as mp
-import traceback
+import asyncio
 
+from agent_eval.cache import ResponseCache
 from agent_eval.clients import LM_Client, GPT4V_Client
 from agent_eval.domains.unified import UniTrajectoryDataset
 from agent_eval.eval.evaluator import Evaluator
@@ -18,43 +18,47 @@ PROJECT_ROOT = os.environ.get(
 )
 
 
-def process_sample(
-    idx: str,
-    traj_info: dict,
-    # evaluator: Evaluator,
-    log_save_path,
+def build_clients(cache=None, rpm=None, tpm=None) -> dict:
+    oai_key = "<removed>"
+    # rate limits are shared by all clients of the same endpoint and key
+    limits = {"rpm": rpm, "tpm": tpm}
+    return {
+        "gpt-3.5": LM_Client(api_key=oai_key, model_name="gpt-3.5", cache=cache, **limits),
+        "gpt-4": LM_Client(api_key=oai_key, model_name="gpt-4", cache=cache, **limits),
+        "mixtral": LM_Client(api_key="<removed>", model_name="mixtral", cache=cache, **limits),
+        "gpt-4v": GPT4V_Client(api_key=oai_key, cache=cache, **limits),
+    }
+
+
+def get_gt_label(gt):
+    for user_uid, ann in gt.items():
+        return ann["annotation"] == "Success"
+
+
+async def evaluate_samples(
+    evaluator: Evaluator,
+    dataset: UniTrajectoryDataset,
+    samples_to_eval: list,
     model: str,
     eval_version: str,
-) -> list[dict]:
-    # print(idx, model)
-    try:
-        # if True:
-        oai_key = "<removed>"
-        clients = {
-            "gpt-3.5": LM_Client(api_key=oai_key, model_name="gpt-3.5"),
-            "gpt-4": LM_Client(api_key=oai_key, model_name="gpt-4"),
-            "mixtral": LM_Client(api_key="<removed>", model_name="mixtral"),
-            "gpt-4v": GPT4V_Client(api_key=oai_key),
-        }
-        evaluator = Evaluator(clients, log_save_path=log_save_path + "/trajs")
-        out, _ = evaluator(traj_info, model, eval_version)
-        eval_result = None
-        if out["status"] == "success" or out["status"] == "Success":
-            eval_result = True
-        else:
-            eval_result = False
-        return [
-            {
-                "idx": idx,
-                "gt": traj_info["eval"],
+    concurrency: int,
+) -> dict:
+    # trajectories are loaded on demand, only `concurrency` of them are alive at a time
+    infos = (dataset[idx] for idx in samples_to_eval)
+    results = {}
+    with tqdm(total=len(samples_to_eval)) as pbar:
+        async for info, out, _ in evaluator.aevaluate_many(
+            infos, model, eval_version, concurrency=concurrency
+        ):
+            pbar.update(1)
+            if out is None:
+                continue
+            eval_result = out["status"] == "success" or out["status"] == "Success"
+            results[info["traj_name"]] = {
+                "gt": get_gt_label(info["eval"]),
                 "rm": eval_result,
-                "uid": traj_info["traj_name"],
             }
-        ]
-    except Exception as e:
-        print(f"Error on {idx}, {e}")
-        print(traceback.format_exc())
-        return []
+    return results
 
 
 def main(args):
@@ -82,33 +86,26 @@ def main(args):
         **data_config,
         captioner_name=main_config["caption_data"],
         load_image=True if args.model == "gpt-4v" else False,
+        last_k_images=Evaluator.frames_needed(main_config["eval_version"]),
     )
     samples_to_eval = dev_dataset.get_idx_list_with_annotations()
 
-    pool = mp.Pool(args.num_proc)
-    jobs = [
-        pool.apply_async(
-            process_sample,
-            args=(
-                idx,
-                dev_dataset[idx],
-                log_save_path,
-                main_config["model"],
-                main_config["eval_version"],
-            ),
+    # re-running the same (prompt, model) pairs across ablations is served from disk
+    cache = None if args.no_cache else ResponseCache(args.cache_path)
+    evaluator = Evaluator(
+        build_clients(cache, rpm=args.rpm, tpm=args.tpm),
+        log_save_path=log_save_path + "/trajs",
+    )
+    results = asyncio.run(
+        evaluate_samples(
+            evaluator,
+            dev_dataset,
+            samples_to_eval,
+            main_config["model"],
+            main_config["eval_version"],
+            args.concurrency,
         )
-        for idx in samples_to_eval
-    ]
-    pool.close()
-
-    def get_gt_label(result):
-        for user_uid, ann in result["gt"].items():
-            return ann["annotation"] == "Success"
-
-    results = {}
-    for job in tqdm(jobs):
-        for res in job.get():
-            results[res["uid"]] = {"gt": get_gt_label(res), "rm": res["rm"]}
+    )
 
     with open(log_save_path + "/rm_results.json", "w") as f:
         json.dump(results, f, indent=4)
@@ -121,6 +118,9 @@ def main(args):
         "samples_to_eval": samples_to_eval,
         "dataset_path": data_config["dataset_path"],
     }
+    if cache is not None:
+        metrics["cache"] = cache.stats()
+        cache.close()
     with open(log_save_path + "/stats.json", "w") as f:
         json.dump(metrics, f, indent=4)
     print(metrics)
@@ -154,7 +154,15 @@ if __name__ == "__main__":
         ],
         default="final-v3",
     )
-    parser.add_argument("--num_proc", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        default=os.path.join(PROJECT_ROOT, "outputs", "response_cache.sqlite"),
+    )
+    parser.add_argument("--no_cache", action="store_true")
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute limit")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens per minute limit")
     args = parser.parse_args()
 
     main(args)
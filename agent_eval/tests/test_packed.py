@@ -0,0 +1,51 @@
+import json
+import os
+
+from PIL import Image
+
+from agent_eval.domains.packed import PACK_NAME, pack_dataset
+from agent_eval.domains.unified import LazyImage, UniTrajectoryDataset
+
+
+def test_pack_with_missing_image(tmp_path):
+    dataset_path = str(tmp_path) + "/"
+    os.makedirs(dataset_path + "images")
+    os.makedirs(dataset_path + "evals")
+    Image.new("RGB", (8, 8), "red").save(dataset_path + "images/0_0.png")
+    steps = [{"img": "0_0.png"}, {"img": "0_1.png"}]  # the second image is missing
+    with open(dataset_path + "trajectory_log.json", "w") as f:
+        json.dump([{"uid": "0", "intent": "", "response": "", "steps": steps}], f)
+    open(dataset_path + "evals/gt.jsonl", "w").close()
+    pack_dataset(dataset_path)
+    assert os.path.exists(dataset_path + PACK_NAME)
+
+    dataset = UniTrajectoryDataset(dataset_path, ["gt"], captioner_name="none")
+    assert dataset.store is not None
+    assert dataset.store.image_span("0", 1) is None
+    images = dataset[0]["images"]
+    assert images[0].load().size == (8, 8)
+    # a missing image falls back to its path, like in an unpacked dataset
+    assert isinstance(images[1], LazyImage)
+    assert images[1].span is None
+    assert images[1].path == dataset_path + "images/0_1.png"
+
+
+def test_captions_of_jpeg_steps(tmp_path):
+    dataset_path = str(tmp_path) + "/"
+    for name in ["images", "evals", "captions"]:
+        os.makedirs(dataset_path + name)
+    Image.new("RGB", (8, 8), "red").save(dataset_path + "images/0_0.jpeg")
+    steps = [{"img": "0_0.jpeg"}]
+    with open(dataset_path + "trajectory_log.json", "w") as f:
+        json.dump([{"uid": "0", "intent": "", "response": "", "steps": steps}], f)
+    open(dataset_path + "evals/gt.jsonl", "w").close()
+    # caption_pipeline.py keys the captions by the file name without the extension
+    with open(dataset_path + "captions/test.json", "w") as f:
+        json.dump({"0_0": "a red square"}, f)
+
+    dataset = UniTrajectoryDataset(dataset_path, ["gt"], captioner_name="test")
+    assert dataset[0]["captions"] == ["a red square"]
+    pack_dataset(dataset_path)
+    dataset = UniTrajectoryDataset(dataset_path, ["gt"], captioner_name="test")
+    assert dataset.store is not None
+    assert dataset[0]["captions"] == ["a red square"]
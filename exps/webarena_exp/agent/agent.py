@@ -1,7 +1,9 @@
 import argparse
+import asyncio
 import json
-from typing import Any
+from typing import Any, Callable, Generator
 
+import aiolimiter
 import tiktoken
 from beartype import beartype
 
@@ -16,12 +18,14 @@ from browser_env.actions import (
 )
 from browser_env.utils import Observation, StateInfo
 from llms import (
+    acall_llm,
     call_llm,
     generate_from_huggingface_completion,
     generate_from_openai_chat_completion,
     generate_from_openai_completion,
     lm_config,
 )
+from llms.accounting import llm_context, record_usage, track_call
 from llms.tokenizers import Tokenizer
 from agent.evaluator import GUIAgentEvaluator
 from pprint import pprint
@@ -38,6 +42,46 @@ class Agent:
         """Predict the next action given the observation"""
         raise NotImplementedError
 
+    async def anext_action(
+        self,
+        trajectory: Trajectory,
+        intent: str,
+        meta_data: Any,
+        limiter: aiolimiter.AsyncLimiter | None = None,
+    ) -> Action:
+        """Async next_action, runs next_action in a thread unless the agent
+        calls the LLM asynchronously"""
+        return await asyncio.to_thread(
+            self.next_action, trajectory, intent, meta_data
+        )
+
+    async def anext_actions(
+        self,
+        batch: list[tuple[Trajectory, str, Any]],
+        limiter: aiolimiter.AsyncLimiter | None = None,
+        task_ids: list[str | None] | None = None,
+    ) -> list[Action | BaseException]:
+        """Next actions of a batch of (trajectory, intent, meta_data) from
+        concurrent episodes, all the LLM requests go through `limiter`. The
+        entry of a request that failed is its exception. The LLM calls of
+        each request are accounted to its entry of `task_ids`."""
+
+        async def next_action_of_task(
+            request: tuple[Trajectory, str, Any], task_id: str | None
+        ) -> Action:
+            with llm_context(task_id=task_id):
+                return await self.anext_action(*request, limiter)
+
+        return await asyncio.gather(
+            *(
+                next_action_of_task(request, task_id)
+                for request, task_id in zip(
+                    batch, task_ids or [None] * len(batch)
+                )
+            ),
+            return_exceptions=True,
+        )
+
     def reset(
         self,
         test_config_file: str,
@@ -98,6 +142,139 @@ class TeacherForcingAgent(Agent):
             self.set_actions(action_seq)
 
 
+def action_stop_condition(
+    lm_config: lm_config.LMConfig,
+    prompt_constructor: PromptConstructor,
+    action_set_tag: str,
+) -> Callable[[str], bool] | None:
+    """With gen_config["stream_actions"], the streamed completion of a step
+    is cut as soon as the partial response holds a complete action that
+    parses. Returns None when the completions are not streamed."""
+    if not lm_config.gen_config.get("stream_actions", False):
+        return None
+    meta_data = prompt_constructor.instruction["meta_data"]
+    force_prefix = meta_data.get("force_prefix", "")
+    action_splitter = meta_data.get("action_splitter", "")
+
+    def action_emitted(response: str) -> bool:
+        response = f"{force_prefix}{response}"
+        # most chunks can't close the action, skip parsing for them
+        if action_splitter and response.count(action_splitter) < 2:
+            return False
+        try:
+            parsed_response = prompt_constructor.extract_action(response)
+            if action_set_tag == "id_accessibility_tree":
+                create_id_based_action(parsed_response)
+            elif action_set_tag == "playwright":
+                create_playwright_action(parsed_response)
+            else:
+                return False
+        except ActionParsingError:
+            return False
+        return True
+
+    return action_emitted
+
+
+def record_stream_usage(
+    prompt_constructor: PromptConstructor, response: str
+) -> None:
+    """Streamed responses report no usage, the prompt and the response are
+    counted with the agent's tokenizer"""
+    record_usage(
+        {
+            "prompt_tokens": prompt_constructor.prompt_length,
+            "completion_tokens": len(
+                prompt_constructor.tokenizer.encode(response)
+            ),
+        }
+    )
+
+
+def action_retry_loop(
+    prompt_constructor: PromptConstructor,
+    action_set_tag: str,
+    max_retry: int,
+) -> Generator[None, str, Action]:
+    """The parse/retry loop of an action prediction, shared by the sync and
+    the async one: is sent the LLM responses until one parses or max_retry
+    is reached and returns the action"""
+    force_prefix = prompt_constructor.instruction["meta_data"].get(
+        "force_prefix", ""
+    )
+    n = 0
+    while True:
+        response = yield
+        response = f"{force_prefix}{response}"
+        n += 1
+        try:
+            parsed_response = prompt_constructor.extract_action(response)
+            if action_set_tag == "id_accessibility_tree":
+                action = create_id_based_action(parsed_response)
+            elif action_set_tag == "playwright":
+                action = create_playwright_action(parsed_response)
+            else:
+                raise ValueError(f"Unknown action type {action_set_tag}")
+            action["raw_prediction"] = response
+            return action
+        except ActionParsingError:
+            if n >= max_retry:
+                action = create_none_action()
+                action["raw_prediction"] = response
+                return action
+
+
+def predict_action(
+    lm_config: lm_config.LMConfig,
+    prompt_constructor: PromptConstructor,
+    action_set_tag: str,
+    prompt: Any,
+) -> Action:
+    """Call the LLM until its response parses or max_retry is reached"""
+    should_stop = action_stop_condition(
+        lm_config, prompt_constructor, action_set_tag
+    )
+    retry_loop = action_retry_loop(
+        prompt_constructor, action_set_tag, lm_config.gen_config["max_retry"]
+    )
+    next(retry_loop)
+    while True:
+        with llm_context(stage="agent_step"), track_call(lm_config.model):
+            response = call_llm(lm_config, prompt, should_stop)
+            if should_stop is not None:
+                record_stream_usage(prompt_constructor, response)
+        try:
+            retry_loop.send(response)
+        except StopIteration as stop:
+            return stop.value  # type: ignore[no-any-return]
+
+
+async def apredict_action(
+    lm_config: lm_config.LMConfig,
+    prompt_constructor: PromptConstructor,
+    action_set_tag: str,
+    prompt: Any,
+    limiter: aiolimiter.AsyncLimiter | None,
+) -> Action:
+    """Async predict_action, the LLM calls go through `limiter`"""
+    should_stop = action_stop_condition(
+        lm_config, prompt_constructor, action_set_tag
+    )
+    retry_loop = action_retry_loop(
+        prompt_constructor, action_set_tag, lm_config.gen_config["max_retry"]
+    )
+    next(retry_loop)
+    while True:
+        with llm_context(stage="agent_step"), track_call(lm_config.model):
+            response = await acall_llm(lm_config, prompt, limiter, should_stop)
+            if should_stop is not None:
+                record_stream_usage(prompt_constructor, response)
+        try:
+            retry_loop.send(response)
+        except StopIteration as stop:
+            return stop.value  # type: ignore[no-any-return]
+
+
 class PromptAgent(Agent):
     """prompt-based agent that emits action given the history"""
 
@@ -112,6 +289,10 @@ class PromptAgent(Agent):
         self.lm_config = lm_config
         self.prompt_constructor = prompt_constructor
         self.action_set_tag = action_set_tag
+        # shared by the async calls of all the episodes
+        self.limiter = aiolimiter.AsyncLimiter(
+            lm_config.gen_config.get("requests_per_minute", 300)
+        )
 
     def set_action_set_tag(self, tag: str) -> None:
         self.action_set_tag = tag
@@ -123,36 +304,30 @@ class PromptAgent(Agent):
         prompt = self.prompt_constructor.construct(
             trajectory, intent, meta_data
         )
-        lm_config = self.lm_config
-        n = 0
-        while True:
-            response = call_llm(lm_config, prompt)
-            force_prefix = self.prompt_constructor.instruction[
-                "meta_data"
-            ].get("force_prefix", "")
-            response = f"{force_prefix}{response}"
-            n += 1
-            try:
-                parsed_response = self.prompt_constructor.extract_action(
-                    response
-                )
-                if self.action_set_tag == "id_accessibility_tree":
-                    action = create_id_based_action(parsed_response)
-                elif self.action_set_tag == "playwright":
-                    action = create_playwright_action(parsed_response)
-                else:
-                    raise ValueError(
-                        f"Unknown action type {self.action_set_tag}"
-                    )
-                action["raw_prediction"] = response
-                break
-            except ActionParsingError as e:
-                if n >= lm_config.gen_config["max_retry"]:
-                    action = create_none_action()
-                    action["raw_prediction"] = response
-                    break
+        return predict_action(
+            self.lm_config,
+            self.prompt_constructor,
+            self.action_set_tag,
+            prompt,
+        )
 
-        return action
+    async def anext_action(
+        self,
+        trajectory: Trajectory,
+        intent: str,
+        meta_data: dict[str, Any],
+        limiter: aiolimiter.AsyncLimiter | None = None,
+    ) -> Action:
+        prompt = self.prompt_constructor.construct(
+            trajectory, intent, meta_data
+        )
+        return await apredict_action(
+            self.lm_config,
+            self.prompt_constructor,
+            self.action_set_tag,
+            prompt,
+            limiter or self.limiter,
+        )
 
     def reset(self, test_config_file: str) -> None:
         pass
@@ -177,6 +352,9 @@ class ReflexionAgent(Agent):
         self.action_prompt_constructor = action_prompt_constructor
         self.reflexion_prompt_constructor = reflexion_prompt_constructor
         self.action_set_tag = action_set_tag
+        self.limiter = aiolimiter.AsyncLimiter(
+            lm_config.gen_config.get("requests_per_minute", 300)
+        )
         self.evaluator_type = evaluator_type
         if self.evaluator_type == "model":
             self.evaluator = GUIAgentEvaluator(result_path, eval_lm_model, eval_prompt_version)
@@ -193,41 +371,30 @@ class ReflexionAgent(Agent):
         prompt = self.action_prompt_constructor.construct(
             trajectory, intent, meta_data
         )
-        lm_config = self.lm_config
-        n = 0
-        while True:
-            response = call_llm(lm_config, prompt)
-            # print("------- Action Prediction -------")
-            # print("[AP] PROMPT")
-            # pprint(prompt)
-            # print("[AP] RESPONSE\n", response)
-
-            force_prefix = self.action_prompt_constructor.instruction[
-                "meta_data"
-            ].get("force_prefix", "")
-            response = f"{force_prefix}{response}"
-            n += 1
-            try:
-                parsed_response = self.action_prompt_constructor.extract_action(
-                    response
-                )
-                if self.action_set_tag == "id_accessibility_tree":
-                    action = create_id_based_action(parsed_response)
-                elif self.action_set_tag == "playwright":
-                    action = create_playwright_action(parsed_response)
-                else:
-                    raise ValueError(
-                        f"Unknown action type {self.action_set_tag}"
-                    )
-                action["raw_prediction"] = response
-                break
-            except ActionParsingError as e:
-                if n >= lm_config.gen_config["max_retry"]:
-                    action = create_none_action()
-                    action["raw_prediction"] = response
-                    break
+        return predict_action(
+            self.lm_config,
+            self.action_prompt_constructor,
+            self.action_set_tag,
+            prompt,
+        )
 
-        return action
+    async def anext_action(
+        self,
+        trajectory: Trajectory,
+        intent: str,
+        meta_data: dict[str, Any],
+        limiter: aiolimiter.AsyncLimiter | None = None,
+    ) -> Action:
+        prompt = self.action_prompt_constructor.construct(
+            trajectory, intent, meta_data
+        )
+        return await apredict_action(
+            self.lm_config,
+            self.action_prompt_constructor,
+            self.action_set_tag,
+            prompt,
+            limiter or self.limiter,
+        )
     
     def generate_reflection(self, records: dict) -> str:
         prompt = self.reflexion_prompt_constructor.construct(records)
@@ -235,7 +402,8 @@ class ReflexionAgent(Agent):
         response = ""
         n = 0
         while True:
-            response = call_llm(lm_config, prompt)
+            with llm_context(stage="reflection"):
+                response = call_llm(lm_config, prompt)
             # print("------- Reflection Generation -------")
             # print("[RG] PROMPT")
             # pprint(prompt)
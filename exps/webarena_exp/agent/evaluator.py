@@ -1,17 +1,20 @@
 import os
 from typing import Any
-from gradio_client import Client
 from browser_env import Trajectory
 import numpy as np
-import tempfile
 from PIL import Image
 from typing import Union, Literal
 import time
-from agent_eval.clients import LM_Client, GPT4V_Client
+from agent_eval.clients import CaptionClient, LM_Client, GPT4V_Client, add_usage_hook
+from agent_eval.captioner.dedupe import CaptionDedupeCache, DedupeCaptioner
 from agent_eval.eval.evaluator import Evaluator
 import multiprocessing as mp
 import re
 import random
+from llms.accounting import llm_context, record_external_call
+
+# the chat completions of the evaluator go to the LLM usage of the run
+add_usage_hook(record_external_call)
 
 OAI_KEY = os.getenv("OPENAI_API_KEY")
 
@@ -30,7 +33,16 @@ class GUIAgentEvaluator:
         self.prompt_version = prompt_version
         self.client_urls = CAPTION_CLIENT_URLS
         self.num_caption_clients = len(CAPTION_CLIENT_URLS)
-        self.caption_clients = [Client(url) for url in CAPTION_CLIENT_URLS]
+        self.caption_clients = [CaptionClient(url) for url in CAPTION_CLIENT_URLS]
+        # captions are shared across trials of the same run, end states recur a lot in reflexion
+        self.captioner = (
+            DedupeCaptioner(
+                self.caption_clients,
+                CaptionDedupeCache(path=os.path.join(result_path, "caption_cache.jsonl")),
+            )
+            if self.caption_clients
+            else None
+        )
         self.lm_clients = {
             "gpt-3.5": LM_Client(api_key=OAI_KEY, model_name="gpt-3.5"),
             "gpt-4": LM_Client(api_key=OAI_KEY, model_name="gpt-4"),
@@ -39,25 +51,15 @@ class GUIAgentEvaluator:
         }
         self.evaluator = Evaluator(self.lm_clients, log_save_path=result_path)
 
-    def caption(self, image: Union[str, Image.Image, np.array], idx: int = -1) -> str:
+    def caption(self, images: list[Union[str, Image.Image, np.ndarray]]) -> list[str]:
         start_t = time.time()
-        # print(f"captioning image {idx}")
-        if idx < 0:
-            client = random.choice(self.caption_clients)
-        else:
-            client = self.caption_clients[idx % self.num_caption_clients]
-        if isinstance(image, str):
-            caption = client.predict(image, api_name="/predict")
-        else:
-            if isinstance(image, np.ndarray):
-                image = Image.fromarray(image)
-            with tempfile.NamedTemporaryFile(suffix=".png") as f:
-                print(f.name)
-                image.save(f.name)
-                caption = client.predict(f.name, api_name="/predict")
-        print(f"captioning took {time.time() - start_t}")
-        # print(caption)
-        return caption
+        captions = self.captioner.caption_many(images)
+        cache = self.captioner.cache
+        print(
+            f"captioning took {time.time() - start_t} "
+            f"(cache hits {cache.hits}, misses {cache.misses})"
+        )
+        return captions
 
     def __call__(self, records: dict) -> tuple[float, str]:
         # (s, a, s, a, ...)
@@ -74,7 +76,7 @@ class GUIAgentEvaluator:
 
         # Note: we only caption the last two observations
         if "captions" not in records and self.model_type != "gpt-4v":
-            captions = [self.caption(s["img"]) for s in records["steps"][-2:]]
+            captions = self.caption([s["img"] for s in records["steps"][-2:]])
             records["captions"] = captions
         records["actions"] = self._get_actions(records)
         records["traj_name"] = f"eval_{records['uid']}_{records['trail_idx']}"
@@ -85,7 +87,8 @@ class GUIAgentEvaluator:
                 with Image.open(img_path) as img:
                     records["images"].append(np.array(img))
 
-        out, _ = self.evaluator(records, self.model_type, self.prompt_version)
+        with llm_context(stage="evaluator"):
+            out, _ = self.evaluator(records, self.model_type, self.prompt_version)
         print(out)
         if "success" in out["status"]:
             # return 0, "FAILED"
@@ -5,6 +5,7 @@ from typing import Any, TypedDict
 
 from browser_env import Action, ActionParsingError, Trajectory
 from browser_env.env_config import URL_MAPPINGS
+from browser_env.processors import observation_diff
 from browser_env.utils import StateInfo
 from llms import lm_config
 from llms.tokenizers import Tokenizer
@@ -20,6 +21,11 @@ class Instruction(TypedDict):
     meta_data: dict[str, Any]
 
 
+# token counts of the intro and the example messages by instruction file and
+# tokenizer, shared by all the constructors of a process
+PREFIX_TOKEN_COUNTS: dict[tuple[str, str], list[int]] = {}
+
+
 class PromptConstructor(object):
     def __init__(
         self,
@@ -34,6 +40,80 @@ class PromptConstructor(object):
         instruction["examples"] = [tuple(e) for e in instruction["examples"]]
         self.instruction: Instruction = instruction
         self.tokenizer = tokenizer
+        self._chat_prefix_key: (
+            tuple[str, tuple[tuple[str, str], ...]] | None
+        ) = None
+        self._chat_prefix: list[dict[str, str]] = []
+        self._last_current = ""
+        self._last_obs = ""
+        self.obs_token_count: int | None = None
+
+    @property
+    def prefix_token_counts(self) -> list[int]:
+        """Token counts of the intro and every example message, only
+        tokenized once per instruction file"""
+        key = (str(self.instruction_path.resolve()), self.tokenizer.name)
+        if key not in PREFIX_TOKEN_COUNTS:
+            texts = [self.instruction["intro"]] + [
+                text
+                for example in self.instruction["examples"]
+                for text in example
+            ]
+            PREFIX_TOKEN_COUNTS[key] = [
+                len(self.tokenizer.encode(text)) for text in texts
+            ]
+        return PREFIX_TOKEN_COUNTS[key]
+
+    @property
+    def prompt_length(self) -> int:
+        """Approximate token count of the last constructed prompt, the
+        observation and the static prefix are not tokenized again"""
+        current, obs = self._last_current, self._last_obs
+        if self.obs_token_count is None or not obs or obs not in current:
+            current_length = len(self.tokenizer.encode(current))
+        else:
+            current_length = self.obs_token_count + len(
+                self.tokenizer.encode(current.replace(obs, "", 1))
+            )
+        return sum(self.prefix_token_counts) + current_length
+
+    def truncate_observation(self, obs: str) -> str:
+        """Cut the observation to max_obs_length tokens"""
+        max_obs_length = self.lm_config.gen_config["max_obs_length"]
+        if not max_obs_length:
+            self.obs_token_count = None
+            return obs
+        obs, self.obs_token_count = self.tokenizer.truncate(
+            obs, max_obs_length
+        )
+        return obs
+
+    def chat_prefix(
+        self, intro: str, examples: list[tuple[str, str]]
+    ) -> list[dict[str, str]]:
+        """The system and example messages, only built again when the intro
+        or the examples change"""
+        key = (intro, tuple(examples))
+        if key != self._chat_prefix_key:
+            message = [{"role": "system", "content": intro}]
+            for (x, y) in examples:
+                message.append(
+                    {
+                        "role": "user",
+                        "name": "example_user",
+                        "content": x,
+                    }
+                )
+                message.append(
+                    {
+                        "role": "assistant",
+                        "name": "example_assistant",
+                        "content": y,
+                    }
+                )
+            self._chat_prefix_key = key
+            self._chat_prefix = message
+        return list(self._chat_prefix)
 
     def get_lm_api_input(
         self, intro: str, examples: list[tuple[str, str]], current: str
@@ -43,22 +123,7 @@ class PromptConstructor(object):
         message: list[dict[str, str]] | str
         if "openai" in self.lm_config.provider:
             if self.lm_config.mode == "chat":
-                message = [{"role": "system", "content": intro}]
-                for (x, y) in examples:
-                    message.append(
-                        {
-                            "role": "user",
-                            "name": "example_user",
-                            "content": x,
-                        }
-                    )
-                    message.append(
-                        {
-                            "role": "assistant",
-                            "name": "example_assistant",
-                            "content": y,
-                        }
-                    )
+                message = self.chat_prefix(intro, examples)
                 message.append({"role": "user", "content": current})
                 return message
             elif self.lm_config.mode == "completion":
@@ -169,10 +234,9 @@ class DirectPromptConstructor(PromptConstructor):
         keywords = self.instruction["meta_data"]["keywords"]
         state_info: StateInfo = trajectory[-1]  # type: ignore[assignment]
 
-        obs = state_info["observation"][self.obs_modality]
-        max_obs_length = self.lm_config.gen_config["max_obs_length"]
-        if max_obs_length:
-            obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+        obs = self.truncate_observation(
+            state_info["observation"][self.obs_modality]  # type: ignore[arg-type]
+        )
 
         page = state_info["info"]["page"]
         url = page.url
@@ -188,6 +252,7 @@ class DirectPromptConstructor(PromptConstructor):
 
         # make sure all keywords are replaced
         assert all([f"{{k}}" not in current for k in keywords])
+        self._last_current, self._last_obs = current, obs
         prompt = self.get_lm_api_input(intro, examples, current)
         return prompt
 
@@ -227,10 +292,9 @@ class CoTPromptConstructor(PromptConstructor):
         keywords = self.instruction["meta_data"]["keywords"]
         state_info: StateInfo = trajectory[-1]  # type: ignore[assignment]
 
-        obs = state_info["observation"][self.obs_modality]
-        max_obs_length = self.lm_config.gen_config["max_obs_length"]
-        if max_obs_length:
-            obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+        obs = self.truncate_observation(
+            state_info["observation"][self.obs_modality]  # type: ignore[arg-type]
+        )
 
         page = state_info["info"]["page"]
         url = page.url
@@ -244,6 +308,7 @@ class CoTPromptConstructor(PromptConstructor):
 
         assert all([f"{{k}}" not in current for k in keywords])
 
+        self._last_current, self._last_obs = current, obs
         prompt = self.get_lm_api_input(intro, examples, current)
         return prompt
 
@@ -284,10 +349,9 @@ class ReflexionPromptConstructor(CoTPromptConstructor):
         keywords = self.instruction["meta_data"]["keywords"]
         state_info: StateInfo = trajectory[-1]  # type: ignore[assignment]
 
-        obs = state_info["observation"][self.obs_modality]
-        max_obs_length = self.lm_config.gen_config["max_obs_length"]
-        if max_obs_length:
-            obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+        obs = self.truncate_observation(
+            state_info["observation"][self.obs_modality]  # type: ignore[arg-type]
+        )
 
         page = state_info["info"]["page"]
         url = page.url
@@ -305,6 +369,7 @@ class ReflexionPromptConstructor(CoTPromptConstructor):
 
         assert all([f"{{k}}" not in current for k in keywords])
 
+        self._last_current, self._last_obs = current, obs
         prompt = self.get_lm_api_input(intro, examples, current)
         return prompt
 
@@ -340,12 +405,20 @@ class ReflectionGenerationPromptConstructor(CoTPromptConstructor):
 
         
         obs_and_action = ""
+        use_diff = self.lm_config.gen_config.get("observation_diff", False)
         for idx, step in enumerate(records["steps"]):
             obs = step["accessibility_tree"] # TODO: support other obs_modality
+            url = step["url"]
+            # the previous observation is already in the prompt, only show what changed
+            if use_diff and idx > 0 and records["steps"][idx - 1]["url"] == url:
+                diff = observation_diff(
+                    records["steps"][idx - 1]["accessibility_tree"], obs
+                )
+                if len(diff) < len(obs):
+                    obs = f"(changes since OBSERVATION {idx - 1})\n{diff or 'no change'}"
             max_obs_length = self.lm_config.gen_config["max_obs_length"]
             if max_obs_length:
-                obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length]) # type: ignore[arg-type]
-            url = step["url"]
+                obs, _ = self.tokenizer.truncate(obs, max_obs_length)
             action_str = step["other"]["raw_action"]
             obs_and_action += f"OBSERVATION {idx}:\nURL: {url}\n{obs}\n\n"
             obs_and_action += f"ACTION {idx}:\n{action_str}\n\n"
@@ -366,5 +439,6 @@ class ReflectionGenerationPromptConstructor(CoTPromptConstructor):
         )
         assert all([f"{{k}}" not in current for k in keywords])
 
+        self._last_current, self._last_obs = current, ""
         prompt = self.get_lm_api_input(intro, examples, current)
         return prompt
@@ -34,7 +34,7 @@ from .actions import (
 from .async_envs import AsyncScriptBrowserEnv
 from .envs import ScriptBrowserEnv
 from .processors import ObservationMetadata
-from .trajectory import Trajectory
+from .trajectory import Trajectory, trajectory_memory
 from .utils import DetachedPage, StateInfo
 
 __all__ = [
@@ -73,4 +73,5 @@ __all__ = [
     "create_stop_action",
     "ActionParsingError",
     "Trajectory",
+    "trajectory_memory",
 ]
@@ -2,15 +2,23 @@ import asyncio
 import json
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
 import numpy as np
 import numpy.typing as npt
 from gymnasium import Env
 from gymnasium.spaces import Box, Text
-from playwright.async_api import Page, ViewportSize, async_playwright
+from playwright.async_api import (
+    CDPSession,
+    Page,
+    ViewportSize,
+    async_playwright,
+)
 
 from .actions import Action, aexecute_action, get_action_space
-from .utils import DetachedPage, png_bytes_to_numpy
+from .processors import ObservationHandler, ObservationMetadata
+from .settle import SettleDetector
+from .utils import DetachedPage, Observation, png_bytes_to_numpy
 
 
 class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
@@ -20,6 +28,10 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
     range of action spaces and observation spaces, both structured and unstructured.
     But in this prototype, we just support action space specified by Playwright script,
     and observation space is the html content of the page.
+
+    With observation_type "html" or "accessibility_tree", observations and
+    infos are the same as the ones of ScriptBrowserEnv, and element id based
+    actions are supported. The default "image" observation is the screenshot.
     """
 
     def __init__(
@@ -29,6 +41,12 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         slow_mo: int = 0,
         timeout: int = 30000,
         viewport_size: ViewportSize = {"width": 1280, "height": 720},
+        observation_type: str = "image",
+        current_viewport_only: bool = False,
+        sleep_after_execution: float = 0.0,
+        reuse_browser: bool = False,
+        recycle_browser_after: int = 0,
+        adaptive_settle: bool = False,
     ):
         self.observation_space = Box(
             0,
@@ -43,20 +61,90 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         self.reset_finished = False
         self.timeout = timeout
         self.viewport_size = viewport_size
+        self.sleep_after_execution = sleep_after_execution
+        self.reuse_browser = reuse_browser
+        self.recycle_browser_after = recycle_browser_after
+        self.adaptive_settle = adaptive_settle
+        self.settle_detector: SettleDetector | None = None
+        self.browser_launched = False
+        self.num_contexts = 0
+
+        match observation_type:
+            case "html" | "accessibility_tree":
+                self.text_observation_type = observation_type
+                self.observation_handler: ObservationHandler | None = (
+                    ObservationHandler(
+                        "text",
+                        observation_type,
+                        "",
+                        current_viewport_only,
+                        viewport_size,
+                    )
+                )
+            case "image":
+                self.text_observation_type = ""
+                self.observation_handler = None
+            case _:
+                raise ValueError(
+                    f"Unsupported observation type: {observation_type}"
+                )
 
-    async def setup(self, config_file: Path | None = None) -> None:
+    async def launch_browser(self) -> None:
         self.context_manager = async_playwright()
         self.playwright = await self.context_manager.__aenter__()
         self.browser = await self.playwright.chromium.launch(
             headless=self.headless, slow_mo=self.slow_mo
         )
+        self.browser_launched = True
+        self.num_contexts = 0
+
+    async def shutdown_browser(self) -> None:
+        if self.browser_launched:
+            await self.context_manager.__aexit__()
+            self.browser_launched = False
+
+    async def wait_for_settle(self) -> float:
+        """Wait after an action, returns the time waited in seconds"""
+        if self.sleep_after_execution <= 0:
+            return 0.0
+        if self.settle_detector is not None:
+            return await self.settle_detector.async_wait(self.page)
+        await asyncio.sleep(self.sleep_after_execution)
+        return self.sleep_after_execution
+
+    async def get_page_client(self, page: Page) -> CDPSession:
+        # pages opened by the site (e.g. target=_blank) have no client yet
+        if not hasattr(page, "client"):
+            client = await page.context.new_cdp_session(page)
+            if self.text_observation_type == "accessibility_tree":
+                await client.send("Accessibility.enable")
+            page.client = client  # type: ignore[attr-defined]
+        return page.client  # type: ignore[attr-defined,no-any-return]
+
+    async def setup(
+        self,
+        config_file: Path | None = None,
+        storage_state: str | None = None,
+    ) -> None:
+        if self.browser_launched and (
+            not self.browser.is_connected()
+            or (
+                self.recycle_browser_after > 0
+                and self.num_contexts >= self.recycle_browser_after
+            )
+        ):
+            await self.shutdown_browser()
+        if not self.browser_launched:
+            await self.launch_browser()
+
         if config_file:
             with open(config_file, "r") as f:
                 instance_config = json.load(f)
         else:
             instance_config = {}
 
-        storage_state = instance_config.get("storage_state", None)
+        if storage_state is None:
+            storage_state = instance_config.get("storage_state", None)
         start_url = instance_config.get("start_url", None)
         geolocation = instance_config.get("geolocation", None)
 
@@ -66,33 +154,78 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
             geolocation=geolocation,
             device_scale_factor=1,
         )
-        self.page = await self.context.new_page()
+        self.num_contexts += 1
+        if self.adaptive_settle:
+            self.settle_detector = SettleDetector(
+                self.context, max_wait=self.sleep_after_execution
+            )
         if start_url:
-            await self.page.goto(start_url)
+            for url in start_url.split(" |AND| "):
+                page = await self.context.new_page()
+                await self.get_page_client(page)
+                await page.goto(url)
+            # set the first page as the current page
+            self.page = self.context.pages[0]
+            await self.page.bring_to_front()
+        else:
+            self.page = await self.context.new_page()
+            await self.get_page_client(self.page)
+
+    async def _get_obs(self) -> dict[str, Observation]:
+        assert self.observation_handler is not None
+        return await self.observation_handler.aget_observation(
+            self.page, await self.get_page_client(self.page)
+        )
+
+    def _get_obs_metadata(self) -> dict[str, ObservationMetadata]:
+        assert self.observation_handler is not None
+        return self.observation_handler.get_observation_metadata()
 
     async def areset(
         self,
         *,
         seed: int | None = None,
         options: dict[str, str] | None = None,
-    ) -> tuple[npt.NDArray[np.uint8], dict[str, object]]:
+    ) -> tuple[Any, dict[str, object]]:
         """
         Reset the environment.
         :param options: options for the environment. The options are:
-            - storage_state: the path to the storage state file
+            - config_file: the task config file
+            - storage_state: the path to the storage state file, overrides
+              the one of the config file
         """
         super().reset(seed=seed, options=options)
         if self.reset_finished:
-            await self.context_manager.__aexit__()
+            if self.reuse_browser and self.browser.is_connected():
+                await self.context.close()
+            else:
+                await self.shutdown_browser()
         if options is not None and "config_file" in options:
             config_file = Path(options["config_file"])
             if config_file.exists():
-                await self.setup(config_file=config_file)
+                await self.setup(
+                    config_file=config_file,
+                    storage_state=options.get("storage_state"),
+                )
             else:
                 raise ValueError(f"Config state {config_file} does not exist.")
         else:
             await self.setup()
         self.reset_finished = True
+
+        if self.observation_handler is not None:
+            settle_time = await self.wait_for_settle()
+            observation = await self._get_obs()
+            return (
+                observation,
+                {
+                    "page": DetachedPage(self.page.url, ""),
+                    "fail_error": "",
+                    "observation_metadata": self._get_obs_metadata(),
+                    "settle_time": settle_time,
+                },
+            )
+
         content = await self.page.content()
         screenshot = png_bytes_to_numpy(await self.page.screenshot())
         return (
@@ -105,29 +238,55 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         *,
         seed: int | None = None,
         options: dict[str, str] | None = None,
-    ) -> tuple[npt.NDArray[np.uint8], dict[str, object]]:
+    ) -> tuple[Any, dict[str, object]]:
         return asyncio.run(self.areset(seed=seed, options=options))
 
     async def aclose(self) -> None:
         if self.reset_finished:
-            await self.context_manager.__aexit__()
+            await self.shutdown_browser()
+            self.reset_finished = False
 
     def close(self) -> None:
         asyncio.run(self.aclose())
 
     async def astep(
         self, action: Action
-    ) -> tuple[npt.NDArray[np.uint8], float, bool, bool, dict[str, object]]:
+    ) -> tuple[Any, float, bool, bool, dict[str, object]]:
         if not self.reset_finished:
             raise RuntimeError("Call reset first before calling step.")
         success = False
         fail_error = ""
         try:
-            self.page = await aexecute_action(action, self.page, self.context)
+            self.page = await aexecute_action(
+                action,
+                self.page,
+                self.context,
+                self.observation_handler.action_processor
+                if self.observation_handler is not None
+                else None,
+            )
             success = True
         except Exception as e:
             fail_error = str(e)
 
+        if self.observation_handler is not None:
+            settle_time = await self.wait_for_settle()
+            observation = await self._get_obs()
+            return (
+                observation,
+                float(success),
+                False,
+                False,
+                {
+                    "page": DetachedPage(
+                        self.page.url, await self.page.content()
+                    ),
+                    "fail_error": fail_error,
+                    "observation_metadata": self._get_obs_metadata(),
+                    "settle_time": settle_time,
+                },
+            )
+
         try:
             content = await self.page.content()
             screenshot = png_bytes_to_numpy(await self.page.screenshot())
@@ -149,5 +308,5 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
 
     def step(
         self, action: Action
-    ) -> tuple[npt.NDArray[np.uint8], float, bool, bool, dict[str, object]]:
+    ) -> tuple[Any, float, bool, bool, dict[str, object]]:
         return asyncio.run(self.astep(action), debug=True)
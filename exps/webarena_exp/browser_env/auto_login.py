@@ -2,12 +2,15 @@
 import argparse
 import glob
 import os
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from itertools import combinations
 from pathlib import Path
+from typing import Iterator
 
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import Browser, Page, sync_playwright
 
 from browser_env.env_config import (
     ACCOUNTS,
@@ -32,23 +35,39 @@ EXACT_MATCH = [True, True, True, True]
 KEYWORDS = ["", "", "Dashboard", "Delete"]
 
 
+@contextmanager
+def browser_or_launch(browser: Browser | None = None) -> Iterator[Browser]:
+    """Use the given browser, or launch one for the duration of the block"""
+    if browser is not None:
+        yield browser
+        return
+    context_manager = sync_playwright()
+    playwright = context_manager.__enter__()
+    try:
+        yield playwright.chromium.launch(headless=HEADLESS, slow_mo=SLOW_MO)
+    finally:
+        context_manager.__exit__()
+
+
 def is_expired(
-    storage_state: Path, url: str, keyword: str, url_exact: bool = True
+    storage_state: Path,
+    url: str,
+    keyword: str,
+    url_exact: bool = True,
+    browser: Browser | None = None,
 ) -> bool:
     """Test whether the cookie is expired"""
     if not storage_state.exists():
         return True
 
-    context_manager = sync_playwright()
-    playwright = context_manager.__enter__()
-    browser = playwright.chromium.launch(headless=True, slow_mo=SLOW_MO)
-    context = browser.new_context(storage_state=storage_state)
-    page = context.new_page()
-    page.goto(url)
-    time.sleep(1)
-    d_url = page.url
-    content = page.content()
-    context_manager.__exit__()
+    with browser_or_launch(browser) as browser:
+        context = browser.new_context(storage_state=storage_state)
+        page = context.new_page()
+        page.goto(url)
+        time.sleep(1)
+        d_url = page.url
+        content = page.content()
+        context.close()
     if keyword:
         return keyword not in content
     else:
@@ -58,13 +77,24 @@ def is_expired(
             return url not in d_url
 
 
-def renew_comb(comb: list[str], auth_folder: str = "./.auth") -> None:
-    context_manager = sync_playwright()
-    playwright = context_manager.__enter__()
-    browser = playwright.chromium.launch(headless=HEADLESS)
-    context = browser.new_context()
-    page = context.new_page()
+def renew_comb(
+    comb: list[str],
+    auth_folder: str = "./.auth",
+    browser: Browser | None = None,
+) -> None:
+    with browser_or_launch(browser) as browser:
+        context = browser.new_context()
+        try:
+            login(comb, context.new_page())
+            context.storage_state(
+                path=f"{auth_folder}/{'.'.join(comb)}_state.json"
+            )
+        finally:
+            context.close()
+
 
+def login(comb: list[str], page: Page) -> None:
+    """Log into every site of the combination in the page's context"""
     if "shopping" in comb:
         username = ACCOUNTS["shopping"]["username"]
         password = ACCOUNTS["shopping"]["password"]
@@ -99,16 +129,56 @@ def renew_comb(comb: list[str], auth_folder: str = "./.auth") -> None:
         page.get_by_test_id("password-field").fill(password)
         page.get_by_test_id("sign-in-button").click()
 
-    context.storage_state(path=f"{auth_folder}/{'.'.join(comb)}_state.json")
-
-    context_manager.__exit__()
-
 
 def get_site_comb_from_filepath(file_path: str) -> list[str]:
     comb = os.path.basename(file_path).rsplit("_", 1)[0].split(".")
     return comb
 
 
+def is_comb_expired(
+    storage_state: Path, comb: list[str], browser: Browser | None = None
+) -> bool:
+    """Test whether the cookie of any site of the combination is expired"""
+    for cur_site in comb:
+        if cur_site not in SITES:
+            continue
+        idx = SITES.index(cur_site)
+        if is_expired(
+            storage_state, URLS[idx], KEYWORDS[idx], EXACT_MATCH[idx], browser
+        ):
+            return True
+    return False
+
+
+class StorageStateCache:
+    """Login states by site combination, shared by the tasks of a run.
+
+    A state is trusted for `ttl` seconds after it was last checked or renewed.
+    After that it is checked with `is_expired` on the next use, and only
+    renewed when it actually expired. Checks and renewals use the browser of
+    the caller when one is given.
+    """
+
+    def __init__(self, auth_folder: str = "./.auth", ttl: float = 1800):
+        self.auth_folder = auth_folder
+        self.ttl = ttl
+        self.checked_at: dict[str, float] = {}
+        self.lock = threading.Lock()
+        Path(auth_folder).mkdir(parents=True, exist_ok=True)
+
+    def get(self, comb: list[str], browser: Browser | None = None) -> str:
+        """Path to a valid storage state of the site combination"""
+        key = ".".join(comb)
+        storage_state = Path(self.auth_folder) / f"{key}_state.json"
+        with self.lock:
+            checked_at = self.checked_at.get(key)
+            if checked_at is None or time.monotonic() - checked_at > self.ttl:
+                if is_comb_expired(storage_state, comb, browser):
+                    renew_comb(comb, self.auth_folder, browser)
+                self.checked_at[key] = time.monotonic()
+        return str(storage_state)
+
+
 def main(auth_folder: str = "./.auth") -> None:
     pairs = list(combinations(SITES, 2))
 
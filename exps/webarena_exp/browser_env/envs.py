@@ -4,6 +4,7 @@ import time
 from collections import defaultdict
 from dataclasses import dataclass
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from typing import Any, Union
 
 import numpy as np
@@ -23,6 +24,7 @@ from playwright.sync_api import (
 
 from .actions import Action, execute_action, get_action_space
 from .processors import ObservationHandler, ObservationMetadata
+from .settle import SettleDetector
 from .utils import (
     AccessibilityTree,
     DetachedPage,
@@ -84,7 +86,28 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         viewport_size: ViewportSize = {"width": 1280, "height": 720},
         save_trace_enabled: bool = False,
         sleep_after_execution: float = 0.0,
+        reuse_browser: bool = False,
+        recycle_browser_after: int = 0,
+        adaptive_settle: bool = False,
+        page_content_mode: str = "eager",
+        page_content_dir: str | None = None,
     ):
+        """
+        :param page_content_mode: how the html of info["page"] is captured
+            - eager: read after every step and kept in memory
+            - lazy: only read when accessed while the page is still in that
+              state, e.g. the final state by the evaluators; the content of
+              past states that were not accessed is empty
+            - disk: read after every step and written to page_content_dir,
+              a temporary directory removed by close() when it is None
+        :param adaptive_settle: after an action, wait until the page settled
+            (see settle.py) for at most sleep_after_execution seconds, instead
+            of always sleeping sleep_after_execution seconds
+        :param reuse_browser: keep one browser process alive across resets,
+            every reset only replaces the browser context
+        :param recycle_browser_after: with reuse_browser, relaunch the
+            browser after this many contexts to bound leaks, 0 for never
+        """
         # TODO: make Space[Action] = ActionSpace
         self.action_space = get_action_space()  # type: ignore[assignment]
         self.headless = headless
@@ -94,6 +117,22 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         self.viewport_size = viewport_size
         self.save_trace_enabled = save_trace_enabled
         self.sleep_after_execution = sleep_after_execution
+        self.reuse_browser = reuse_browser
+        self.recycle_browser_after = recycle_browser_after
+        self.adaptive_settle = adaptive_settle
+        self.settle_detector: SettleDetector | None = None
+        if page_content_mode not in ("eager", "lazy", "disk"):
+            raise ValueError(
+                f"Unsupported page content mode: {page_content_mode}"
+            )
+        self.page_content_mode = page_content_mode
+        self.page_content_dir = page_content_dir
+        # used without page_content_dir, removed by close()
+        self.page_content_tempdir: TemporaryDirectory[str] | None = None
+        self.detached_page: DetachedPage | None = None
+        self.num_detached_pages = 0
+        self.browser_launched = False
+        self.num_contexts = 0
 
         match observation_type:
             case "html" | "accessibility_tree":
@@ -121,13 +160,36 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
             self.observation_handler.get_observation_space()
         )
 
-    @beartype
-    def setup(self, config_file: Path | None = None) -> None:
+    def launch_browser(self) -> None:
         self.context_manager = sync_playwright()
         self.playwright = self.context_manager.__enter__()
         self.browser = self.playwright.chromium.launch(
             headless=self.headless, slow_mo=self.slow_mo
         )
+        self.browser_launched = True
+        self.num_contexts = 0
+
+    def shutdown_browser(self) -> None:
+        if self.browser_launched:
+            self.context_manager.__exit__()
+            self.browser_launched = False
+
+    @beartype
+    def setup(
+        self,
+        config_file: Path | None = None,
+        storage_state: str | None = None,
+    ) -> None:
+        if self.browser_launched and (
+            not self.browser.is_connected()
+            or (
+                self.recycle_browser_after > 0
+                and self.num_contexts >= self.recycle_browser_after
+            )
+        ):
+            self.shutdown_browser()
+        if not self.browser_launched:
+            self.launch_browser()
 
         if config_file:
             with open(config_file, "r") as f:
@@ -135,7 +197,8 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         else:
             instance_config = {}
 
-        storage_state = instance_config.get("storage_state", None)
+        if storage_state is None:
+            storage_state = instance_config.get("storage_state", None)
         start_url = instance_config.get("start_url", None)
         geolocation = instance_config.get("geolocation", None)
 
@@ -145,6 +208,11 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
             geolocation=geolocation,
             device_scale_factor=1,
         )
+        self.num_contexts += 1
+        if self.adaptive_settle:
+            self.settle_detector = SettleDetector(
+                self.context, max_wait=self.sleep_after_execution
+            )
         if self.save_trace_enabled:
             self.context.tracing.start(screenshots=True, snapshots=True)
         if start_url:
@@ -168,6 +236,40 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
                 client.send("Accessibility.enable")
             self.page.client = client  # type: ignore
 
+    def wait_for_settle(self) -> float:
+        """Wait after an action, returns the time waited in seconds"""
+        if self.sleep_after_execution <= 0:
+            return 0.0
+        if self.settle_detector is not None:
+            return self.settle_detector.wait(self.page)
+        time.sleep(self.sleep_after_execution)
+        return self.sleep_after_execution
+
+    def detach_page(self) -> DetachedPage:
+        """The DetachedPage of the current state, see page_content_mode"""
+        if self.detached_page is not None:
+            self.detached_page.detach()
+        match self.page_content_mode:
+            case "lazy":
+                page = DetachedPage(self.page.url, loader=self.page.content)
+            case "disk":
+                if self.page_content_dir is None:
+                    self.page_content_tempdir = TemporaryDirectory(
+                        prefix="page_content_"
+                    )
+                    self.page_content_dir = self.page_content_tempdir.name
+                path = (
+                    Path(self.page_content_dir)
+                    / f"{self.num_detached_pages}.html"
+                )
+                path.write_text(self.page.content())
+                page = DetachedPage(self.page.url, path=path)
+            case _:
+                page = DetachedPage(self.page.url, self.page.content())
+        self.num_detached_pages += 1
+        self.detached_page = page
+        return page
+
     def get_page_client(self, page: Page) -> CDPSession:
         return page.client  # type: ignore
 
@@ -191,24 +293,34 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         """
         Reset the environment.
         :param options: options for the environment. The current supported options are:
+            - "config_file": the task config file
             - "storage_state": the storage state of the browser. It is a file path to a json file.
+              Overrides the one of the config file.
         """
         super().reset(seed=seed, options=options)
+        if self.detached_page is not None:
+            self.detached_page.detach()
+            self.detached_page = None
         if self.reset_finished:
-            self.context_manager.__exit__()
+            if self.reuse_browser and self.browser.is_connected():
+                self.context.close()
+            else:
+                self.shutdown_browser()
 
         if options is not None and "config_file" in options:
             config_file = Path(options["config_file"])
             if config_file.exists():
-                self.setup(config_file=config_file)
+                self.setup(
+                    config_file=config_file,
+                    storage_state=options.get("storage_state"),
+                )
             else:
                 raise ValueError(f"Config file {config_file} does not exist.")
         else:
             self.setup()
         self.reset_finished = True
 
-        if self.sleep_after_execution > 0:
-            time.sleep(self.sleep_after_execution)
+        settle_time = self.wait_for_settle()
 
         observation = self._get_obs()
         observation_metadata = self._get_obs_metadata()
@@ -216,6 +328,7 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
             "page": DetachedPage(self.page.url, ""),
             "fail_error": "",
             "observation_metadata": observation_metadata,
+            "settle_time": settle_time,
         }
 
         return (observation, info)
@@ -226,7 +339,12 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
 
     def close(self) -> None:
         if self.reset_finished:
-            self.context_manager.__exit__()
+            self.shutdown_browser()
+            self.reset_finished = False
+        if self.page_content_tempdir is not None:
+            self.page_content_tempdir.cleanup()
+            self.page_content_tempdir = None
+            self.page_content_dir = None
 
     def step(
         self, action: Action
@@ -247,17 +365,16 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         except Exception as e:
             fail_error = str(e)
 
-        # hard sleep TODO[shuyanzh] suboptimal, may need to check network
-        if self.sleep_after_execution > 0:
-            time.sleep(self.sleep_after_execution)
+        settle_time = self.wait_for_settle()
 
         observation = self._get_obs()
         observation_metadata = self._get_obs_metadata()
 
         info = {
-            "page": DetachedPage(self.page.url, self.page.content()),
+            "page": self.detach_page(),
             "fail_error": fail_error,
             "observation_metadata": observation_metadata,
+            "settle_time": settle_time,
         }
         msg = (
             observation,
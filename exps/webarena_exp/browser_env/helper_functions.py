@@ -1,7 +1,4 @@
-import base64
-import io
 import json
-import re
 from pathlib import Path
 from typing import Any, Optional
 import numpy as np
@@ -33,14 +30,17 @@ HTML_TEMPLATE = """
     </body>
 </html>
 """
+HTML_HEAD, HTML_TAIL = HTML_TEMPLATE.format(body="\0").split("\0")
+# screenshots of the renders, relative to the result dir
+RENDER_IMAGE_DIR = "render_images"
 
 
-def get_render_action(
+def get_parsed_action(
     action: Action,
     observation_metadata: dict[str, ObservationMetadata],
     action_set_tag: str,
 ) -> str:
-    """Parse the predicted actions for rendering purpose. More comprehensive information"""
+    """The predicted action with the content of the element it acts on"""
     match action_set_tag:
         case "id_accessibility_tree":
             text_meta_data = observation_metadata["text"]
@@ -50,15 +50,33 @@ def get_render_action(
                 ]
             else:
                 node_content = "No match found"
+            return action2str(action, action_set_tag, node_content)
+        case "playwright":
+            return action["pw_code"]
+        case _:
+            raise ValueError(f"Unknown action type {action['action_type']}")
+
 
+def get_render_action(
+    action: Action,
+    observation_metadata: dict[str, ObservationMetadata],
+    action_set_tag: str,
+) -> str:
+    """Parse the predicted actions for rendering purpose. More comprehensive information"""
+    match action_set_tag:
+        case "id_accessibility_tree":
+            parsed_action = get_parsed_action(
+                action, observation_metadata, action_set_tag
+            )
             action_str = f"<div class='raw_parsed_prediction' style='background-color:grey'><pre>{action['raw_prediction']}</pre></div>"
             action_str += f"<div class='action_object' style='background-color:grey'><pre>{repr(action)}</pre></div>"
-            action_str += f"<div class='parsed_action' style='background-color:black'><pre>{action2str(action, action_set_tag, node_content)}</pre></div>"
+            action_str += f"<div class='parsed_action' style='background-color:black'><pre>{parsed_action}</pre></div>"
 
         case "playwright":
             action_str = action["pw_code"]
         case _:
             raise ValueError(f"Unknown action type {action['action_type']}")
+
     return action_str
 
 
@@ -110,7 +128,14 @@ def get_action_description(
 
 
 class RenderHelper(object):
-    """Helper class to render text and image observations and meta data in the trajectory"""
+    """Helper class to render text and image observations and meta data in the trajectory
+
+    Every step is appended to render_{task_id}_{trail_idx}.html, the closing
+    tags are written on `close`. Screenshots are saved as JPEG files under
+    render_images/ and referenced by their path relative to the result dir.
+    The same step is also written as one json line to
+    render_{task_id}_{trail_idx}.jsonl.
+    """
 
     def __init__(
         self, config_file: str, result_dir: str, action_set_tag: str, trail_idx: int = 0
@@ -124,15 +149,23 @@ class RenderHelper(object):
             task_id = _config["task_id"]
 
         self.action_set_tag = action_set_tag
+        self.result_dir = Path(result_dir)
+        self.name = f"{task_id}_{trail_idx}"
+        self.step_idx = 0
 
-        self.render_file = open(
-            Path(result_dir) / f"render_{task_id}_{trail_idx}.html", "a+"
-        )
-        self.render_file.truncate(0)
-        # write init template
-        self.render_file.write(HTML_TEMPLATE.format(body=f"{_config_str}"))
-        self.render_file.read()
+        self.render_file = open(self.result_dir / f"render_{self.name}.html", "w")
+        # write the template up to the body, the rest is written on close
+        self.render_file.write(HTML_HEAD + _config_str)
         self.render_file.flush()
+        self.record_file = open(self.result_dir / f"render_{self.name}.jsonl", "w")
+
+    def save_screenshot(self, img_obs: np.ndarray) -> str:
+        """Save the screenshot as JPEG, return its path relative to the result dir"""
+        img_path = f"{RENDER_IMAGE_DIR}/{self.name}_{self.step_idx}.jpg"
+        (self.result_dir / RENDER_IMAGE_DIR).mkdir(exist_ok=True)
+        image = Image.fromarray(img_obs).convert("RGB")
+        image.save(self.result_dir / img_path, format="JPEG", quality=85)
+        return img_path
 
     def render(
         self,
@@ -140,26 +173,22 @@ class RenderHelper(object):
         state_info: StateInfo,
         meta_data: dict[str, Any],
         render_screenshot: bool = False,
-    ) -> None:
-        """Render the trajectory"""
+    ) -> str | None:
+        """Render the trajectory, returns the path of the screenshot if rendered"""
         # text observation
         observation = state_info["observation"]
         text_obs = observation["text"]
         info = state_info["info"]
+        url = info["page"].url
         new_content = f"<h2>New Page</h2>\n"
-        new_content += f"<h3 class='url'><a href={state_info['info']['page'].url}>URL: {state_info['info']['page'].url}</a></h3>\n"
+        new_content += f"<h3 class='url'><a href={url}>URL: {url}</a></h3>\n"
         new_content += f"<div class='state_obv'><pre>{text_obs}</pre><div>\n"
 
+        img_path = None
         if render_screenshot:
             # image observation
-            img_obs = observation["image"]
-            image = Image.fromarray(img_obs)
-            byte_io = io.BytesIO()
-            image.save(byte_io, format="PNG")
-            byte_io.seek(0)
-            image_bytes = base64.b64encode(byte_io.read())
-            image_str = image_bytes.decode("utf-8")
-            new_content += f"<img src='data:image/png;base64,{image_str}' style='width:50vw; height:auto;'/>\n"
+            img_path = self.save_screenshot(observation["image"])
+            new_content += f"<img src='{img_path}' style='width:50vw; height:auto;'/>\n"
 
         # meta data
         new_content += f"<div class='prev_action' style='background-color:brown'>{meta_data['action_history'][-1]}</div>\n"
@@ -181,20 +210,31 @@ class RenderHelper(object):
         action_str = f"<div class='predict_action'>{action_str}</div>"
         new_content += f"{action_str}\n"
 
-        # add new content
-        self.render_file.seek(0)
-        html = self.render_file.read()
-        html_body = re.findall(r"<body>(.*?)</body>", html, re.DOTALL)[0]
-        html_body += new_content
-
-        html = HTML_TEMPLATE.format(body=html_body)
-        self.render_file.seek(0)
-        self.render_file.truncate()
-        self.render_file.write(html)
+        # append the new content
+        self.render_file.write(new_content)
         self.render_file.flush()
 
+        record = {
+            "step": self.step_idx,
+            "url": url,
+            "observation": text_obs,
+            "image": img_path,
+            "prev_action": meta_data["action_history"][-1],
+            "memory": meta_data.get("memory", []),
+            "raw_prediction": action.get("raw_prediction", ""),
+            "parsed_action": get_parsed_action(
+                action, info["observation_metadata"], self.action_set_tag
+            ),
+        }
+        self.record_file.write(json.dumps(record) + "\n")
+        self.record_file.flush()
+        self.step_idx += 1
+        return img_path
+
     def close(self) -> None:
+        self.render_file.write(HTML_TAIL)
         self.render_file.close()
+        self.record_file.close()
 
 
 def save_img(
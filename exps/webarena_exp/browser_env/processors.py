@@ -1,3 +1,5 @@
+import asyncio
+import difflib
 import json
 import re
 from collections import defaultdict
@@ -6,6 +8,8 @@ from typing import Any, TypedDict, Union
 import numpy as np
 import numpy.typing as npt
 from gymnasium import spaces
+from playwright.async_api import CDPSession as ACDPSession
+from playwright.async_api import Page as APage
 from playwright.sync_api import CDPSession, Page, ViewportSize
 
 from browser_env.constants import (
@@ -27,6 +31,34 @@ from .utils import (
 )
 
 IN_VIEWPORT_RATIO_THRESHOLD = 0.6
+# start of a rendered line in a cached accessibility subtree, see parse_accessibility_tree
+LINE_MARK = "\x01"
+STATIC_TEXT_RE = re.compile(r"\[\d+\] StaticText (.+)", re.DOTALL)
+DOM_SNAPSHOT_PARAMS = {
+    "computedStyles": [],
+    "includeDOMRects": True,
+    "includePaintOrder": True,
+}
+WINDOW_INFO_JS = """() => ({
+    top: window.pageYOffset,
+    left: window.pageXOffset,
+    width: window.screen.width,
+    height: window.screen.height,
+    devicePixelRatio: window.devicePixelRatio,
+})"""
+BOUNDING_CLIENT_RECT_JS = """
+    function() {
+        if (this.nodeType == 3) {
+            var range = document.createRange();
+            range.selectNode(this);
+            var rect = range.getBoundingClientRect().toJSON();
+            range.detach();
+            return rect;
+        } else {
+            return this.getBoundingClientRect().toJSON();
+        }
+    }
+"""
 
 
 class ObservationProcessor:
@@ -44,20 +76,84 @@ def create_empty_metadata() -> ObservationMetadata:
     }
 
 
+def observation_diff(prev_obs: str, cur_obs: str) -> str:
+    """Compact line diff between two text observations, "-" for removed and
+    "+" for added lines, without context or hunk headers"""
+    diff = difflib.unified_diff(
+        prev_obs.split("\n"), cur_obs.split("\n"), n=0, lineterm=""
+    )
+    return "\n".join(
+        line for line in diff if not line.startswith(("---", "+++", "@@"))
+    )
+
+
+def splice_out_nodes(
+    child_cursors: list[list[int]], keep: list[bool]
+) -> tuple[list[int], list[list[int]]]:
+    """Remove the nodes with a False `keep` flag from a tree given as the
+    child cursors of every node. Children of a removed node take its place
+    in the parent, in order. Returns the new parent cursor (-1 for roots) and
+    child cursors of every node, entries of removed nodes are meaningless.
+
+    Linear in the number of nodes: the tree is stored as first-child /
+    next-sibling arrays and walked once in document order, attaching every
+    kept node to its closest kept ancestor.
+    """
+    num_nodes = len(child_cursors)
+    first_child = [-1] * num_nodes
+    next_sibling = [-1] * num_nodes
+    is_child = [False] * num_nodes
+    for cursor, children in enumerate(child_cursors):
+        prev = -1
+        for child in children:
+            if prev < 0:
+                first_child[cursor] = child
+            else:
+                next_sibling[prev] = child
+            is_child[child] = True
+            prev = child
+
+    parents = [-1] * num_nodes
+    new_children: list[list[int]] = [[] for _ in range(num_nodes)]
+    for root in range(num_nodes):
+        if is_child[root]:
+            continue
+        stack = [(root, -1)]
+        while stack:
+            cursor, ancestor = stack.pop()
+            if next_sibling[cursor] >= 0:
+                stack.append((next_sibling[cursor], ancestor))
+            if keep[cursor]:
+                parents[cursor] = ancestor
+                if ancestor >= 0:
+                    new_children[ancestor].append(cursor)
+                ancestor = cursor
+            if first_child[cursor] >= 0:
+                stack.append((first_child[cursor], ancestor))
+    return parents, new_children
+
+
 class TextObervationProcessor(ObservationProcessor):
     def __init__(
         self,
         observation_type: str,
         current_viewport_only: bool,
         viewport_size: ViewportSize,
+        bulk_bounds: bool = True,
     ):
         self.observation_type = observation_type
         self.current_viewport_only = current_viewport_only
         self.viewport_size = viewport_size
+        # read node bounds from the DOM snapshot instead of one CDP round trip per node
+        self.bulk_bounds = bulk_bounds
         self.observation_tag = "text"
         self.meta_data = (
             create_empty_metadata()
         )  # use the store meta data of this observation type
+        # rendered subtrees of the previous step, reused when unchanged
+        self.render_cache: dict[int, Any] = {}
+        self._prev_raw_content = ""
+        self._prev_clean_content = ""
 
     def fetch_browser_info(
         self,
@@ -65,15 +161,24 @@ class TextObervationProcessor(ObservationProcessor):
         client: CDPSession,
     ) -> BrowserInfo:
         # extract domtree
-        tree = client.send(
-            "DOMSnapshot.captureSnapshot",
-            {
-                "computedStyles": [],
-                "includeDOMRects": True,
-                "includePaintOrder": True,
-            },
+        tree = client.send("DOMSnapshot.captureSnapshot", DOM_SNAPSHOT_PARAMS)
+        window = page.evaluate(WINDOW_INFO_JS)
+        return self.build_browser_info(tree, window)
+
+    async def afetch_browser_info(
+        self,
+        page: APage,
+        client: ACDPSession,
+    ) -> BrowserInfo:
+        tree, window = await asyncio.gather(
+            client.send("DOMSnapshot.captureSnapshot", DOM_SNAPSHOT_PARAMS),
+            page.evaluate(WINDOW_INFO_JS),
         )
+        return self.build_browser_info(tree, window)
 
+    def build_browser_info(
+        self, tree: dict[str, Any], window: dict[str, Any]
+    ) -> BrowserInfo:
         # calibrate the bounds, in some cases, the bounds are scaled somehow
         bounds = tree["documents"][0]["layout"]["bounds"]
         b = bounds[0]
@@ -82,13 +187,13 @@ class TextObervationProcessor(ObservationProcessor):
         tree["documents"][0]["layout"]["bounds"] = bounds
 
         # extract browser info
-        win_top_bound = page.evaluate("window.pageYOffset")
-        win_left_bound = page.evaluate("window.pageXOffset")
-        win_width = page.evaluate("window.screen.width")
-        win_height = page.evaluate("window.screen.height")
+        win_top_bound = window["top"]
+        win_left_bound = window["left"]
+        win_width = window["width"]
+        win_height = window["height"]
         win_right_bound = win_left_bound + win_width
         win_lower_bound = win_top_bound + win_height
-        device_pixel_ratio = page.evaluate("window.devicePixelRatio")
+        device_pixel_ratio = window["devicePixelRatio"]
         assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
 
         config: BrowserConfig = {
@@ -119,19 +224,28 @@ class TextObervationProcessor(ObservationProcessor):
                 "Runtime.callFunctionOn",
                 {
                     "objectId": remote_object_id,
-                    "functionDeclaration": """
-                        function() {
-                            if (this.nodeType == 3) {
-                                var range = document.createRange();
-                                range.selectNode(this);
-                                var rect = range.getBoundingClientRect().toJSON();
-                                range.detach();
-                                return rect;
-                            } else {
-                                return this.getBoundingClientRect().toJSON();
-                            }
-                        }
-                    """,
+                    "functionDeclaration": BOUNDING_CLIENT_RECT_JS,
+                    "returnByValue": True,
+                },
+            )
+            return response
+        except Exception as e:
+            return {"result": {"subtype": "error"}}
+
+    @staticmethod
+    async def aget_bounding_client_rect(
+        client: ACDPSession, backend_node_id: str
+    ) -> dict[str, Any]:
+        try:
+            remote_object = await client.send(
+                "DOM.resolveNode", {"backendNodeId": int(backend_node_id)}
+            )
+            remote_object_id = remote_object["object"]["objectId"]
+            response = await client.send(
+                "Runtime.callFunctionOn",
+                {
+                    "objectId": remote_object_id,
+                    "functionDeclaration": BOUNDING_CLIENT_RECT_JS,
                     "returnByValue": True,
                 },
             )
@@ -139,6 +253,65 @@ class TextObervationProcessor(ObservationProcessor):
         except Exception as e:
             return {"result": {"subtype": "error"}}
 
+    @staticmethod
+    def rect_to_bound(response: dict[str, Any]) -> list[float] | None:
+        if response.get("result", {}).get("subtype", "") == "error":
+            return None
+        x = response["result"]["value"]["x"]
+        y = response["result"]["value"]["y"]
+        width = response["result"]["value"]["width"]
+        height = response["result"]["value"]["height"]
+        return [x, y, width, height]
+
+    @staticmethod
+    def get_snapshot_bounds(info: BrowserInfo) -> dict[int, list[float]]:
+        """Viewport relative [x, y, width, height] of every node in the main
+        document of the DOM snapshot, keyed by backend node id.
+
+        Matches `get_bounding_client_rect`: nodes without a layout object
+        (e.g. display: none) get an all zero rect, and nodes with several
+        layout objects get their union. Nodes of other documents (iframes)
+        are not included.
+        """
+        document = info["DOMTree"]["documents"][0]
+        backend_ids = document["nodes"]["backendNodeId"]
+        layout = document["layout"]
+        left = info["config"]["win_left_bound"]
+        top = info["config"]["win_top_bound"]
+
+        bounds: dict[int, list[float]] = {
+            backend_id: [0.0, 0.0, 0.0, 0.0] for backend_id in backend_ids
+        }
+        seen: set[int] = set()
+        for node_index, bound in zip(layout["nodeIndex"], layout["bounds"]):
+            backend_id = backend_ids[node_index]
+            x, y, width, height = bound
+            x, y = x - left, y - top
+            if backend_id in seen:
+                px, py, pw, ph = bounds[backend_id]
+                right = max(px + pw, x + width)
+                bottom = max(py + ph, y + height)
+                x, y = min(px, x), min(py, y)
+                width, height = right - x, bottom - y
+            bounds[backend_id] = [x, y, width, height]
+            seen.add(backend_id)
+        return bounds
+
+    def get_union_bound(
+        self,
+        client: CDPSession | None,
+        backend_node_id: str,
+        snapshot_bounds: dict[int, list[float]],
+    ) -> list[float] | None:
+        bound = snapshot_bounds.get(int(backend_node_id))
+        if bound is not None:
+            return list(bound)
+        if client is None:
+            return None
+        # not part of the main document snapshot, ask the browser
+        response = self.get_bounding_client_rect(client, backend_node_id)
+        return self.rect_to_bound(response)
+
     @staticmethod
     def get_element_in_viewport_ratio(
         elem_left_bound: float,
@@ -171,12 +344,32 @@ class TextObervationProcessor(ObservationProcessor):
         ratio = overlap_width * overlap_height / width * height
         return ratio
 
+    @classmethod
+    def is_in_viewport(
+        cls, union_bound: list[float] | None, config: BrowserConfig
+    ) -> bool:
+        if not union_bound:
+            return False
+        [x, y, width, height] = union_bound
+        # invisible node
+        if width == 0 or height == 0:
+            return False
+        in_viewport_ratio = cls.get_element_in_viewport_ratio(
+            elem_left_bound=float(x),
+            elem_top_bound=float(y),
+            width=float(width),
+            height=float(height),
+            config=config,
+        )
+        return in_viewport_ratio >= IN_VIEWPORT_RATIO_THRESHOLD
+
     def fetch_page_html(
         self,
         info: BrowserInfo,
         page: Page,
-        client: CDPSession,
+        client: CDPSession | None,
         current_viewport_only: bool,
+        snapshot_bounds: dict[int, list[float]] | None = None,
     ) -> DOMTree:
         # adopted from [natbot](https://github.com/nat/natbot)
         tree = info["DOMTree"]
@@ -184,6 +377,11 @@ class TextObervationProcessor(ObservationProcessor):
         document = tree["documents"][0]
         nodes = document["nodes"]
 
+        if snapshot_bounds is None:
+            snapshot_bounds = (
+                self.get_snapshot_bounds(info) if self.bulk_bounds else {}
+            )
+
         # make a dom tree that is easier to navigate
         dom_tree: DOMTree = []
         graph = defaultdict(list)
@@ -239,17 +437,9 @@ class TextObervationProcessor(ObservationProcessor):
             if cur_node["parentId"] == "-1":
                 cur_node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
             else:
-                response = self.get_bounding_client_rect(
-                    client, cur_node["backendNodeId"]
+                cur_node["union_bound"] = self.get_union_bound(
+                    client, cur_node["backendNodeId"], snapshot_bounds
                 )
-                if response.get("result", {}).get("subtype", "") == "error":
-                    cur_node["union_bound"] = None
-                else:
-                    x = response["result"]["value"]["x"]
-                    y = response["result"]["value"]["y"]
-                    width = response["result"]["value"]["width"]
-                    height = response["result"]["value"]["height"]
-                    cur_node["union_bound"] = [x, y, width, height]
 
             dom_tree.append(cur_node)
 
@@ -259,61 +449,21 @@ class TextObervationProcessor(ObservationProcessor):
 
         # remove the nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: DOMNode) -> None:
-                # update the node information in the accessibility tree
-                node_id = node["nodeId"]
-                parent_id = node["parentId"]
-                child_ids = node["childIds"]
-
-                # update the children of the parent node
-                assert dom_tree[int(parent_id)]["parentId"] != "[REMOVED]"
-                # remove the nodeid from parent
-                index = dom_tree[int(parent_id)]["childIds"].index(node_id)
-                dom_tree[int(parent_id)]["childIds"].pop(index)
-
-                # Insert children_nodeids in the same location
-                for child_id in child_ids:
-                    dom_tree[int(parent_id)]["childIds"].insert(
-                        index, child_id
-                    )
-                    index += 1
-
-                # update children node's parent
-                for child_id in child_ids:
-                    dom_tree[int(child_id)]["parentId"] = parent_id
-                # mark as removed
-                dom_tree[int(node_id)]["parentId"] = "[REMOVED]"
-
             config = info["config"]
-            for cursor, node in enumerate(dom_tree):
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0.0 or height == 0.0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            dom_tree = [
-                node
+            keep = [
+                self.is_in_viewport(node["union_bound"], config)
                 for node in dom_tree
-                if node.get("parentId", "-1") != "[REMOVED]"
             ]
+            parents, children = splice_out_nodes(
+                [[int(c) for c in node["childIds"]] for node in dom_tree], keep
+            )
+            for cursor, node in enumerate(dom_tree):
+                if not keep[cursor]:
+                    continue
+                node["childIds"] = [str(c) for c in children[cursor]]
+                if parents[cursor] >= 0:
+                    node["parentId"] = str(parents[cursor])
+            dom_tree = [node for node, k in zip(dom_tree, keep) if k]
 
         return dom_tree
 
@@ -369,7 +519,59 @@ class TextObervationProcessor(ObservationProcessor):
         accessibility_tree: AccessibilityTree = client.send(
             "Accessibility.getFullAXTree", {}
         )["nodes"]
+        return self.build_accessibility_tree(
+            info, accessibility_tree, client, current_viewport_only
+        )
+
+    async def afetch_page_accessibility_tree(
+        self,
+        info: BrowserInfo,
+        client: ACDPSession,
+        current_viewport_only: bool,
+    ) -> AccessibilityTree:
+        accessibility_tree: AccessibilityTree = (
+            await client.send("Accessibility.getFullAXTree", {})
+        )["nodes"]
+        # nodes outside of the main document snapshot (e.g. iframes) are
+        # measured with concurrent CDP calls instead of one by one
+        snapshot_bounds = self.get_snapshot_bounds(info)
+        missing = list(
+            {
+                node["backendDOMNodeId"]
+                for node in accessibility_tree
+                if "backendDOMNodeId" in node
+                and node["backendDOMNodeId"] not in snapshot_bounds
+            }
+        )
+        responses = await asyncio.gather(
+            *(
+                self.aget_bounding_client_rect(client, str(backend_node_id))
+                for backend_node_id in missing
+            )
+        )
+        for backend_node_id, response in zip(missing, responses):
+            bound = self.rect_to_bound(response)
+            if bound is not None:
+                snapshot_bounds[backend_node_id] = bound
+        return self.build_accessibility_tree(
+            info,
+            accessibility_tree,
+            None,
+            current_viewport_only,
+            snapshot_bounds,
+        )
 
+    def build_accessibility_tree(
+        self,
+        info: BrowserInfo,
+        accessibility_tree: AccessibilityTree,
+        client: CDPSession | None,
+        current_viewport_only: bool,
+        snapshot_bounds: dict[int, list[float]] | None = None,
+    ) -> AccessibilityTree:
+        """Bounds and viewport filtering of the raw CDP accessibility tree.
+        Bounds missing from `snapshot_bounds` are requested through `client`
+        when it is given."""
         # a few nodes are repeated in the accessibility tree
         seen_ids = set()
         _accessibility_tree = []
@@ -379,6 +581,11 @@ class TextObervationProcessor(ObservationProcessor):
                 seen_ids.add(node["nodeId"])
         accessibility_tree = _accessibility_tree
 
+        if snapshot_bounds is None:
+            snapshot_bounds = (
+                self.get_snapshot_bounds(info) if self.bulk_bounds else {}
+            )
+
         nodeid_to_cursor = {}
         for cursor, node in enumerate(accessibility_tree):
             nodeid_to_cursor[node["nodeId"]] = cursor
@@ -391,171 +598,210 @@ class TextObervationProcessor(ObservationProcessor):
                 # always inside the viewport
                 node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
             else:
-                response = self.get_bounding_client_rect(
-                    client, backend_node_id
+                node["union_bound"] = self.get_union_bound(
+                    client, backend_node_id, snapshot_bounds
                 )
-                if response.get("result", {}).get("subtype", "") == "error":
-                    node["union_bound"] = None
-                else:
-                    x = response["result"]["value"]["x"]
-                    y = response["result"]["value"]["y"]
-                    width = response["result"]["value"]["width"]
-                    height = response["result"]["value"]["height"]
-                    node["union_bound"] = [x, y, width, height]
 
         # filter nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: AccessibilityTreeNode) -> None:
-                # update the node information in the accessibility tree
-                nodeid = node["nodeId"]
-                node_cursor = nodeid_to_cursor[nodeid]
-                parent_nodeid = node["parentId"]
-                children_nodeids = node["childIds"]
-                parent_cursor = nodeid_to_cursor[parent_nodeid]
-                # update the children of the parent node
-                assert (
-                    accessibility_tree[parent_cursor].get("parentId", "Root")
-                    is not None
-                )
-                # remove the nodeid from parent's childIds
-                index = accessibility_tree[parent_cursor]["childIds"].index(
-                    nodeid
-                )
-                accessibility_tree[parent_cursor]["childIds"].pop(index)
-                # Insert children_nodeids in the same location
-                for child_nodeid in children_nodeids:
-                    accessibility_tree[parent_cursor]["childIds"].insert(
-                        index, child_nodeid
-                    )
-                    index += 1
-                # update children node's parent
-                for child_nodeid in children_nodeids:
-                    child_cursor = nodeid_to_cursor[child_nodeid]
-                    accessibility_tree[child_cursor][
-                        "parentId"
-                    ] = parent_nodeid
-                # mark as removed
-                accessibility_tree[node_cursor]["parentId"] = "[REMOVED]"
-
             config = info["config"]
-            for node in accessibility_tree:
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
+            keep = [
+                self.is_in_viewport(node["union_bound"], config)
+                for node in accessibility_tree
+            ]
+            parents, children = splice_out_nodes(
+                [
+                    [
+                        nodeid_to_cursor[child_id]
+                        for child_id in node.get("childIds", [])
+                        if child_id in nodeid_to_cursor
+                    ]
+                    for node in accessibility_tree
+                ],
+                keep,
+            )
+            for cursor, node in enumerate(accessibility_tree):
+                if not keep[cursor]:
                     continue
+                node["childIds"] = [
+                    accessibility_tree[c]["nodeId"] for c in children[cursor]
+                ]
+                if parents[cursor] >= 0:
+                    node["parentId"] = accessibility_tree[parents[cursor]][
+                        "nodeId"
+                    ]
+            accessibility_tree = [
+                node for node, k in zip(accessibility_tree, keep) if k
+            ]
 
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0 or height == 0:
-                    remove_node_in_graph(node)
-                    continue
+        return accessibility_tree
 
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
+    @staticmethod
+    def render_accessibility_node(
+        node: AccessibilityTreeNode, obs_node_id: str
+    ) -> str | None:
+        """Render a single node, None if it should be skipped"""
+        try:
+            role = node["role"]["value"]
+            name = node["name"]["value"]
+            node_str = f"[{obs_node_id}] {role} {repr(name)}"
+            properties = []
+            for property in node.get("properties", []):
+                try:
+                    if property["name"] in IGNORED_ACTREE_PROPERTIES:
+                        continue
+                    properties.append(
+                        f'{property["name"]}: {property["value"]["value"]}'
+                    )
+                except KeyError:
+                    pass
+
+            if properties:
+                node_str += " " + " ".join(properties)
+
+            # check valid
+            if not node_str.strip():
+                return None
+
+            # empty generic node
+            if not name.strip():
+                if not properties:
+                    if role in [
+                        "generic",
+                        "img",
+                        "list",
+                        "strong",
+                        "paragraph",
+                        "banner",
+                        "navigation",
+                        "Section",
+                        "LabelText",
+                        "Legend",
+                        "listitem",
+                    ]:
+                        return None
+                elif role in ["listitem"]:
+                    return None
+            return node_str
+        except Exception as e:
+            return None
 
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
+    @staticmethod
+    def accessibility_subtree_signatures(
+        accessibility_tree: AccessibilityTree,
+        node_id_to_idx: dict[str, int],
+    ) -> list[int]:
+        """Hash of everything that affects the rendering of each subtree"""
+        signatures = [0] * len(accessibility_tree)
 
-            accessibility_tree = [
-                node
-                for node in accessibility_tree
-                if node.get("parentId", "Root") != "[REMOVED]"
+        def visit(idx: int) -> int:
+            node = accessibility_tree[idx]
+            bound = node["union_bound"]
+            properties = node.get("properties")
+            key = [
+                node["nodeId"],
+                node.get("role", {}).get("value"),
+                node.get("name", {}).get("value"),
+                node.get("backendDOMNodeId"),
+                tuple(bound) if bound else None,
+                repr(properties) if properties else None,
             ]
+            for child_id in node["childIds"]:
+                if child_id in node_id_to_idx:
+                    key.append(visit(node_id_to_idx[child_id]))
+            signatures[idx] = hash(tuple(key))
+            return signatures[idx]
 
-        return accessibility_tree
+        visit(0)
+        return signatures
 
     @staticmethod
     def parse_accessibility_tree(
         accessibility_tree: AccessibilityTree,
+        render_cache: dict[int, Any] | None = None,
     ) -> tuple[str, dict[str, Any]]:
-        """Parse the accessibility tree into a string text"""
+        """Parse the accessibility tree into a string text
+
+        With `render_cache`, the rendered lines and node info of every
+        subtree are stored under a signature of the subtree, and subtrees
+        that did not change since the previous call are not re-rendered.
+        The cache only keeps the entries of the latest call.
+        """
         node_id_to_idx = {}
         for idx, node in enumerate(accessibility_tree):
             node_id_to_idx[node["nodeId"]] = idx
 
-        obs_nodes_info = {}
+        signatures = None
+        new_cache: dict[int, Any] = {}
+        if render_cache is not None:
+            signatures = (
+                TextObervationProcessor.accessibility_subtree_signatures(
+                    accessibility_tree, node_id_to_idx
+                )
+            )
+
+        def dfs(
+            idx: int, obs_node_id: str
+        ) -> tuple[str, list[tuple[str, Any]]]:
+            """Rendered subtree and its node info. Every line starts with
+            LINE_MARK followed by its indent relative to this node, so the
+            block can be shifted with a single replace."""
+            if signatures is not None:
+                cached = render_cache.get(signatures[idx])  # type: ignore[union-attr]
+                if cached is not None:
+                    new_cache[signatures[idx]] = cached
+                    return cached
 
-        def dfs(idx: int, obs_node_id: str, depth: int) -> str:
-            tree_str = ""
             node = accessibility_tree[idx]
-            indent = "\t" * depth
-            valid_node = True
-            try:
-                role = node["role"]["value"]
-                name = node["name"]["value"]
-                node_str = f"[{obs_node_id}] {role} {repr(name)}"
-                properties = []
-                for property in node.get("properties", []):
-                    try:
-                        if property["name"] in IGNORED_ACTREE_PROPERTIES:
-                            continue
-                        properties.append(
-                            f'{property["name"]}: {property["value"]["value"]}'
+            blocks: list[str] = []
+            nodes_info: list[tuple[str, Any]] = []
+            node_str = TextObervationProcessor.render_accessibility_node(
+                node, obs_node_id
+            )
+            valid_node = node_str is not None
+            if node_str is not None:
+                blocks.append(LINE_MARK + node_str)
+                # nodes without a DOM node are shown but cannot be acted on
+                if "backendDOMNodeId" in node:
+                    nodes_info.append(
+                        (
+                            obs_node_id,
+                            {
+                                "backend_id": node["backendDOMNodeId"],
+                                "union_bound": node["union_bound"],
+                                "text": node_str,
+                            },
                         )
-                    except KeyError:
-                        pass
-
-                if properties:
-                    node_str += " " + " ".join(properties)
-
-                # check valid
-                if not node_str.strip():
+                    )
+                else:
                     valid_node = False
 
-                # empty generic node
-                if not name.strip():
-                    if not properties:
-                        if role in [
-                            "generic",
-                            "img",
-                            "list",
-                            "strong",
-                            "paragraph",
-                            "banner",
-                            "navigation",
-                            "Section",
-                            "LabelText",
-                            "Legend",
-                            "listitem",
-                        ]:
-                            valid_node = False
-                    elif role in ["listitem"]:
-                        valid_node = False
-
-                if valid_node:
-                    tree_str += f"{indent}{node_str}"
-                    obs_nodes_info[obs_node_id] = {
-                        "backend_id": node["backendDOMNodeId"],
-                        "union_bound": node["union_bound"],
-                        "text": node_str,
-                    }
-
-            except Exception as e:
-                valid_node = False
-
-            for _, child_node_id in enumerate(node["childIds"]):
+            for child_node_id in node["childIds"]:
                 if child_node_id not in node_id_to_idx:
                     continue
-                # mark this to save some tokens
-                child_depth = depth + 1 if valid_node else depth
-                child_str = dfs(
-                    node_id_to_idx[child_node_id], child_node_id, child_depth
+                child_block, child_info = dfs(
+                    node_id_to_idx[child_node_id], child_node_id
                 )
-                if child_str.strip():
-                    if tree_str.strip():
-                        tree_str += "\n"
-                    tree_str += child_str
+                if not child_block:
+                    continue
+                # mark this to save some tokens
+                if valid_node:
+                    child_block = child_block.replace(
+                        LINE_MARK, LINE_MARK + "\t"
+                    )
+                blocks.append(child_block)
+                nodes_info.extend(child_info)
 
-            return tree_str
+            result = ("\n".join(blocks), nodes_info)
+            if signatures is not None:
+                new_cache[signatures[idx]] = result
+            return result
 
-        tree_str = dfs(0, accessibility_tree[0]["nodeId"], 0)
-        return tree_str, obs_nodes_info
+        block, nodes_info = dfs(0, accessibility_tree[0]["nodeId"])
+        if render_cache is not None:
+            render_cache.clear()
+            render_cache.update(new_cache)
+        return block.replace(LINE_MARK, ""), dict(nodes_info)
 
     @staticmethod
     def clean_accesibility_tree(tree_str: str) -> str:
@@ -565,9 +811,7 @@ class TextObervationProcessor(ObservationProcessor):
             # remove statictext if the content already appears in the previous line
             if "statictext" in line.lower():
                 prev_lines = clean_lines[-3:]
-                pattern = r"\[\d+\] StaticText (.+)"
-
-                match = re.search(pattern, line, re.DOTALL)
+                match = STATIC_TEXT_RE.search(line)
                 if match:
                     static_text = match.group(1)[1:-1]  # remove the quotes
                     if static_text and all(
@@ -580,20 +824,23 @@ class TextObervationProcessor(ObservationProcessor):
 
         return "\n".join(clean_lines)
 
+    @staticmethod
+    def format_tab_titles(tab_titles: list[str], current_tab_idx: int) -> str:
+        return " | ".join(
+            f"Tab {idx} (current): {title}"
+            if idx == current_tab_idx
+            else f"Tab {idx}: {title}"
+            for idx, title in enumerate(tab_titles)
+        )
+
     def process(self, page: Page, client: CDPSession) -> str:
         # get the tab info
         open_tabs = page.context.pages
         try:
             tab_titles = [tab.title() for tab in open_tabs]
-            current_tab_idx = open_tabs.index(page)
-            for idx in range(len(open_tabs)):
-                if idx == current_tab_idx:
-                    tab_titles[
-                        idx
-                    ] = f"Tab {idx} (current): {open_tabs[idx].title()}"
-                else:
-                    tab_titles[idx] = f"Tab {idx}: {open_tabs[idx].title()}"
-            tab_title_str = " | ".join(tab_titles)
+            tab_title_str = self.format_tab_titles(
+                tab_titles, open_tabs.index(page)
+            )
         except Exception:
             tab_title_str = " | ".join(
                 ["Tab {idx}" for idx in range(len(open_tabs))]
@@ -605,34 +852,90 @@ class TextObervationProcessor(ObservationProcessor):
             page.wait_for_load_state("load", timeout=500)
             browser_info = self.fetch_browser_info(page, client)
 
+        tree: DOMTree | AccessibilityTree
         if self.observation_type == "html":
-            dom_tree = self.fetch_page_html(
+            tree = self.fetch_page_html(
                 browser_info,
                 page,
                 client,
                 current_viewport_only=self.current_viewport_only,
             )
-            content, obs_nodes_info = self.parse_html(dom_tree)
-            self.obs_nodes_info = obs_nodes_info
-            self.meta_data["obs_nodes_info"] = obs_nodes_info
-
         elif self.observation_type == "accessibility_tree":
-            accessibility_tree = self.fetch_page_accessibility_tree(
+            tree = self.fetch_page_accessibility_tree(
                 browser_info,
                 client,
                 current_viewport_only=self.current_viewport_only,
             )
-            content, obs_nodes_info = self.parse_accessibility_tree(
-                accessibility_tree
+        else:
+            raise ValueError(
+                f"Invalid observatrion type: {self.observation_type}"
+            )
+        return self.render_observation(tree, browser_info, tab_title_str)
+
+    async def aprocess(self, page: APage, client: ACDPSession) -> str:
+        """`process` for the async API, the CDP calls of one observation are
+        issued concurrently. The html observation needs `bulk_bounds`."""
+        open_tabs = page.context.pages
+        try:
+            tab_titles = await asyncio.gather(
+                *(tab.title() for tab in open_tabs)
+            )
+            tab_title_str = self.format_tab_titles(
+                list(tab_titles), open_tabs.index(page)
+            )
+        except Exception:
+            tab_title_str = " | ".join(
+                ["Tab {idx}" for idx in range(len(open_tabs))]
             )
-            content = self.clean_accesibility_tree(content)
-            self.obs_nodes_info = obs_nodes_info
-            self.meta_data["obs_nodes_info"] = obs_nodes_info
 
+        try:
+            browser_info = await self.afetch_browser_info(page, client)
+        except Exception:
+            await page.wait_for_load_state("load", timeout=500)
+            browser_info = await self.afetch_browser_info(page, client)
+
+        tree: DOMTree | AccessibilityTree
+        if self.observation_type == "html":
+            assert self.bulk_bounds, "async html observation needs bulk_bounds"
+            tree = self.fetch_page_html(
+                browser_info,
+                None,  # type: ignore[arg-type]
+                None,
+                current_viewport_only=self.current_viewport_only,
+            )
+        elif self.observation_type == "accessibility_tree":
+            tree = await self.afetch_page_accessibility_tree(
+                browser_info,
+                client,
+                current_viewport_only=self.current_viewport_only,
+            )
         else:
             raise ValueError(
                 f"Invalid observatrion type: {self.observation_type}"
             )
+        return self.render_observation(tree, browser_info, tab_title_str)
+
+    def render_observation(
+        self,
+        tree: DOMTree | AccessibilityTree,
+        browser_info: BrowserInfo,
+        tab_title_str: str,
+    ) -> str:
+        if self.observation_type == "html":
+            content, obs_nodes_info = self.parse_html(tree)  # type: ignore[arg-type]
+        else:
+            content, obs_nodes_info = self.parse_accessibility_tree(
+                tree, self.render_cache  # type: ignore[arg-type]
+            )
+            # e.g. hover or a failed click, nothing to clean again
+            if content != self._prev_raw_content:
+                self._prev_raw_content = content
+                self._prev_clean_content = self.clean_accesibility_tree(
+                    content
+                )
+            content = self._prev_clean_content
+        self.obs_nodes_info = obs_nodes_info
+        self.meta_data["obs_nodes_info"] = obs_nodes_info
 
         self.browser_config = browser_info["config"]
         content = f"{tab_title_str}\n\n{content}"
@@ -664,6 +967,16 @@ class ImageObservationProcessor(ObservationProcessor):
             screenshot = png_bytes_to_numpy(page.screenshot())
         return screenshot
 
+    async def aprocess(
+        self, page: APage, client: ACDPSession
+    ) -> npt.NDArray[np.uint8]:
+        try:
+            screenshot = png_bytes_to_numpy(await page.screenshot())
+        except:
+            await page.wait_for_event("load")
+            screenshot = png_bytes_to_numpy(await page.screenshot())
+        return screenshot
+
 
 class ObservationHandler:
     """Main entry point to access all observation processor"""
@@ -715,6 +1028,13 @@ class ObservationHandler:
         image_obs = self.image_processor.process(page, client)
         return {"text": text_obs, "image": image_obs}
 
+    async def aget_observation(
+        self, page: APage, client: ACDPSession
+    ) -> dict[str, Observation]:
+        text_obs = await self.text_processor.aprocess(page, client)
+        image_obs = await self.image_processor.aprocess(page, client)
+        return {"text": text_obs, "image": image_obs}
+
     def get_observation_metadata(self) -> dict[str, ObservationMetadata]:
         return {
             "text": self.text_processor.meta_data,
@@ -0,0 +1,131 @@
+"""Wait until a page settled after an action instead of sleeping a fixed time.
+
+A page is settled when
+    - the pending navigation (if any) reached DOMContentLoaded,
+    - no request of the browser context is in flight and none started or
+      finished during the last `quiet_time` seconds,
+    - the DOM did not change during the last `quiet_time` seconds, as seen by a
+      MutationObserver injected into the page,
+or when `max_wait` seconds passed, whichever comes first.
+"""
+import asyncio
+import time
+from typing import Any
+
+from playwright.async_api import Page as APage
+from playwright.sync_api import Page
+
+# install the observer once per document, return ms since the last mutation
+MUTATION_QUIET_JS = """() => {
+    if (!window.__settleObserver) {
+        window.__lastMutation = performance.now();
+        window.__settleObserver = new MutationObserver(() => {
+            window.__lastMutation = performance.now();
+        });
+        window.__settleObserver.observe(document, {
+            subtree: true,
+            childList: true,
+            attributes: true,
+            characterData: true,
+        });
+    }
+    return performance.now() - window.__lastMutation;
+}"""
+
+# long lived connections that never finish
+IGNORED_RESOURCE_TYPES = {"websocket", "eventsource", "media"}
+
+
+class SettleDetector:
+    """Tracks the requests of a (sync or async) browser context, `wait` and
+    `async_wait` return the time it took the page to settle in seconds"""
+
+    def __init__(
+        self,
+        context: Any,
+        max_wait: float = 2.0,
+        quiet_time: float = 0.25,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self.context = context
+        self.max_wait = max_wait
+        self.quiet_time = quiet_time
+        self.poll_interval = poll_interval
+        self.inflight: set[Any] = set()
+        self.last_network_activity = time.monotonic()
+        context.on("request", self._on_request)
+        context.on("requestfinished", self._on_request_done)
+        context.on("requestfailed", self._on_request_done)
+
+    def close(self) -> None:
+        self.context.remove_listener("request", self._on_request)
+        self.context.remove_listener("requestfinished", self._on_request_done)
+        self.context.remove_listener("requestfailed", self._on_request_done)
+
+    def _on_request(self, request: Any) -> None:
+        if request.resource_type in IGNORED_RESOURCE_TYPES:
+            return
+        self.inflight.add(request)
+        self.last_network_activity = time.monotonic()
+
+    def _on_request_done(self, request: Any) -> None:
+        if request in self.inflight:
+            self.inflight.discard(request)
+            self.last_network_activity = time.monotonic()
+
+    def network_quiet(self) -> bool:
+        return (
+            not self.inflight
+            and time.monotonic() - self.last_network_activity
+            >= self.quiet_time
+        )
+
+    def wait(self, page: Page) -> float:
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                page.wait_for_load_state(
+                    "domcontentloaded", timeout=remaining * 1000
+                )
+                dom_quiet = (
+                    page.evaluate(MUTATION_QUIET_JS) >= self.quiet_time * 1000
+                )
+            except Exception:
+                # navigation in progress or timed out
+                dom_quiet = False
+            if dom_quiet and self.network_quiet():
+                break
+            # not time.sleep, playwright only dispatches the request events
+            # while the sync API waits
+            try:
+                page.wait_for_timeout(self.poll_interval * 1000)
+            except Exception:
+                # the page was closed
+                break
+        return time.monotonic() - start
+
+    async def async_wait(self, page: APage) -> float:
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await page.wait_for_load_state(
+                    "domcontentloaded", timeout=remaining * 1000
+                )
+                dom_quiet = (
+                    await page.evaluate(MUTATION_QUIET_JS)
+                    >= self.quiet_time * 1000
+                )
+            except Exception:
+                dom_quiet = False
+            if dom_quiet and self.network_quiet():
+                break
+            await asyncio.sleep(self.poll_interval)
+        return time.monotonic() - start
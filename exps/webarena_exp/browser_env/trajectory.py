@@ -1,6 +1,38 @@
+import sys
 from typing import Union
 
+import numpy as np
+
 from .actions import Action
-from .utils import StateInfo
+from .utils import DetachedPage, StateInfo
 
 Trajectory = list[Union[StateInfo, Action]]
+
+
+def trajectory_memory(trajectory: Trajectory) -> dict[str, int]:
+    """Bytes held in memory by the states of the trajectory"""
+    report = {
+        "states": 0,
+        "page_content": 0,
+        "text_observation": 0,
+        "image_observation": 0,
+    }
+    for state in trajectory:
+        if "observation" not in state:
+            continue
+        report["states"] += 1
+        page = state["info"].get("page")  # type: ignore[typeddict-item]
+        if isinstance(page, DetachedPage):
+            report["page_content"] += page.nbytes
+        observation = state["observation"]  # type: ignore[typeddict-item]
+        observations = (
+            observation.values()
+            if isinstance(observation, dict)
+            else [observation]
+        )
+        for obs in observations:
+            if isinstance(obs, np.ndarray):
+                report["image_observation"] += obs.nbytes
+            elif isinstance(obs, str):
+                report["text_observation"] += sys.getsizeof(obs)
+    return report
@@ -1,16 +1,69 @@
-from dataclasses import dataclass
+import sys
 from io import BytesIO
-from typing import Any, Dict, TypedDict, Union
+from pathlib import Path
+from typing import Any, Callable, Dict, TypedDict, Union
 
 import numpy as np
 import numpy.typing as npt
 from PIL import Image
 
 
-@dataclass
 class DetachedPage:
-    url: str
-    content: str  # html
+    """Url and html content of the page of one state in the trajectory.
+
+    The content is either kept in memory, read from the live page on first
+    access through `loader`, or read back from the file at `path` it was
+    spilled to. The loader is dropped by `detach` once the page moved on, the
+    content of such a state was never captured and is empty.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        content: str | None = None,
+        loader: Callable[[], str] | None = None,
+        path: Path | None = None,
+    ) -> None:
+        self.url = url
+        self._content = content
+        self._loader = loader
+        self.path = path
+
+    @property
+    def content(self) -> str:
+        if self._content is not None:
+            return self._content
+        if self._loader is not None:
+            try:
+                self._content = self._loader()
+            except Exception:
+                # the page or its context was closed
+                self._content = ""
+            self._loader = None
+            return self._content
+        if self.path is not None:
+            return self.path.read_text()
+        return ""
+
+    def detach(self) -> None:
+        self._loader = None
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the content"""
+        return 0 if self._content is None else sys.getsizeof(self._content)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # pickled for the vector envs, the loader can not cross processes
+        if self.path is not None:
+            return {"url": self.url, "path": self.path}
+        return {"url": self.url, "content": self.content}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(**state)  # type: ignore[misc]
+
+    def __repr__(self) -> str:
+        return f"DetachedPage(url={self.url!r})"
 
 
 def png_bytes_to_numpy(png: bytes) -> npt.NDArray[np.uint8]:
@@ -4,7 +4,6 @@ import collections
 import html
 import importlib
 import json
-import time
 import urllib
 from pathlib import Path
 from typing import Any, Tuple, Union
@@ -14,6 +13,7 @@ from nltk.tokenize import word_tokenize  # type: ignore
 from playwright.sync_api import CDPSession, Page
 
 from browser_env.actions import Action
+from browser_env.settle import SettleDetector
 from browser_env.utils import StateInfo
 from evaluation_harness.helper_functions import (
     PseudoPage,
@@ -131,7 +131,11 @@ class StringEvaluator(Evaluator):
             configs = json.load(f)
 
         last_action = self.get_last_action(trajectory)
-        pred = self.clean_answer(last_action["answer"])
+        return self.evaluate_answer(last_action["answer"], configs)
+
+    def evaluate_answer(self, answer: str, configs: dict[str, Any]) -> float:
+        """Score of the final answer of a task with config `configs`"""
+        pred = self.clean_answer(answer)
 
         score = 1.0
         for approach, value in configs["eval"]["reference_answers"].items():
@@ -269,8 +273,13 @@ class HTMLContentEvaluator(Evaluator):
 
             # navigate to that url
             if target_url != "last":
-                page.goto(target_url)
-                time.sleep(3)  # TODO [shuyanzh]: fix this hard-coded sleep
+                # wait until the page settled, at most 3 seconds
+                settle_detector = SettleDetector(page.context, max_wait=3.0)
+                try:
+                    page.goto(target_url)
+                    settle_detector.wait(page)
+                finally:
+                    settle_detector.close()
 
             # empty, use the full page
             if not locator.strip():
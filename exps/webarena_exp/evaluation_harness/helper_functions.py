@@ -15,10 +15,14 @@ from browser_env.env_config import (
     SHOPPING_ADMIN,
     WIKIPEDIA,
 )
+from evaluation_harness.judge_cache import get_judge_cache
+from llms.accounting import llm_context, record_external_call, track_call
 from llms.providers.openai_utils import (
     generate_from_openai_chat_completion,
 )
 
+LLM_JUDGE_MODEL = "gpt-4-1106-preview"
+
 
 def shopping_get_auth_token() -> str:
     response = requests.post(
@@ -143,6 +147,30 @@ def gitlab_get_project_memeber_role(page: Page, account_name: str) -> str:
     return role
 
 
+def llm_judge(kind: str, messages: list[dict[str, Any]]) -> str:
+    """Lowercased response of the LLM judge, memoized by `kind` and the
+    normalized `messages` in the judge cache"""
+    cache = get_judge_cache()
+    if cache is not None:
+        response = cache.get(kind, LLM_JUDGE_MODEL, messages)
+        if response is not None:
+            with llm_context(stage=kind):
+                record_external_call(LLM_JUDGE_MODEL, None, 0.0, cached=True)
+            return response
+    with llm_context(stage=kind), track_call(LLM_JUDGE_MODEL):
+        response = generate_from_openai_chat_completion(
+            model=LLM_JUDGE_MODEL,
+            messages=messages,
+            temperature=0,
+            max_tokens=768,
+            top_p=1.0,
+            context_length=0,
+        ).lower()
+    if cache is not None:
+        cache.put(kind, LLM_JUDGE_MODEL, messages, response)
+    return response
+
+
 def llm_fuzzy_match(pred: str, reference: str, question: str) -> float:
     """Check whether the prediction matches the reference with GPT4-turbo"""
     messages: list[dict[str, Any]] = []
@@ -158,14 +186,7 @@ def llm_fuzzy_match(pred: str, reference: str, question: str) -> float:
         {"role": "user", "content": message},
     ]
 
-    response = generate_from_openai_chat_completion(
-        model="gpt-4-1106-preview",
-        messages=messages,
-        temperature=0,
-        max_tokens=768,
-        top_p=1.0,
-        context_length=0,
-    ).lower()
+    response = llm_judge("fuzzy_match", messages)
     if "partially correct" in response or "incorrect" in response:
         return 0.0
     else:
@@ -193,14 +214,7 @@ def llm_ua_match(pred: str, reference: str, question: str) -> float:
         {"role": "user", "content": message},
     ]
 
-    response = generate_from_openai_chat_completion(
-        model="gpt-4-1106-preview",
-        messages=messages,
-        temperature=0,
-        max_tokens=768,
-        top_p=1.0,
-        context_length=0,
-    ).lower()
+    response = llm_judge("ua_match", messages)
     if "different" in response:
         return 0.0
     else:
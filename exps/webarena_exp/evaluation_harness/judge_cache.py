@@ -0,0 +1,111 @@
+"""Persistent cache of the LLM judge responses of fuzzy_match / ua_match.
+
+The raw response of the judge is stored rather than the score, so that a fix
+of how responses are turned into scores re-scores without any LLM call.
+Entries are keyed by the judge kind and model and the normalized messages
+sent to the judge, which hold both the prompt and the judged inputs, so a
+change of the judge prompts doesn't reuse the responses to the old ones.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
+
+# set to an empty string to disable the cache
+JUDGE_CACHE_PATH = os.environ.get(
+    "LLM_JUDGE_CACHE", "cache/llm_judge_cache.sqlite"
+)
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class JudgeCache:
+    def __init__(self, path: str | Path) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS judge_responses ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, model TEXT NOT NULL, "
+            "messages TEXT NOT NULL, response TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(kind: str, model: str, messages: list[dict[str, Any]]) -> str:
+        normalized = [
+            [message["role"], normalize(message["content"])]
+            for message in messages
+        ]
+        payload = json.dumps([kind, model, normalized])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(
+        self, kind: str, model: str, messages: list[dict[str, Any]]
+    ) -> str | None:
+        key = self.make_key(kind, model, messages)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM judge_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return str(row[0])
+
+    def put(
+        self,
+        kind: str,
+        model: str,
+        messages: list[dict[str, Any]],
+        response: str,
+    ) -> None:
+        key = self.make_key(kind, model, messages)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO judge_responses "
+                "(key, kind, model, messages, response) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, kind, model, json.dumps(messages), response),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_judge_cache: JudgeCache | None = None
+_judge_cache_lock = threading.Lock()
+
+
+def get_judge_cache() -> JudgeCache | None:
+    """The cache at JUDGE_CACHE_PATH, opened on first use"""
+    global _judge_cache
+    if not JUDGE_CACHE_PATH:
+        return None
+    with _judge_cache_lock:
+        if _judge_cache is None:
+            _judge_cache = JudgeCache(JUDGE_CACHE_PATH)
+        return _judge_cache
+
+
+def set_judge_cache(path: str | Path | None) -> None:
+    """Use the cache at `path` from now on, None to disable caching"""
+    global JUDGE_CACHE_PATH, _judge_cache
+    with _judge_cache_lock:
+        if _judge_cache is not None:
+            _judge_cache.close()
+        _judge_cache = None
+        JUDGE_CACHE_PATH = str(path) if path is not None else ""
@@ -0,0 +1,234 @@
+"""Token and latency accounting of the LLM calls of a run.
+
+Every call made through `call_llm` / `acall_llm`, the LLM judges of the
+evaluation harness and (through the usage hook of agent_eval.clients) the
+model-based evaluator is written as one JSON line to the metrics file:
+
+    {"stage": "agent_step", "task_id": "12", "model": "gpt-4",
+     "prompt_tokens": 2048, "completion_tokens": 128, "latency": 3.2,
+     "retries": 0, "cached": false, "error": null, "time": 1700000000.0}
+
+The stage (agent_step, reflection, evaluator, fuzzy_match, ...) and the task
+of a call come from the context set with `llm_context` / `set_task_id`, so
+they follow the call into threads started with `asyncio.to_thread` and into
+the tasks of `asyncio.gather`. Token counts the provider doesn't report
+(the prompt tokens of huggingface) are recorded as 0. See
+scripts/llm_usage_report.py for the report of a finished run.
+"""
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+_stage: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "llm_stage", default="unknown"
+)
+_task_id: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "llm_task_id", default=None
+)
+_call: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar(
+    "llm_call", default=None
+)
+
+# name of the metrics file in the result dir of a run
+LLM_USAGE_FILE = "llm_usage.jsonl"
+
+_metrics_file: Path | None = None
+_lock = threading.Lock()
+
+REPORT_FIELDS = [
+    "calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "latency",
+    "retries",
+    "cached",
+    "errors",
+]
+
+
+def set_metrics_file(path: str | Path | None) -> None:
+    """Append the records of the following calls to `path`, None to stop
+    recording"""
+    global _metrics_file
+    _metrics_file = Path(path) if path is not None else None
+
+
+def set_task_id(task_id: str | None) -> None:
+    """Account the following calls of the current context to `task_id`"""
+    _task_id.set(task_id)
+
+
+def get_task_id() -> str | None:
+    return _task_id.get()
+
+
+@contextlib.contextmanager
+def llm_context(
+    stage: str | None = None, task_id: str | None = None
+) -> Iterator[None]:
+    """Account the calls made inside the block to `stage` and `task_id`,
+    the ones that are None are inherited from the enclosing context"""
+    tokens = []
+    if stage is not None:
+        tokens.append((_stage, _stage.set(stage)))
+    if task_id is not None:
+        tokens.append((_task_id, _task_id.set(task_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)  # type: ignore[attr-defined]
+
+
+def write_record(record: dict[str, Any]) -> None:
+    if _metrics_file is None:
+        return
+    record = {
+        "stage": _stage.get(),
+        "task_id": _task_id.get(),
+        **record,
+        "time": time.time(),
+    }
+    with _lock:
+        with open(_metrics_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+@contextlib.contextmanager
+def track_call(model: str) -> Iterator[dict[str, Any]]:
+    """Time the LLM call made inside the block and write its record, the
+    provider adds the usage with `record_usage` and `record_retry`. A block
+    nested in another one is accounted to the outer call."""
+    call = _call.get()
+    if call is not None:
+        yield call
+        return
+    call = {
+        "model": model,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "latency": 0.0,
+        "retries": 0,
+        "cached": False,
+        "error": None,
+    }
+    token = _call.set(call)
+    start_t = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call["error"] = repr(e)
+        raise
+    finally:
+        _call.reset(token)
+        call["latency"] = time.perf_counter() - start_t
+        write_record(call)
+
+
+def record_usage(usage: dict[str, Any] | None) -> None:
+    """Add the usage block of a response to the current call"""
+    call = _call.get()
+    if call is None or not usage:
+        return
+    call["prompt_tokens"] += usage.get("prompt_tokens", 0)
+    call["completion_tokens"] += usage.get("completion_tokens", 0)
+
+
+def record_retry() -> None:
+    call = _call.get()
+    if call is not None:
+        call["retries"] += 1
+
+
+def record_external_call(
+    model: str,
+    usage: dict[str, Any] | None,
+    latency: float,
+    retries: int = 0,
+    cached: bool = False,
+    error: str | None = None,
+) -> None:
+    """Usage hook of agent_eval.clients, see `add_usage_hook`"""
+    usage = usage or {}
+    write_record(
+        {
+            "model": model,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "latency": latency,
+            "retries": retries,
+            "cached": cached,
+            "error": error,
+        }
+    )
+
+
+def load_records(path: str | Path) -> list[dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def usage_report(
+    records: Iterable[dict[str, Any]]
+) -> dict[str, dict[str, dict[str, float]]]:
+    """Totals of REPORT_FIELDS per task, per stage and overall ("all").
+    The tokens of cached responses are not counted, they cost nothing."""
+    report: dict[str, dict[str, dict[str, float]]] = {
+        "task": defaultdict(lambda: dict.fromkeys(REPORT_FIELDS, 0)),
+        "stage": defaultdict(lambda: dict.fromkeys(REPORT_FIELDS, 0)),
+        "all": defaultdict(lambda: dict.fromkeys(REPORT_FIELDS, 0)),
+    }
+    for record in records:
+        keys = [
+            ("task", str(record["task_id"])),
+            ("stage", record["stage"]),
+            ("all", "all"),
+        ]
+        for group, key in keys:
+            totals = report[group][key]
+            totals["calls"] += 1
+            totals["latency"] += record["latency"]
+            totals["retries"] += record["retries"]
+            totals["errors"] += record["error"] is not None
+            if record["cached"]:
+                totals["cached"] += 1
+            else:
+                totals["prompt_tokens"] += record["prompt_tokens"]
+                totals["completion_tokens"] += record["completion_tokens"]
+    return {group: dict(totals) for group, totals in report.items()}
+
+
+def format_usage_report(
+    report: dict[str, dict[str, dict[str, float]]], max_tasks: int = 20
+) -> str:
+    """A table per stage, the `max_tasks` tasks with the most prompt tokens
+    and the total"""
+    lines = [f"{'':<24}" + "".join(f"{field:>18}" for field in REPORT_FIELDS)]
+
+    def add_rows(name: str, rows: list[tuple[str, dict[str, float]]]) -> None:
+        lines.append(f"[{name}]")
+        for key, totals in rows:
+            lines.append(
+                f"{key:<24}"
+                + "".join(
+                    f"{totals[field]:>18.1f}"
+                    if field == "latency"
+                    else f"{int(totals[field]):>18}"
+                    for field in REPORT_FIELDS
+                )
+            )
+
+    add_rows("stage", sorted(report["stage"].items()))
+    tasks = sorted(
+        report["task"].items(),
+        key=lambda item: item[1]["prompt_tokens"],
+        reverse=True,
+    )
+    add_rows("task", tasks[:max_tasks])
+    add_rows("all", list(report["all"].items()))
+    return "\n".join(lines)
@@ -54,4 +54,13 @@ def construct_llm_config(args: argparse.Namespace) -> LMConfig:
         llm_config.gen_config["max_retry"] = args.max_retry
     else:
         raise NotImplementedError(f"provider {args.provider} not implemented")
+    llm_config.gen_config["observation_diff"] = getattr(
+        args, "observation_diff", False
+    )
+    llm_config.gen_config["requests_per_minute"] = getattr(
+        args, "requests_per_minute", 300
+    )
+    llm_config.gen_config["stream_actions"] = getattr(
+        args, "stream_actions", False
+    )
     return llm_config
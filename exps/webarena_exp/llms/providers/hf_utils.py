@@ -1,5 +1,7 @@
 from text_generation import Client  # type: ignore
 
+from llms.accounting import record_usage
+
 
 def generate_from_huggingface_completion(
     prompt: str,
@@ -10,12 +12,16 @@ def generate_from_huggingface_completion(
     stop_sequences: list[str] | None = None,
 ) -> str:
     client = Client(model_endpoint, timeout=60)
-    generation: str = client.generate(
+    response = client.generate(
         prompt=prompt,
         temperature=temperature,
         top_p=top_p,
         max_new_tokens=max_new_tokens,
         stop_sequences=stop_sequences,
-    ).generated_text
+    )
+    # the server reports the generated tokens only
+    if response.details is not None:
+        record_usage({"completion_tokens": response.details.generated_tokens})
+    generation: str = response.generated_text
 
     return generation
@@ -6,13 +6,15 @@ import logging
 import os
 import random
 import time
-from typing import Any
+from typing import Any, AsyncIterator, Callable, Iterator
 
 import aiolimiter
 import openai
 import openai.error
 from tqdm.asyncio import tqdm_asyncio
 
+from llms.accounting import record_retry, record_usage
+
 
 def retry_with_exponential_backoff(  # type: ignore
     func,
@@ -37,6 +39,7 @@ def retry_with_exponential_backoff(  # type: ignore
             except errors as e:
                 # Increment retries
                 num_retries += 1
+                record_retry()
 
                 # Check if max retries has been reached
                 if num_retries > max_retries:
@@ -57,6 +60,52 @@ def retry_with_exponential_backoff(  # type: ignore
     return wrapper
 
 
+def _chunk_text(chunk: dict[str, Any]) -> str:
+    choice = chunk["choices"][0] if chunk["choices"] else {}
+    if "delta" in choice:
+        return choice["delta"].get("content") or ""
+    return choice.get("text") or ""
+
+
+def _read_stream(
+    stream: Iterator[dict[str, Any]], should_stop: Callable[[str], bool]
+) -> str:
+    """Concatenate the streamed chunks until `should_stop(text so far)`.
+    Closing the stream early drops the connection, which makes the server
+    stop generating. Streams report no usage, the caller counts the tokens
+    of the prompt and the answer."""
+    answer = ""
+    try:
+        for chunk in stream:
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            answer += text
+            if should_stop(answer):
+                break
+    finally:
+        stream.close()  # type: ignore[attr-defined]
+    return answer
+
+
+async def _aread_stream(
+    stream: AsyncIterator[dict[str, Any]], should_stop: Callable[[str], bool]
+) -> str:
+    """Async _read_stream"""
+    answer = ""
+    try:
+        async for chunk in stream:
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            answer += text
+            if should_stop(answer):
+                break
+    finally:
+        await stream.aclose()  # type: ignore[attr-defined]
+    return answer
+
+
 async def _throttled_openai_completion_acreate(
     engine: str,
     prompt: str,
@@ -64,26 +113,39 @@ async def _throttled_openai_completion_acreate(
     max_tokens: int,
     top_p: float,
     limiter: aiolimiter.AsyncLimiter,
+    stop_token: str | None = None,
+    should_stop: Callable[[str], bool] | None = None,
 ) -> dict[str, Any]:
+    """Requests failing with a rate limit error are tried 3 times, then the
+    error is raised like the other API errors, as in the sync
+    generate_from_openai_completion"""
     async with limiter:
-        for _ in range(3):
+        num_retries = 0
+        while True:
             try:
-                return await openai.Completion.acreate(  # type: ignore
+                response = await openai.Completion.acreate(  # type: ignore
                     engine=engine,
                     prompt=prompt,
                     temperature=temperature,
                     max_tokens=max_tokens,
                     top_p=top_p,
+                    stop=[stop_token] if stop_token else None,
+                    stream=should_stop is not None,
                 )
+                if should_stop is not None:
+                    text = await _aread_stream(response, should_stop)
+                    return {"choices": [{"text": text}]}
+                record_usage(response.get("usage"))
+                return response  # type: ignore[no-any-return]
             except openai.error.RateLimitError:
+                num_retries += 1
+                if num_retries == 3:
+                    raise
                 logging.warning(
                     "OpenAI API rate limit exceeded. Sleeping for 10 seconds."
                 )
+                record_retry()
                 await asyncio.sleep(10)
-            except openai.error.APIError as e:
-                logging.warning(f"OpenAI API error: {e}")
-                break
-        return {"choices": [{"message": {"content": ""}}]}
 
 
 async def agenerate_from_openai_completion(
@@ -94,6 +156,10 @@ async def agenerate_from_openai_completion(
     top_p: float,
     context_length: int,
     requests_per_minute: int = 300,
+    limiter: aiolimiter.AsyncLimiter | None = None,
+    progress: bool = True,
+    stop_token: str | None = None,
+    should_stop: Callable[[str], bool] | None = None,
 ) -> list[str]:
     """Generate from OpenAI Completion API.
 
@@ -104,6 +170,11 @@ async def agenerate_from_openai_completion(
         top_p: Top p to use.
         context_length: Length of context to use.
         requests_per_minute: Number of requests per minute to allow.
+        limiter: Limiter shared with other calls, overrides requests_per_minute.
+        progress: Show a progress bar.
+        stop_token: Stop generating at this token.
+        should_stop: Stream the responses and stop generating one as soon
+            as it holds for the text generated so far.
 
     Returns:
         List of generated responses.
@@ -115,7 +186,8 @@ async def agenerate_from_openai_completion(
     openai.api_key = os.environ["OPENAI_API_KEY"]
     openai.organization = os.environ.get("OPENAI_ORGANIZATION", "")
 
-    limiter = aiolimiter.AsyncLimiter(requests_per_minute)
+    if limiter is None:
+        limiter = aiolimiter.AsyncLimiter(requests_per_minute)
     async_responses = [
         _throttled_openai_completion_acreate(
             engine=engine,
@@ -124,10 +196,14 @@ async def agenerate_from_openai_completion(
             max_tokens=max_tokens,
             top_p=top_p,
             limiter=limiter,
+            stop_token=stop_token,
+            should_stop=should_stop,
         )
         for prompt in prompts
     ]
-    responses = await tqdm_asyncio.gather(*async_responses)
+    responses = await tqdm_asyncio.gather(
+        *async_responses, disable=not progress
+    )
     return [x["choices"][0]["text"] for x in responses]
 
 
@@ -140,7 +216,10 @@ def generate_from_openai_completion(
     top_p: float,
     context_length: int,
     stop_token: str | None = None,
+    should_stop: Callable[[str], bool] | None = None,
 ) -> str:
+    """With `should_stop`, stream the response and stop generating as soon
+    as it holds for the text generated so far"""
     if "OPENAI_API_KEY" not in os.environ:
         raise ValueError(
             "OPENAI_API_KEY environment variable must be set when using OpenAI API."
@@ -154,7 +233,11 @@ def generate_from_openai_completion(
         max_tokens=max_tokens,
         top_p=top_p,
         stop=[stop_token],
+        stream=should_stop is not None,
     )
+    if should_stop is not None:
+        return _read_stream(response, should_stop)
+    record_usage(response.get("usage"))
     answer: str = response["choices"][0]["text"]
     return answer
 
@@ -166,29 +249,44 @@ async def _throttled_openai_chat_completion_acreate(
     max_tokens: int,
     top_p: float,
     limiter: aiolimiter.AsyncLimiter,
+    should_stop: Callable[[str], bool] | None = None,
 ) -> dict[str, Any]:
+    """Requests failing with a rate limit error or a timeout are tried 3
+    times, then the error is raised like the other API errors, as in the
+    sync generate_from_openai_chat_completion"""
     async with limiter:
-        for _ in range(3):
+        num_retries = 0
+        while True:
             try:
-                return await openai.ChatCompletion.acreate(  # type: ignore
+                response = await openai.ChatCompletion.acreate(  # type: ignore
                     model=model,
                     messages=messages,
                     temperature=temperature,
                     max_tokens=max_tokens,
                     top_p=top_p,
+                    stream=should_stop is not None,
                 )
+                if should_stop is not None:
+                    text = await _aread_stream(response, should_stop)
+                    return {"choices": [{"message": {"content": text}}]}
+                record_usage(response.get("usage"))
+                return response  # type: ignore[no-any-return]
             except openai.error.RateLimitError:
+                num_retries += 1
+                if num_retries == 3:
+                    raise
                 logging.warning(
                     "OpenAI API rate limit exceeded. Sleeping for 10 seconds."
                 )
+                record_retry()
                 await asyncio.sleep(10)
             except asyncio.exceptions.TimeoutError:
+                num_retries += 1
+                if num_retries == 3:
+                    raise
                 logging.warning("OpenAI API timeout. Sleeping for 10 seconds.")
+                record_retry()
                 await asyncio.sleep(10)
-            except openai.error.APIError as e:
-                logging.warning(f"OpenAI API error: {e}")
-                break
-        return {"choices": [{"message": {"content": ""}}]}
 
 
 async def agenerate_from_openai_chat_completion(
@@ -199,6 +297,9 @@ async def agenerate_from_openai_chat_completion(
     top_p: float,
     context_length: int,
     requests_per_minute: int = 300,
+    limiter: aiolimiter.AsyncLimiter | None = None,
+    progress: bool = True,
+    should_stop: Callable[[str], bool] | None = None,
 ) -> list[str]:
     """Generate from OpenAI Chat Completion API.
 
@@ -209,6 +310,10 @@ async def agenerate_from_openai_chat_completion(
         top_p: Top p to use.
         context_length: Length of context to use.
         requests_per_minute: Number of requests per minute to allow.
+        limiter: Limiter shared with other calls, overrides requests_per_minute.
+        progress: Show a progress bar.
+        should_stop: Stream the responses and stop generating one as soon
+            as it holds for the text generated so far.
 
     Returns:
         List of generated responses.
@@ -220,7 +325,8 @@ async def agenerate_from_openai_chat_completion(
     openai.api_key = os.environ["OPENAI_API_KEY"]
     openai.organization = os.environ.get("OPENAI_ORGANIZATION", "")
 
-    limiter = aiolimiter.AsyncLimiter(requests_per_minute)
+    if limiter is None:
+        limiter = aiolimiter.AsyncLimiter(requests_per_minute)
     async_responses = [
         _throttled_openai_chat_completion_acreate(
             model=engine,
@@ -229,10 +335,13 @@ async def agenerate_from_openai_chat_completion(
             max_tokens=max_tokens,
             top_p=top_p,
             limiter=limiter,
+            should_stop=should_stop,
         )
         for message in messages_list
     ]
-    responses = await tqdm_asyncio.gather(*async_responses)
+    responses = await tqdm_asyncio.gather(
+        *async_responses, disable=not progress
+    )
     return [x["choices"][0]["message"]["content"] for x in responses]
 
 
@@ -245,7 +354,10 @@ def generate_from_openai_chat_completion(
     top_p: float,
     context_length: int,
     stop_token: str | None = None,
+    should_stop: Callable[[str], bool] | None = None,
 ) -> str:
+    """With `should_stop`, stream the response and stop generating as soon
+    as it holds for the text generated so far"""
     if "OPENAI_API_KEY" not in os.environ:
         raise ValueError(
             "OPENAI_API_KEY environment variable must be set when using OpenAI API."
@@ -260,7 +372,11 @@ def generate_from_openai_chat_completion(
         max_tokens=max_tokens,
         top_p=top_p,
         stop=[stop_token] if stop_token else None,
+        stream=should_stop is not None,
     )
+    if should_stop is not None:
+        return _read_stream(response, should_stop)
+    record_usage(response.get("usage"))
     answer: str = response["choices"][0]["message"]["content"]
     return answer
 
@@ -3,6 +3,10 @@ from typing import Any
 import tiktoken
 from transformers import LlamaTokenizer  # type: ignore
 
+# tokens at the end of an encoded prefix that may differ from the encoding of
+# the full text, the cut can fall in the middle of a token
+TRUNCATE_MARGIN = 32
+
 
 class Tokenizer(object):
     def __init__(self, provider: str, model_name: str) -> None:
@@ -16,6 +20,7 @@ class Tokenizer(object):
             self.tokenizer.add_eos_token = False  # type: ignore[attr-defined]
         else:
             raise NotImplementedError
+        self.name = f"{provider}/{model_name}"
 
     def encode(self, text: str) -> list[int]:
         return self.tokenizer.encode(text)
@@ -23,5 +28,21 @@ class Tokenizer(object):
     def decode(self, ids: list[int]) -> str:
         return self.tokenizer.decode(ids)
 
+    def truncate(self, text: str, max_length: int) -> tuple[str, int]:
+        """The first `max_length` tokens of the text and their count.
+
+        Only a prefix of the text is encoded, it is doubled until it has more
+        than `max_length` + TRUNCATE_MARGIN tokens or covers the whole text.
+        """
+        length = max_length * 4
+        while True:
+            ids = self.encode(text[:length])
+            if length >= len(text) or len(ids) > max_length + TRUNCATE_MARGIN:
+                break
+            length *= 2
+        if len(ids) <= max_length:
+            return text, len(ids)
+        return self.decode(ids[:max_length]), max_length
+
     def __call__(self, text: str) -> list[int]:
         return self.tokenizer.encode(text)
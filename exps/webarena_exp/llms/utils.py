@@ -1,6 +1,8 @@
 import argparse
-from typing import Any
-import time
+import asyncio
+from typing import Any, Callable
+
+import aiolimiter
 
 from llms import (
     generate_from_huggingface_completion,
@@ -8,6 +10,11 @@ from llms import (
     generate_from_openai_completion,
     lm_config,
 )
+from llms.accounting import track_call
+from llms.providers.openai_utils import (
+    agenerate_from_openai_chat_completion,
+    agenerate_from_openai_completion,
+)
 
 APIInput = str | list[Any] | dict[str, Any]
 
@@ -15,49 +22,104 @@ APIInput = str | list[Any] | dict[str, Any]
 def call_llm(
     lm_config: lm_config.LMConfig,
     prompt: APIInput,
+    should_stop: Callable[[str], bool] | None = None,
 ) -> str:
+    """With `should_stop`, the OpenAI responses are streamed and cut as soon
+    as it holds for the text generated so far, e.g. once the action was
+    emitted. The other providers always return the full response."""
     response: str
-    start_t = time.time()
-    if lm_config.provider == "openai":
-        if lm_config.mode == "chat":
-            assert isinstance(prompt, list)
-            response = generate_from_openai_chat_completion(
-                messages=prompt,
-                model=lm_config.model,
-                temperature=lm_config.gen_config["temperature"],
-                top_p=lm_config.gen_config["top_p"],
-                context_length=lm_config.gen_config["context_length"],
-                max_tokens=lm_config.gen_config["max_tokens"],
-                stop_token=None,
-            )
-        elif lm_config.mode == "completion":
+    with track_call(lm_config.model):
+        if lm_config.provider == "openai":
+            if lm_config.mode == "chat":
+                assert isinstance(prompt, list)
+                response = generate_from_openai_chat_completion(
+                    messages=prompt,
+                    model=lm_config.model,
+                    temperature=lm_config.gen_config["temperature"],
+                    top_p=lm_config.gen_config["top_p"],
+                    context_length=lm_config.gen_config["context_length"],
+                    max_tokens=lm_config.gen_config["max_tokens"],
+                    stop_token=None,
+                    should_stop=should_stop,
+                )
+            elif lm_config.mode == "completion":
+                assert isinstance(prompt, str)
+                response = generate_from_openai_completion(
+                    prompt=prompt,
+                    engine=lm_config.model,
+                    temperature=lm_config.gen_config["temperature"],
+                    max_tokens=lm_config.gen_config["max_tokens"],
+                    top_p=lm_config.gen_config["top_p"],
+                    stop_token=lm_config.gen_config["stop_token"],
+                    should_stop=should_stop,
+                )
+            else:
+                raise ValueError(
+                    f"OpenAI models do not support mode {lm_config.mode}"
+                )
+        elif lm_config.provider == "huggingface":
             assert isinstance(prompt, str)
-            response = generate_from_openai_completion(
+            response = generate_from_huggingface_completion(
                 prompt=prompt,
-                engine=lm_config.model,
+                model_endpoint=lm_config.gen_config["model_endpoint"],
                 temperature=lm_config.gen_config["temperature"],
-                max_tokens=lm_config.gen_config["max_tokens"],
                 top_p=lm_config.gen_config["top_p"],
-                stop_token=lm_config.gen_config["stop_token"],
+                stop_sequences=lm_config.gen_config["stop_sequences"],
+                max_new_tokens=lm_config.gen_config["max_new_tokens"],
+            )
+        else:
+            raise NotImplementedError(
+                f"Provider {lm_config.provider} not implemented"
             )
+
+    return response
+
+
+async def acall_llm(
+    lm_config: lm_config.LMConfig,
+    prompt: APIInput,
+    limiter: aiolimiter.AsyncLimiter | None = None,
+    should_stop: Callable[[str], bool] | None = None,
+) -> str:
+    """Async call_llm, the OpenAI requests of all the callers sharing
+    `limiter` are throttled together. Other providers run call_llm in a
+    thread."""
+    response: str
+    with track_call(lm_config.model):
+        if lm_config.provider == "openai":
+            if lm_config.mode == "chat":
+                assert isinstance(prompt, list)
+                [response] = await agenerate_from_openai_chat_completion(
+                    messages_list=[prompt],
+                    engine=lm_config.model,
+                    temperature=lm_config.gen_config["temperature"],
+                    max_tokens=lm_config.gen_config["max_tokens"],
+                    top_p=lm_config.gen_config["top_p"],
+                    context_length=lm_config.gen_config["context_length"],
+                    limiter=limiter,
+                    progress=False,
+                    should_stop=should_stop,
+                )
+            elif lm_config.mode == "completion":
+                assert isinstance(prompt, str)
+                [response] = await agenerate_from_openai_completion(
+                    prompts=[prompt],
+                    engine=lm_config.model,
+                    temperature=lm_config.gen_config["temperature"],
+                    max_tokens=lm_config.gen_config["max_tokens"],
+                    top_p=lm_config.gen_config["top_p"],
+                    context_length=lm_config.gen_config["context_length"],
+                    limiter=limiter,
+                    progress=False,
+                    stop_token=lm_config.gen_config["stop_token"],
+                    should_stop=should_stop,
+                )
+            else:
+                raise ValueError(
+                    f"OpenAI models do not support mode {lm_config.mode}"
+                )
         else:
-            raise ValueError(
-                f"OpenAI models do not support mode {lm_config.mode}"
+            response = await asyncio.to_thread(
+                call_llm, lm_config, prompt, should_stop
             )
-    elif lm_config.provider == "huggingface":
-        assert isinstance(prompt, str)
-        response = generate_from_huggingface_completion(
-            prompt=prompt,
-            model_endpoint=lm_config.gen_config["model_endpoint"],
-            temperature=lm_config.gen_config["temperature"],
-            top_p=lm_config.gen_config["top_p"],
-            stop_sequences=lm_config.gen_config["stop_sequences"],
-            max_new_tokens=lm_config.gen_config["max_new_tokens"],
-        )
-    else:
-        raise NotImplementedError(
-            f"Provider {lm_config.provider} not implemented"
-        )
-
-    print(f"Calling LLM takes: {time.time() - start_t:.2f}s")
     return response
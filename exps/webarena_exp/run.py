@@ -5,10 +5,9 @@ import json
 import logging
 import os
 import random
-import subprocess
-import tempfile
 import time
 from pathlib import Path
+from typing import Any
 
 import openai
 
@@ -26,14 +25,27 @@ from browser_env import (
     StateInfo,
     Trajectory,
     create_stop_action,
+    trajectory_memory,
 )
 from browser_env.actions import is_equivalent
-from browser_env.auto_login import get_site_comb_from_filepath
+from browser_env.auto_login import (
+    StorageStateCache,
+    get_site_comb_from_filepath,
+)
 from browser_env.helper_functions import (
+    RENDER_IMAGE_DIR,
     RenderHelper,
     get_action_description,
 )
 from evaluation_harness import evaluator_router
+from llms.accounting import (
+    LLM_USAGE_FILE,
+    format_usage_report,
+    load_records,
+    set_metrics_file,
+    set_task_id,
+    usage_report,
+)
 
 LOG_FOLDER = "log_files"
 Path(LOG_FOLDER).mkdir(parents=True, exist_ok=True)
@@ -87,6 +99,52 @@ def config() -> argparse.Namespace:
     parser.add_argument("--viewport_height", type=int, default=720)
     parser.add_argument("--save_trace_enabled", action="store_true")
     parser.add_argument("--sleep_after_execution", type=float, default=0.0)
+    parser.add_argument(
+        "--settle_mode",
+        type=str,
+        default="adaptive",
+        choices=["adaptive", "sleep"],
+        help="adaptive: wait until the page settled after an action, for at "
+        "most --sleep_after_execution seconds; sleep: always sleep that long",
+    )
+    parser.add_argument(
+        "--page_content_mode",
+        type=str,
+        default="lazy",
+        choices=["eager", "lazy", "disk"],
+        help="How the html of every state is kept, lazy only reads the pages "
+        "that are used, e.g. the final one by the evaluators",
+    )
+    parser.add_argument(
+        "--page_content_dir",
+        type=str,
+        default=None,
+        help="Where the html is written with --page_content_mode disk, "
+        "a temporary directory removed at the end by default",
+    )
+    parser.add_argument(
+        "--auth_folder",
+        type=str,
+        default="./.auth",
+        help="Folder of the login states, expired ones are renewed in place",
+    )
+    parser.add_argument(
+        "--storage_state_ttl",
+        type=float,
+        default=1800,
+        help="Seconds a login state is used before checking whether it expired",
+    )
+    parser.add_argument(
+        "--reuse_browser",
+        action="store_true",
+        help="Keep one browser process across tasks, only the browser context is recreated",
+    )
+    parser.add_argument(
+        "--recycle_browser_after",
+        type=int,
+        default=50,
+        help="With --reuse_browser, relaunch the browser after this many tasks (0 for never)",
+    )
 
     parser.add_argument("--max_steps", type=int, default=30)
 
@@ -131,6 +189,12 @@ def config() -> argparse.Namespace:
         help="when not zero, will truncate the observation to this length before feeding to the model",
         default=1920,
     )
+    parser.add_argument(
+        "--stream_actions",
+        action="store_true",
+        help="stream the completions of the agent and stop generating once "
+        "they hold a complete action, openai only",
+    )
     parser.add_argument(
         "--model_endpoint",
         help="huggingface model endpoint",
@@ -142,6 +206,26 @@ def config() -> argparse.Namespace:
     parser.add_argument("--test_start_idx", type=int, default=0)
     parser.add_argument("--test_end_idx", type=int, default=1000)
 
+    # concurrency, used by run_concurrent.py
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=8,
+        help="Number of tasks run at the same time, each with its own browser",
+    )
+    parser.add_argument(
+        "--max_per_site",
+        type=int,
+        default=4,
+        help="Maximum number of running tasks that use the same website",
+    )
+    parser.add_argument(
+        "--requests_per_minute",
+        type=int,
+        default=300,
+        help="Limit of the LLM requests of all the running tasks together",
+    )
+
     # logging related
     parser.add_argument("--result_dir", type=str, default="")
     args = parser.parse_args()
@@ -214,6 +298,36 @@ def early_stop(
     return False, ""
 
 
+def record_step(
+    records: dict[str, Any], state_info: StateInfo
+) -> dict[str, Any]:
+    """Add the observation as a new step of the trajectory record"""
+    step = {
+        "img": None,
+        "accessibility_tree": state_info["observation"]["text"],
+        "url": state_info["info"]["page"].url,
+    }
+    records["steps"].append(step)
+    return step
+
+
+def save_records(
+    result_dir: str, records: dict[str, Any], score: float
+) -> None:
+    """Save the trajectory in the unified dataset schema with the evaluation
+    result inline, the images are the screenshots in records["image_dir"]"""
+    records["oracle_score"] = score
+    records["score"] = score
+    records["status"] = "PASSED" if score == 1 else "FAILED"
+    records["score_source"] = "gt"
+    record_dir = Path(result_dir) / "records"
+    record_dir.mkdir(exist_ok=True)
+    with open(
+        record_dir / f"{records['uid']}_{records['trail_idx']}.json", "w"
+    ) as f:
+        json.dump(records, f, indent=4)
+
+
 def test(
     args: argparse.Namespace,
     agent: Agent | PromptAgent | TeacherForcingAgent,
@@ -238,7 +352,17 @@ def test(
         },
         save_trace_enabled=args.save_trace_enabled,
         sleep_after_execution=args.sleep_after_execution,
+        adaptive_settle=args.settle_mode == "adaptive",
+        page_content_mode=args.page_content_mode,
+        page_content_dir=args.page_content_dir,
+        reuse_browser=args.reuse_browser,
+        recycle_browser_after=args.recycle_browser_after,
+    )
+    storage_state_cache = StorageStateCache(
+        args.auth_folder, ttl=args.storage_state_ttl
     )
+    usage_file = Path(args.result_dir) / LLM_USAGE_FILE
+    set_metrics_file(usage_file)
 
     for config_file in config_file_list:
         try:
@@ -251,37 +375,34 @@ def test(
                 _c = json.load(f)
                 intent = _c["intent"]
                 task_id = _c["task_id"]
-                # automatically login
-                if _c["storage_state"]:
-                    cookie_file_name = os.path.basename(_c["storage_state"])
-                    comb = get_site_comb_from_filepath(cookie_file_name)
-                    temp_dir = tempfile.mkdtemp()
-                    # subprocess to renew the cookie
-                    subprocess.run(
-                        [
-                            "python",
-                            "browser_env/auto_login.py",
-                            "--auth_folder",
-                            temp_dir,
-                            "--site_list",
-                            *comb,
-                        ]
-                    )
-                    _c["storage_state"] = f"{temp_dir}/{cookie_file_name}"
-                    assert os.path.exists(_c["storage_state"])
-                    # update the config file
-                    config_file = f"{temp_dir}/{os.path.basename(config_file)}"
-                    with open(config_file, "w") as f:
-                        json.dump(_c, f)
+            set_task_id(str(task_id))
+            reset_options = {"config_file": config_file}
+            # automatically login, the cookies are only renewed when expired
+            if _c["storage_state"]:
+                comb = get_site_comb_from_filepath(_c["storage_state"])
+                reset_options["storage_state"] = storage_state_cache.get(
+                    comb, env.browser if env.browser_launched else None
+                )
 
             logger.info(f"[Config file]: {config_file}")
             logger.info(f"[Intent]: {intent}")
 
+            records: dict[str, Any] = {
+                "uid": task_id,
+                "trail_idx": 0,
+                "intent": intent,
+                "response": "",
+                "steps": [],
+                "image_dir": RENDER_IMAGE_DIR,
+                "other": {"config": _c},
+            }
+
             agent.reset(config_file)
             trajectory: Trajectory = []
-            obs, info = env.reset(options={"config_file": config_file})
+            obs, info = env.reset(options=reset_options)
             state_info: StateInfo = {"observation": obs, "info": info}
             trajectory.append(state_info)
+            step = record_step(records, state_info)
 
             meta_data = {"action_history": ["None"]}
             while True:
@@ -310,24 +431,56 @@ def test(
                     if isinstance(agent, PromptAgent)
                     else None,
                 )
-                render_helper.render(
+                img_path = render_helper.render(
                     action, state_info, meta_data, args.render_screenshot
                 )
                 meta_data["action_history"].append(action_str)
                 print(meta_data)
+                if img_path:
+                    step["img"] = os.path.basename(img_path)
+                step["other"] = {
+                    "raw_action": action_str,
+                    "raw_prediction": action.get("raw_prediction", ""),
+                }
 
                 if action["action_type"] == ActionTypes.STOP:
+                    records["response"] = action["answer"]
                     break
 
                 obs, _, terminated, _, info = env.step(action)
                 state_info = {"observation": obs, "info": info}
                 trajectory.append(state_info)
+                step = record_step(records, state_info)
 
                 if terminated:
                     # add a action place holder
                     trajectory.append(create_stop_action(""))
+                    if args.render_screenshot:
+                        step["img"] = os.path.basename(
+                            render_helper.save_screenshot(obs["image"])
+                        )
+                    step["other"] = {"raw_action": "stop []"}
                     break
 
+            settle_times = [
+                s["info"].get("settle_time", 0.0)
+                for s in trajectory
+                if "info" in s
+            ]
+            logger.info(
+                f"[Settle time] {sum(settle_times):.1f}s over "
+                f"{len(settle_times)} observations"
+            )
+            memory = trajectory_memory(trajectory)
+            logger.info(
+                f"[Trajectory memory] {memory['states']} states, "
+                + ", ".join(
+                    f"{k} {v / 2**20:.1f}MB"
+                    for k, v in memory.items()
+                    if k != "states"
+                )
+            )
+
             evaluator = evaluator_router(config_file)
             score = evaluator(
                 trajectory=trajectory,
@@ -337,6 +490,7 @@ def test(
             )
 
             scores.append(score)
+            save_records(args.result_dir, records, score)
 
             if score == 1:
                 logger.info(f"[Result] (PASS) {config_file}")
@@ -364,6 +518,11 @@ def test(
 
     env.close()
     logger.info(f"Average score: {sum(scores) / len(scores)}")
+    if usage_file.exists():
+        logger.info(
+            "[LLM usage]\n"
+            + format_usage_report(usage_report(load_records(usage_file)))
+        )
 
 
 def prepare(args: argparse.Namespace) -> None:
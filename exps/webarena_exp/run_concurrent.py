@@ -0,0 +1,549 @@
+"""Run the benchmark with several tasks in flight in one process.
+
+Every worker drives its own AsyncScriptBrowserEnv, so while one task waits for
+the LLM the others keep using their browsers. Tasks are scheduled by the sites
+they use: a task only starts when every one of its sites has less than
+--max_per_site running tasks, the next runnable task is taken instead of
+blocking on the head of the queue. The next action requests of the tasks
+that wait at the same time go to the agent as one batch, the LLM calls of all
+the tasks share one --requests_per_minute limiter.
+
+The concurrent tasks are evaluated in a fresh browser context at the final url
+of the episode. The tasks whose program_html checks the "last" page read the
+live DOM of the agent (unsubmitted form values, the result of a POST), they
+run after the others through the sequential loop of run.py. All the workers
+share one agent, so the teacher forcing agent, which holds the actions of one
+task, is not supported.
+
+    python run_concurrent.py --num_workers 8 --max_per_site 4 \\
+        --instruction_path agent/prompts/jsons/p_cot_id_actree_2s.json \\
+        --test_start_idx 0 --test_end_idx 812 --result_dir cache/results
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import openai
+from playwright.sync_api import sync_playwright
+
+from agent import Agent, PromptAgent, TeacherForcingAgent, construct_agent
+from browser_env import (
+    Action,
+    ActionTypes,
+    AsyncScriptBrowserEnv,
+    StateInfo,
+    Trajectory,
+    create_stop_action,
+)
+from browser_env.auto_login import (
+    StorageStateCache,
+    get_site_comb_from_filepath,
+)
+from browser_env.helper_functions import (
+    RENDER_IMAGE_DIR,
+    RenderHelper,
+    get_action_description,
+)
+from evaluation_harness import evaluator_router
+from llms.accounting import (
+    LLM_USAGE_FILE,
+    format_usage_report,
+    get_task_id,
+    load_records,
+    set_metrics_file,
+    set_task_id,
+    usage_report,
+)
+from run import (
+    config,
+    dump_config,
+    early_stop,
+    get_unfinished,
+    logger,
+    prepare,
+    record_step,
+    save_records,
+)
+from run import test as test_sequentially
+
+
+def evaluates_last_page(config_file: str) -> bool:
+    """Whether a program_html check of the task reads the live last page"""
+    with open(config_file) as f:
+        configs = json.load(f)
+    return any(
+        target["url"] == "last"
+        for target in configs["eval"].get("program_html") or []
+    )
+
+
+class SiteScheduler:
+    """Hands out tasks so that at most `max_per_site` running tasks use the
+    same site. A task with several sites holds a slot of each of them."""
+
+    def __init__(self, config_files: list[str], max_per_site: int) -> None:
+        self.pending: list[tuple[str, list[str]]] = []
+        for config_file in config_files:
+            with open(config_file) as f:
+                sites = sorted(set(json.load(f).get("sites", [])))
+            self.pending.append((config_file, sites))
+        self.max_per_site = max_per_site
+        self.running: dict[str, int] = {}
+        self.condition = asyncio.Condition()
+
+    def _runnable(self) -> int | None:
+        for idx, (_, sites) in enumerate(self.pending):
+            if all(
+                self.running.get(site, 0) < self.max_per_site for site in sites
+            ):
+                return idx
+        return None
+
+    async def acquire(self) -> tuple[str, list[str]] | None:
+        """Next runnable task, or None when no task is left"""
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: not self.pending or self._runnable() is not None
+            )
+            if not self.pending:
+                return None
+            config_file, sites = self.pending.pop(self._runnable())  # type: ignore[arg-type]
+            for site in sites:
+                self.running[site] = self.running.get(site, 0) + 1
+            return config_file, sites
+
+    async def release(self, sites: list[str]) -> None:
+        async with self.condition:
+            for site in sites:
+                self.running[site] -= 1
+            self.condition.notify_all()
+
+
+class ActionDispatcher:
+    """Collects the next action requests of the workers, the ones waiting at
+    the same time go to the agent as one batch"""
+
+    def __init__(
+        self, agent: Agent | PromptAgent | TeacherForcingAgent
+    ) -> None:
+        self.agent = agent
+        self.queue: asyncio.Queue[
+            tuple[
+                tuple[Trajectory, str, dict[str, Any]],
+                str | None,
+                asyncio.Future[Any],
+            ]
+        ] = asyncio.Queue()
+        self.batches: set[asyncio.Task[None]] = set()
+
+    async def next_action(
+        self, trajectory: Trajectory, intent: str, meta_data: dict[str, Any]
+    ) -> Action:
+        future = asyncio.get_running_loop().create_future()
+        # the LLM calls run in the dispatcher, keep the task of the worker
+        await self.queue.put(
+            ((trajectory, intent, meta_data), get_task_id(), future)
+        )
+        return await future  # type: ignore[no-any-return]
+
+    async def _dispatch(
+        self,
+        requests: list[
+            tuple[
+                tuple[Trajectory, str, dict[str, Any]],
+                str | None,
+                asyncio.Future[Any],
+            ]
+        ],
+    ) -> None:
+        try:
+            results = await self.agent.anext_actions(
+                [request for request, _, _ in requests],
+                task_ids=[task_id for _, task_id, _ in requests],
+            )
+        except Exception as e:
+            # the workers of the batch are waiting on the futures
+            results = [e] * len(requests)
+        for (_, _, future), result in zip(requests, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def run(self) -> None:
+        while True:
+            requests = [await self.queue.get()]
+            while not self.queue.empty():
+                requests.append(self.queue.get_nowait())
+            # later requests don't wait for this batch
+            task = asyncio.create_task(self._dispatch(requests))
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+
+
+class EvaluationBrowser:
+    """The evaluators need a sync Playwright page, they run against a context
+    with the final storage state and url of the task in a browser owned by
+    one dedicated thread. The login states are checked in the same browser."""
+
+    def __init__(self, viewport_size: dict[str, int]) -> None:
+        self.viewport_size = viewport_size
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.browser: Any = None
+
+    def _launch(self) -> None:
+        if self.browser is None:
+            self.context_manager = sync_playwright()
+            playwright = self.context_manager.__enter__()
+            self.browser = playwright.chromium.launch(headless=True)
+
+    def _storage_state(
+        self, storage_state_cache: StorageStateCache, comb: list[str]
+    ) -> str:
+        self._launch()
+        return storage_state_cache.get(comb, self.browser)
+
+    async def storage_state(
+        self, storage_state_cache: StorageStateCache, comb: list[str]
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self._storage_state, storage_state_cache, comb
+        )
+
+    def _evaluate(
+        self,
+        config_file: str,
+        trajectory: Trajectory,
+        url: str,
+        storage_state: dict[str, Any],
+    ) -> float:
+        self._launch()
+        context = self.browser.new_context(
+            viewport=self.viewport_size,
+            storage_state=storage_state,
+            device_scale_factor=1,
+        )
+        try:
+            page = context.new_page()
+            client = page.context.new_cdp_session(page)
+            with open(config_file) as f:
+                eval_types = json.load(f)["eval"]["eval_types"]
+            # string match only looks at the answer
+            if eval_types != ["string_match"]:
+                page.goto(url)
+            evaluator = evaluator_router(config_file)
+            return evaluator(
+                trajectory=trajectory,
+                config_file=config_file,
+                page=page,
+                client=client,
+            )
+        finally:
+            context.close()
+
+    async def evaluate(
+        self,
+        config_file: str,
+        trajectory: Trajectory,
+        url: str,
+        storage_state: dict[str, Any],
+    ) -> float:
+        loop = asyncio.get_running_loop()
+        # run_in_executor doesn't carry the context, the LLM judges are
+        # accounted to the task
+        return await loop.run_in_executor(
+            self.executor,
+            contextvars.copy_context().run,
+            self._evaluate,
+            config_file,
+            trajectory,
+            url,
+            storage_state,
+        )
+
+    def _close(self) -> None:
+        if self.browser is not None:
+            self.context_manager.__exit__()
+            self.browser = None
+
+    async def close(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close)
+        self.executor.shutdown()
+
+
+async def run_task(
+    args: argparse.Namespace,
+    agent: Agent | PromptAgent | TeacherForcingAgent,
+    dispatcher: ActionDispatcher,
+    env: AsyncScriptBrowserEnv,
+    eval_browser: EvaluationBrowser,
+    storage_state_cache: StorageStateCache,
+    config_file: str,
+) -> float:
+    early_stop_thresholds = {
+        "parsing_failure": args.parsing_failure_th,
+        "repeating_action": args.repeating_action_failure_th,
+    }
+    render_helper = RenderHelper(
+        config_file, args.result_dir, args.action_set_tag
+    )
+    try:
+        with open(config_file) as f:
+            _c = json.load(f)
+            intent = _c["intent"]
+        set_task_id(str(_c["task_id"]))
+        reset_options = {"config_file": config_file}
+        # automatically login, the cookies are only renewed when expired
+        if _c["storage_state"]:
+            comb = get_site_comb_from_filepath(_c["storage_state"])
+            reset_options["storage_state"] = await eval_browser.storage_state(
+                storage_state_cache, comb
+            )
+        logger.info(f"[Config file]: {config_file}")
+        logger.info(f"[Intent]: {intent}")
+
+        records: dict[str, Any] = {
+            "uid": _c["task_id"],
+            "trail_idx": 0,
+            "intent": intent,
+            "response": "",
+            "steps": [],
+            "image_dir": RENDER_IMAGE_DIR,
+            "other": {"config": _c},
+        }
+
+        agent.reset(config_file)
+        trajectory: Trajectory = []
+        obs, info = await env.areset(options=reset_options)
+        state_info: StateInfo = {"observation": obs, "info": info}
+        trajectory.append(state_info)
+        step = record_step(records, state_info)
+
+        meta_data = {"action_history": ["None"]}
+        while True:
+            early_stop_flag, stop_info = early_stop(
+                trajectory, args.max_steps, early_stop_thresholds
+            )
+            if early_stop_flag:
+                action = create_stop_action(f"Early stop: {stop_info}")
+            else:
+                try:
+                    # batched with the requests of the other tasks
+                    action = await dispatcher.next_action(
+                        trajectory, intent, meta_data
+                    )
+                except ValueError as e:
+                    action = create_stop_action(f"ERROR: {str(e)}")
+
+            trajectory.append(action)
+            action_str = get_action_description(
+                action,
+                state_info["info"]["observation_metadata"],
+                action_set_tag=args.action_set_tag,
+                prompt_constructor=agent.prompt_constructor
+                if isinstance(agent, PromptAgent)
+                else None,
+            )
+            img_path = render_helper.render(
+                action, state_info, meta_data, args.render_screenshot
+            )
+            meta_data["action_history"].append(action_str)
+            if img_path:
+                step["img"] = os.path.basename(img_path)
+            step["other"] = {
+                "raw_action": action_str,
+                "raw_prediction": action.get("raw_prediction", ""),
+            }
+
+            if action["action_type"] == ActionTypes.STOP:
+                records["response"] = action["answer"]
+                break
+
+            obs, _, terminated, _, info = await env.astep(action)
+            state_info = {"observation": obs, "info": info}
+            trajectory.append(state_info)
+            step = record_step(records, state_info)
+            if terminated:
+                trajectory.append(create_stop_action(""))
+                if args.render_screenshot:
+                    step["img"] = os.path.basename(
+                        render_helper.save_screenshot(obs["image"])
+                    )
+                step["other"] = {"raw_action": "stop []"}
+                break
+
+        settle_times = [
+            s["info"].get("settle_time", 0.0)
+            for s in trajectory
+            if "info" in s
+        ]
+        logger.info(
+            f"[Settle time] {sum(settle_times):.1f}s over "
+            f"{len(settle_times)} observations"
+        )
+
+        score = await eval_browser.evaluate(
+            config_file,
+            trajectory,
+            env.page.url,
+            await env.context.storage_state(),
+        )
+        save_records(args.result_dir, records, score)
+        if score == 1:
+            logger.info(f"[Result] (PASS) {config_file}")
+        else:
+            logger.info(f"[Result] (FAIL) {config_file}")
+        return score
+    finally:
+        render_helper.close()
+
+
+async def worker(
+    args: argparse.Namespace,
+    agent: Agent | PromptAgent | TeacherForcingAgent,
+    dispatcher: ActionDispatcher,
+    scheduler: SiteScheduler,
+    storage_state_cache: StorageStateCache,
+    scores: dict[str, float],
+) -> None:
+    viewport_size = {
+        "width": args.viewport_width,
+        "height": args.viewport_height,
+    }
+    env = AsyncScriptBrowserEnv(
+        headless=not args.render,
+        slow_mo=args.slow_mo,
+        viewport_size=viewport_size,  # type: ignore[arg-type]
+        observation_type=args.observation_type,
+        current_viewport_only=args.current_viewport_only,
+        sleep_after_execution=args.sleep_after_execution,
+        adaptive_settle=args.settle_mode == "adaptive",
+        reuse_browser=args.reuse_browser,
+        recycle_browser_after=args.recycle_browser_after,
+    )
+    eval_browser = EvaluationBrowser(viewport_size)
+    try:
+        while True:
+            task = await scheduler.acquire()
+            if task is None:
+                break
+            config_file, sites = task
+            try:
+                scores[config_file] = await run_task(
+                    args,
+                    agent,
+                    dispatcher,
+                    env,
+                    eval_browser,
+                    storage_state_cache,
+                    config_file,
+                )
+            except openai.error.OpenAIError as e:
+                logger.info(f"[OpenAI Error] {repr(e)}")
+            except Exception as e:
+                logger.info(f"[Unhandled Error] {repr(e)}]")
+                import traceback
+
+                with open(Path(args.result_dir) / "error.txt", "a") as f:
+                    f.write(f"[Config file]: {config_file}\n")
+                    f.write(f"[Unhandled Error] {repr(e)}\n")
+                    f.write(traceback.format_exc())
+            finally:
+                await scheduler.release(sites)
+    finally:
+        await env.aclose()
+        await eval_browser.close()
+
+
+async def test(
+    args: argparse.Namespace,
+    agent: Agent | PromptAgent | TeacherForcingAgent,
+    config_file_list: list[str],
+) -> None:
+    scheduler = SiteScheduler(config_file_list, args.max_per_site)
+    storage_state_cache = StorageStateCache(
+        args.auth_folder, ttl=args.storage_state_ttl
+    )
+    scores: dict[str, float] = {}
+    usage_file = Path(args.result_dir) / LLM_USAGE_FILE
+    set_metrics_file(usage_file)
+    start = time.time()
+    dispatcher = ActionDispatcher(agent)
+    dispatch = asyncio.create_task(dispatcher.run())
+    try:
+        await asyncio.gather(
+            *(
+                worker(
+                    args,
+                    agent,
+                    dispatcher,
+                    scheduler,
+                    storage_state_cache,
+                    scores,
+                )
+                for _ in range(min(args.num_workers, len(config_file_list)))
+            )
+        )
+    finally:
+        dispatch.cancel()
+    logger.info(
+        f"Finished {len(scores)}/{len(config_file_list)} tasks in "
+        f"{time.time() - start:.0f}s"
+    )
+    if scores:
+        logger.info(f"Average score: {sum(scores.values()) / len(scores)}")
+    if usage_file.exists():
+        logger.info(
+            "[LLM usage]\n"
+            + format_usage_report(usage_report(load_records(usage_file)))
+        )
+
+
+if __name__ == "__main__":
+    args = config()
+    if args.agent_type == "teacher_forcing":
+        raise ValueError(
+            "The workers share one agent, run the teacher forcing agent "
+            "with run.py"
+        )
+    args.sleep_after_execution = 2.0
+    prepare(args)
+
+    test_file_list = []
+    for i in range(args.test_start_idx, args.test_end_idx):
+        test_file_list.append(f"config_files/{i}.json")
+    if "debug" not in args.result_dir:
+        test_file_list = get_unfinished(test_file_list, args.result_dir)
+
+    if len(test_file_list) == 0:
+        logger.info("No task left to run")
+    else:
+        print(f"Total {len(test_file_list)} tasks left")
+        args.render = False
+        args.render_screenshot = True
+        args.current_viewport_only = True
+        dump_config(args)
+
+        last_page_file_list = [
+            f for f in test_file_list if evaluates_last_page(f)
+        ]
+        concurrent_file_list = [
+            f for f in test_file_list if f not in last_page_file_list
+        ]
+        agent = construct_agent(args)
+        if concurrent_file_list:
+            asyncio.run(test(args, agent, concurrent_file_list))
+        if last_page_file_list:
+            logger.info(
+                f"Running the {len(last_page_file_list)} tasks evaluated on "
+                "the live last page sequentially"
+            )
+            test_sequentially(args, agent, last_page_file_list)
@@ -6,8 +6,6 @@ import logging
 import os
 import copy
 import random
-import subprocess
-import tempfile
 import time
 from pathlib import Path
 
@@ -30,13 +28,25 @@ from browser_env import (
     create_stop_action,
 )
 from browser_env.actions import is_equivalent
-from browser_env.auto_login import get_site_comb_from_filepath
+from browser_env.auto_login import (
+    StorageStateCache,
+    get_site_comb_from_filepath,
+)
 from browser_env.helper_functions import (
+    RENDER_IMAGE_DIR,
     RenderHelper,
     get_action_description,
     save_img
 )
 from evaluation_harness import evaluator_router
+from llms.accounting import (
+    LLM_USAGE_FILE,
+    format_usage_report,
+    load_records,
+    set_metrics_file,
+    set_task_id,
+    usage_report,
+)
 from pprint import pprint
 
 LOG_FOLDER = "log_files"
@@ -91,6 +101,52 @@ def config() -> argparse.Namespace:
     parser.add_argument("--viewport_height", type=int, default=720)
     parser.add_argument("--save_trace_enabled", action="store_true")
     parser.add_argument("--sleep_after_execution", type=float, default=0.0)
+    parser.add_argument(
+        "--settle_mode",
+        type=str,
+        default="adaptive",
+        choices=["adaptive", "sleep"],
+        help="adaptive: wait until the page settled after an action, for at "
+        "most --sleep_after_execution seconds; sleep: always sleep that long",
+    )
+    parser.add_argument(
+        "--page_content_mode",
+        type=str,
+        default="lazy",
+        choices=["eager", "lazy", "disk"],
+        help="How the html of every state is kept, lazy only reads the pages "
+        "that are used, e.g. the final one by the evaluators",
+    )
+    parser.add_argument(
+        "--page_content_dir",
+        type=str,
+        default=None,
+        help="Where the html is written with --page_content_mode disk, "
+        "a temporary directory removed at the end by default",
+    )
+    parser.add_argument(
+        "--auth_folder",
+        type=str,
+        default="./.auth",
+        help="Folder of the login states, expired ones are renewed in place",
+    )
+    parser.add_argument(
+        "--storage_state_ttl",
+        type=float,
+        default=1800,
+        help="Seconds a login state is used before checking whether it expired",
+    )
+    parser.add_argument(
+        "--reuse_browser",
+        action="store_true",
+        help="Keep one browser process across tasks, only the browser context is recreated",
+    )
+    parser.add_argument(
+        "--recycle_browser_after",
+        type=int,
+        default=50,
+        help="With --reuse_browser, relaunch the browser after this many tasks (0 for never)",
+    )
 
     parser.add_argument("--max_steps", type=int, default=30)
 
@@ -146,6 +202,17 @@ def config() -> argparse.Namespace:
         help="when not zero, will truncate the observation to this length before feeding to the model",
         default=1920,
     )
+    parser.add_argument(
+        "--observation_diff",
+        action="store_true",
+        help="in the reflection prompt, show later observations of the same page as a diff to the previous one",
+    )
+    parser.add_argument(
+        "--stream_actions",
+        action="store_true",
+        help="stream the completions of the agent and stop generating once "
+        "they hold a complete action, openai only",
+    )
     parser.add_argument(
         "--model_endpoint",
         help="huggingface model endpoint",
@@ -279,7 +346,17 @@ def test(
         },
         save_trace_enabled=args.save_trace_enabled,
         sleep_after_execution=args.sleep_after_execution,
+        adaptive_settle=args.settle_mode == "adaptive",
+        page_content_mode=args.page_content_mode,
+        page_content_dir=args.page_content_dir,
+        reuse_browser=args.reuse_browser,
+        recycle_browser_after=args.recycle_browser_after,
+    )
+    storage_state_cache = StorageStateCache(
+        args.auth_folder, ttl=args.storage_state_ttl
     )
+    usage_file = Path(args.result_dir) / LLM_USAGE_FILE
+    set_metrics_file(usage_file)
     for config_file in config_file_list:
         # with open(config_file) as f:
         #     cfg = json.load(f)
@@ -307,28 +384,7 @@ def test(
                     _c = json.load(f)
                     intent = _c["intent"]
                     task_id = _c["task_id"]
-                    # automatically login
-                    if _c["storage_state"]:
-                        cookie_file_name = os.path.basename(_c["storage_state"])
-                        comb = get_site_comb_from_filepath(cookie_file_name)
-                        temp_dir = tempfile.mkdtemp()
-                        # subprocess to renew the cookie
-                        subprocess.run(
-                            [
-                                "python",
-                                "browser_env/auto_login.py",
-                                "--auth_folder",
-                                temp_dir,
-                                "--site_list",
-                                *comb,
-                            ]
-                        )
-                        _c["storage_state"] = f"{temp_dir}/{cookie_file_name}"
-                        assert os.path.exists(_c["storage_state"]), _c["storage_state"]
-                        # update the config file
-                        config_file = f"{temp_dir}/{os.path.basename(config_file)}"
-                        with open(config_file, "w") as f:
-                            json.dump(_c, f)
+                set_task_id(str(task_id))
                 
                 if task_id not in results:
                     results[task_id] = {"intent": intent, "trails": []}
@@ -349,12 +405,17 @@ def test(
                         with open(baseline_file) as f:
                             baseline_records = json.load(f)
                         logger.info(f"Loaded a baseline record from {baseline_file}")
-                        # also copy the render file to the target directory
+                        # also copy the render files to the target directory
                         src_render_file = f"{baseline_dir}/renders/render_{task_id}_{trail_idx}.html"
                         dst_render_file = f"{args.result_dir}/renders/render_{task_id}_{trail_idx}.html"
                         assert os.path.exists(src_render_file), src_render_file
                         if src_render_file != dst_render_file:
                             os.system(f"cp {src_render_file} {dst_render_file}")
+                            os.system(f"cp {src_render_file[:-5]}.jsonl {args.result_dir}/renders/")
+                            src_images = f"{baseline_dir}/renders/{RENDER_IMAGE_DIR}/{task_id}_{trail_idx}_*.jpg"
+                            if glob.glob(src_images):
+                                os.makedirs(f"{args.result_dir}/renders/{RENDER_IMAGE_DIR}", exist_ok=True)
+                                os.system(f"cp {src_images} {args.result_dir}/renders/{RENDER_IMAGE_DIR}/")
                     baseline_memory_file = f"{baseline_dir}/memory/memory_{task_id}.json"
                     if os.path.exists(baseline_memory_file):
                         with open(baseline_memory_file) as f:
@@ -367,6 +428,9 @@ def test(
                     records = copy.deepcopy(baseline_records)
 
                 else:
+                    # finish the render of the previous trial
+                    if render_helper is not None:
+                        render_helper.close()
                     render_helper = RenderHelper(
                         config_file, render_save_dir, args.action_set_tag, trail_idx
                     )
@@ -378,11 +442,20 @@ def test(
                         "intent": intent,
                         "response": "",
                         "steps": [],
+                        "image_dir": "images",
                         "other": {"config": _c},
                     }
 
+                    reset_options = {"config_file": config_file}
+                    # automatically login, the cookies are only renewed when expired
+                    if _c["storage_state"]:
+                        comb = get_site_comb_from_filepath(_c["storage_state"])
+                        reset_options["storage_state"] = storage_state_cache.get(
+                            comb, env.browser if env.browser_launched else None
+                        )
+
                     agent.reset(config_file)
-                    obs, info = env.reset(options={"config_file": config_file})
+                    obs, info = env.reset(options=reset_options)
                     state_info: StateInfo = {"observation": obs, "info": info}
                     trajectory.append(state_info)
                     
@@ -576,6 +649,11 @@ def test(
             render_helper.close()
 
     env.close()
+    if usage_file.exists():
+        logger.info(
+            "[LLM usage]\n"
+            + format_usage_report(usage_report(load_records(usage_file)))
+        )
 
     if scores:
         logger.info(f"Average score: {sum(scores) / len(scores)}")
@@ -0,0 +1,205 @@
+"""Micro-benchmark of the text observation pipeline on recorded CDP dumps.
+
+Record a dump (needs a browser):
+    python scripts/bench_processors.py --record http://localhost:7770/ --dump dumps/shopping.json
+Benchmark recorded dumps, or a synthetic product grid if none is given:
+    python scripts/bench_processors.py dumps/*.json
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable
+
+from browser_env.processors import TextObervationProcessor, splice_out_nodes
+
+
+class ReplayClient:
+    """Answers the CDP calls of the accessibility tree path from a dump"""
+
+    def __init__(self, dump: dict[str, Any]) -> None:
+        self.dump = dump
+
+    def send(self, method: str, params: dict[str, Any]) -> Any:
+        if method == "Accessibility.getFullAXTree":
+            return {"nodes": json.loads(json.dumps(self.dump["ax_nodes"]))}
+        raise ValueError(f"{method} is not recorded, rerun with bulk bounds")
+
+
+def record(url: str, dump_path: str) -> None:
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        page = browser.new_page(viewport={"width": 1280, "height": 720})
+        page.goto(url)
+        client = page.context.new_cdp_session(page)
+        processor = TextObervationProcessor(
+            "accessibility_tree",
+            current_viewport_only=True,
+            viewport_size={"width": 1280, "height": 720},
+        )
+        info = processor.fetch_browser_info(page, client)
+        ax_nodes = client.send("Accessibility.getFullAXTree", {})["nodes"]
+        browser.close()
+    with open(dump_path, "w") as f:
+        json.dump({"url": url, "info": info, "ax_nodes": ax_nodes}, f)
+
+
+def synthetic_grid(num_items: int) -> dict[str, Any]:
+    """A page with one wide list of products, most of them below the fold"""
+    nodes: list[dict[str, Any]] = [
+        {
+            "nodeId": "1",
+            "role": {"value": "RootWebArea"},
+            "name": {"value": "shop"},
+            "backendDOMNodeId": 1,
+            "childIds": ["2"],
+        },
+        {
+            "nodeId": "2",
+            "parentId": "1",
+            "role": {"value": "list"},
+            "name": {"value": ""},
+            "backendDOMNodeId": 2,
+            "childIds": [],
+        },
+    ]
+    backend_ids, layout_nodes, bounds = [1, 2], [0, 1], [
+        [0, 0, 1280, 720],
+        [0, 0, 1280, 100 * num_items],
+    ]
+    for i in range(num_items):
+        item_id, text_id = 3 + 2 * i, 4 + 2 * i
+        nodes[1]["childIds"].append(str(item_id))
+        nodes.append(
+            {
+                "nodeId": str(item_id),
+                "parentId": "2",
+                "role": {"value": "listitem"},
+                "name": {"value": ""},
+                "backendDOMNodeId": item_id,
+                "childIds": [str(text_id)],
+            }
+        )
+        nodes.append(
+            {
+                "nodeId": str(text_id),
+                "parentId": str(item_id),
+                "role": {"value": "StaticText"},
+                "name": {"value": f"product {i}"},
+                "backendDOMNodeId": text_id,
+                "childIds": [],
+            }
+        )
+        for backend_id in (item_id, text_id):
+            backend_ids.append(backend_id)
+            layout_nodes.append(len(backend_ids) - 1)
+            bounds.append([0, 100 * i, 1280, 90])
+    info = {
+        "DOMTree": {
+            "documents": [
+                {
+                    "nodes": {"backendNodeId": backend_ids},
+                    "layout": {"nodeIndex": layout_nodes, "bounds": bounds},
+                }
+            ],
+            "strings": [],
+        },
+        "config": {
+            "win_left_bound": 0,
+            "win_top_bound": 0,
+            "win_width": 1280,
+            "win_height": 720,
+        },
+    }
+    return {"url": f"synthetic:{num_items}", "info": info, "ax_nodes": nodes}
+
+
+def splice_by_insert(
+    child_ids: list[list[int]], parent_ids: list[int], keep: list[bool]
+) -> None:
+    """The previous node-by-node removal, for comparison"""
+    children = [list(c) for c in child_ids]
+    parents = list(parent_ids)
+    for cursor, kept in enumerate(keep):
+        if kept or parents[cursor] < 0:
+            continue
+        parent = parents[cursor]
+        index = children[parent].index(cursor)
+        children[parent].pop(index)
+        for child in children[cursor]:
+            children[parent].insert(index, child)
+            index += 1
+        for child in children[cursor]:
+            parents[child] = parent
+
+
+def timeit(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench(dump: dict[str, Any], repeat: int) -> None:
+    processor = TextObervationProcessor(
+        "accessibility_tree",
+        current_viewport_only=True,
+        viewport_size={"width": 1280, "height": 720},
+    )
+    client: Any = ReplayClient(dump)
+    info = dump["info"]
+
+    tree = processor.fetch_page_accessibility_tree(info, client, True)
+    text, _ = processor.parse_accessibility_tree(tree)
+    fetch_ms = timeit(
+        lambda: processor.fetch_page_accessibility_tree(info, client, True),
+        repeat,
+    )
+    parse_ms = timeit(lambda: processor.parse_accessibility_tree(tree), repeat)
+    clean_ms = timeit(lambda: processor.clean_accesibility_tree(text), repeat)
+
+    # the viewport filter alone, against the previous implementation
+    full_tree = client.send("Accessibility.getFullAXTree", {})["nodes"]
+    cursors = {node["nodeId"]: i for i, node in enumerate(full_tree)}
+    child_ids = [
+        [cursors[c] for c in node.get("childIds", []) if c in cursors]
+        for node in full_tree
+    ]
+    parent_ids = [cursors.get(node.get("parentId"), -1) for node in full_tree]
+    keep = [False] * len(full_tree)
+    for node in tree:
+        keep[cursors[node["nodeId"]]] = True
+    splice_ms = timeit(lambda: splice_out_nodes(child_ids, keep), repeat)
+    insert_ms = timeit(
+        lambda: splice_by_insert(child_ids, parent_ids, keep), repeat
+    )
+
+    print(
+        f"{dump['url']}: {len(full_tree)} nodes, {len(tree)} in viewport | "
+        f"fetch {fetch_ms:.1f}ms parse {parse_ms:.1f}ms "
+        f"clean {clean_ms:.1f}ms | filter {splice_ms:.1f}ms "
+        f"(node by node {insert_ms:.1f}ms)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dumps", nargs="*", help="recorded CDP dumps")
+    parser.add_argument("--record", type=str, default=None, help="url")
+    parser.add_argument("--dump", type=str, default="cdp_dump.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--num_items", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.dump)
+    elif args.dumps:
+        for path in args.dumps:
+            with open(path) as f:
+                bench(json.load(f), args.repeat)
+    else:
+        bench(synthetic_grid(args.num_items), args.repeat)
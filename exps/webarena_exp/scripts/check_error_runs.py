@@ -8,6 +8,18 @@ import shutil
 import sys
 
 
+def remove_render(result_folder: str, idx: int | str) -> None:
+    """Remove the render of an example with its records and images"""
+    for path in [
+        f"{result_folder}/render_{idx}.html",
+        f"{result_folder}/render_{idx}.jsonl",
+        *glob.glob(f"{result_folder}/render_images/{idx}_*.jpg"),
+        *glob.glob(f"{result_folder}/records/{idx}_*.json"),
+    ]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
 def merge_logs(result_folder: str, args: argparse.Namespace) -> str:
     if not os.path.exists(f"{result_folder}/log_files.txt"):
         sys.exit(1)
@@ -73,7 +85,7 @@ def merge_logs(result_folder: str, args: argparse.Namespace) -> str:
         or input("Do you want to delete these examples? (y/n)") == "y"
     ):
         for idx in unlog_examples:
-            os.remove(f"{args.result_folder}/render_{idx}.html")
+            remove_render(args.result_folder, idx)
 
     unifinished_examples = [
         i for i in range(0, 812) if str(i) not in merged_results
@@ -104,8 +116,7 @@ def check_unhandled_errors(args: argparse.Namespace) -> int:
         or input("Do you want to delete these examples? (y/n)") == "y"
     ):
         for idx in error_examples:
-            if os.path.exists(f"{args.result_folder}/render_{idx}.html"):
-                os.remove(f"{args.result_folder}/render_{idx}.html")
+            remove_render(args.result_folder, idx)
     return num_errors
 
 
@@ -120,7 +131,24 @@ def check_unexpected_logout(args: argparse.Namespace) -> int:
     )
 
     error_examples = []
-    for render_file in glob.glob(f"{args.result_folder}/render_*.html"):
+    # the trajectory records have the same observations as the render files,
+    # only the tasks without a record are checked in their render file
+    recorded_tasks = set()
+    for record_file in glob.glob(f"{args.result_folder}/records/*.json"):
+        task_id = int(record_file.split("/")[-1].split("_")[0])
+        recorded_tasks.add(task_id)
+        with open(record_file, "r") as f:
+            contents = f.read()
+            if any([s in contents for s in target_strings]):
+                if task_id not in error_examples:
+                    error_examples.append(task_id)
+    render_files = [
+        render_file
+        for render_file in glob.glob(f"{args.result_folder}/render_*.html")
+        if int(render_file.split("/")[-1].split(".")[0].split("_")[-1])
+        not in recorded_tasks
+    ]
+    for render_file in render_files:
         with open(render_file, "r") as f:
             contents = f.read()
             if any([s in contents for s in target_strings]):
@@ -136,8 +164,7 @@ def check_unexpected_logout(args: argparse.Namespace) -> int:
         or input("Do you want to delete these examples? (y/n)") == "y"
     ):
         for idx in error_examples:
-            if os.path.exists(f"{args.result_folder}/render_{idx}.html"):
-                os.remove(f"{args.result_folder}/render_{idx}.html")
+            remove_render(args.result_folder, idx)
 
     return num_errors
 
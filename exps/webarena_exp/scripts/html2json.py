@@ -6,9 +6,37 @@ import os
 from collections import defaultdict
 from typing import Any
 
+from agent_eval.domains.webarena import load_run_records, record_image_dir
 from bs4 import BeautifulSoup
 
 
+def messages_from_record(
+    record: dict[str, Any], result_folder: str
+) -> list[dict[str, Any]]:
+    """Messages of a trajectory record written by run.py or
+    run_reflexion.py"""
+    image_dir = record_image_dir(record, result_folder)
+    messages: list[dict[str, Any]] = []
+    for step in record["steps"]:
+        image = (
+            os.path.join(image_dir, os.path.basename(step["img"]))
+            if step["img"]
+            else None
+        )
+        messages.append(
+            {
+                "user": f"URL: {step['url']}\n\n"
+                f"observation:\n{step['accessibility_tree']}",
+                "image": image,
+            }
+        )
+        other = step.get("other", {})
+        messages.append(
+            {"assistant": other.get("raw_prediction") or other["raw_action"]}
+        )
+    return messages
+
+
 def main(result_folder: str, config_json: str) -> None:
     all_data = {}
     template_to_id: dict[str, Any] = defaultdict(lambda: len(template_to_id))
@@ -42,9 +70,24 @@ def main(result_folder: str, config_json: str) -> None:
                 id = line.strip().split(".")[-2].split("/")[-1]
                 results[int(id)] = True if "(PASS)" in line else False
 
-    files = list(glob.glob(f"{result_folder}/render_*.html"))
+    # the tasks with a trajectory record (the last trial of run_reflexion.py)
+    # don't need their render file to be parsed, the others still do
+    records = {int(r["uid"]): r for r in load_run_records(result_folder)}
+    for task_id, record in records.items():
+        all_data[f"example_{task_id}"] = {
+            **data_configs[task_id],
+            "messages": messages_from_record(record, result_folder),
+            # the status may come from the model-based evaluator
+            "success": record["oracle_score"] == 1,
+        }
+
+    files = [
+        x
+        for x in glob.glob(f"{result_folder}/render_*.html")
+        if int(x.split("_")[-1].split(".")[0]) not in records
+    ]
     files = [x for x in files if os.path.exists(x)]
-    print(f"Total number of files: {len(files)}")
+    print(f"Total number of files: {len(files) + len(records)}")
 
     for render_file in files:
         task_id = int(render_file.split("_")[-1].split(".")[0])
@@ -56,15 +99,18 @@ def main(result_folder: str, config_json: str) -> None:
                     obv.find("pre").text
                     for obv in soup.find_all("div", {"class": "state_obv"})
                 ]
-                base64_images = [
-                    img["src"].split(",")[1] for img in soup.find_all("img")
-                ]
                 image_observations = []
                 # save image to file and change the value to be path
                 image_folder = f"images/{os.path.basename(result_folder)}"
                 os.makedirs(image_folder, exist_ok=True)
-                for i, image in enumerate(base64_images):
-                    image_data = base64.b64decode(image)
+                for i, img in enumerate(soup.find_all("img")):
+                    if not img["src"].startswith("data:image/"):
+                        # already a file, relative to the result folder
+                        image_observations.append(
+                            os.path.join(result_folder, img["src"])
+                        )
+                        continue
+                    image_data = base64.b64decode(img["src"].split(",")[1])
                     filename = f"{image_folder}/image_{task_id}_{i}.png"
                     with open(filename, "wb") as f:  # type: ignore[assignment]
                         f.write(image_data)  # type: ignore[arg-type]
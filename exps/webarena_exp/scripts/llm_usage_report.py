@@ -0,0 +1,26 @@
+"""Report where the tokens and the wall time of the LLM calls of a run went,
+per stage (agent_step, reflection, evaluator, fuzzy_match, ...) and per task:
+    python scripts/llm_usage_report.py cache/results_xxx/llm_usage.jsonl
+"""
+import argparse
+import json
+
+from llms.accounting import format_usage_report, load_records, usage_report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("metrics_file", type=str)
+    parser.add_argument(
+        "--max_tasks",
+        type=int,
+        default=20,
+        help="show the tasks with the most prompt tokens only",
+    )
+    parser.add_argument("--json", action="store_true", help="full report")
+    args = parser.parse_args()
+
+    report = usage_report(load_records(args.metrics_file))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_usage_report(report, args.max_tasks))
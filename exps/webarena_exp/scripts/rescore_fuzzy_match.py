@@ -0,0 +1,108 @@
+"""Re-score the answers of a finished run that are judged by the LLM
+(fuzzy_match / ua_match), e.g. after a fix of the evaluation harness:
+    python scripts/rescore_fuzzy_match.py cache/results_xxx --update_records
+The judge responses come from the judge cache (evaluation_harness/
+judge_cache.py), only the judgments that were never made cost an LLM call.
+Only the records of tasks evaluated by string_match alone are re-scored, the
+other evaluators need the final page of the episode.
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from evaluation_harness import StringEvaluator
+from evaluation_harness.judge_cache import get_judge_cache, set_judge_cache
+from llms.accounting import LLM_USAGE_FILE, llm_context, set_metrics_file
+
+
+def uses_llm_judge(configs: dict[str, Any]) -> bool:
+    return (
+        configs["eval"]["eval_types"] == ["string_match"]
+        and "fuzzy_match" in configs["eval"]["reference_answers"]
+    )
+
+
+def rescore(record_file: Path) -> tuple[dict[str, Any], float] | None:
+    with open(record_file) as f:
+        records = json.load(f)
+    configs = records["other"]["config"]
+    if not uses_llm_judge(configs):
+        return None
+    with llm_context(task_id=str(records["uid"])):
+        score = StringEvaluator().evaluate_answer(records["response"], configs)
+    return records, score
+
+
+def update_records(
+    record_file: Path, records: dict[str, Any], score: float
+) -> None:
+    records["oracle_score"] = score
+    # the score of the model-based evaluators is left alone
+    if records.get("score_source") == "gt":
+        records["score"] = score
+        records["status"] = "PASSED" if score == 1 else "FAILED"
+    with open(record_file, "w") as f:
+        json.dump(records, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("result_dir", type=str)
+    parser.add_argument("--num_workers", type=int, default=16)
+    parser.add_argument(
+        "--judge_cache",
+        type=str,
+        default=None,
+        help="path of the judge cache, defaults to $LLM_JUDGE_CACHE",
+    )
+    parser.add_argument(
+        "--update_records",
+        action="store_true",
+        help="write the new scores to the records of the run",
+    )
+    args = parser.parse_args()
+
+    if args.judge_cache is not None:
+        set_judge_cache(args.judge_cache)
+    set_metrics_file(Path(args.result_dir) / LLM_USAGE_FILE)
+
+    record_files = sorted(Path(args.result_dir).glob("records/*.json"))
+    changed = 0
+    old_scores, new_scores = [], []
+    with ThreadPoolExecutor(max_workers=args.num_workers) as executor:
+        futures = [
+            (record_file, executor.submit(rescore, record_file))
+            for record_file in record_files
+        ]
+        for record_file, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[Error] {record_file.name}: {repr(e)}")
+                continue
+            if result is None:
+                continue
+            records, score = result
+            old_score = records["oracle_score"]
+            old_scores.append(old_score)
+            new_scores.append(score)
+            if score != old_score:
+                changed += 1
+                print(f"{record_file.stem}: {old_score} -> {score}")
+                if args.update_records:
+                    update_records(record_file, records, score)
+
+    print(
+        f"Re-scored {len(new_scores)}/{len(record_files)} records, "
+        f"{changed} changed"
+    )
+    if new_scores:
+        print(
+            f"Average score {sum(old_scores) / len(old_scores):.4f} -> "
+            f"{sum(new_scores) / len(new_scores):.4f}"
+        )
+    cache = get_judge_cache()
+    if cache is not None:
+        print(f"Judge cache hits {cache.hits}, misses {cache.misses}")
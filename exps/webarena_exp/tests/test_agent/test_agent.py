@@ -0,0 +1,105 @@
+from typing import Any
+
+import pytest
+
+from agent import agent
+from agent.agent import action_stop_condition, predict_action
+from agent.prompts import CoTPromptConstructor
+from browser_env import ActionTypes
+from llms import accounting, lm_config
+
+INSTRUCTION = "agent/prompts/jsons/p_cot_id_actree_2s.json"
+ANSWER_PHRASE = "In summary, the next action I will perform is"
+
+
+class WordTokenizer:
+    name = "test/words"
+
+    def encode(self, text: str) -> list[int]:
+        return [len(word) for word in text.split()]
+
+
+def make_lm_config(stream_actions: bool) -> lm_config.LMConfig:
+    return lm_config.LMConfig(
+        provider="openai",
+        model="gpt-3.5-turbo",
+        mode="chat",
+        gen_config={
+            "temperature": 1.0,
+            "top_p": 0.9,
+            "context_length": 0,
+            "max_tokens": 384,
+            "stop_token": None,
+            "max_obs_length": 0,
+            "max_retry": 1,
+            "stream_actions": stream_actions,
+        },
+    )
+
+
+def make_prompt_constructor(
+    config: lm_config.LMConfig,
+) -> CoTPromptConstructor:
+    return CoTPromptConstructor(
+        INSTRUCTION, config, WordTokenizer()  # type: ignore[arg-type]
+    )
+
+
+def test_no_stop_condition_without_streaming() -> None:
+    config = make_lm_config(stream_actions=False)
+    prompt_constructor = make_prompt_constructor(config)
+    assert (
+        action_stop_condition(
+            config, prompt_constructor, "id_accessibility_tree"
+        )
+        is None
+    )
+
+
+@pytest.mark.parametrize(
+    "response, stop",
+    [
+        ("Let's think step-by-step.", False),
+        (f"{ANSWER_PHRASE} ```click", False),
+        (f"{ANSWER_PHRASE} ```click [12", False),
+        # closed but no valid action
+        (f"{ANSWER_PHRASE} ```click []```", False),
+        (f"{ANSWER_PHRASE} ```click [12]```", True),
+        (f"{ANSWER_PHRASE} ```type [3] [shoes] [1]```", True),
+    ],
+)
+def test_stop_once_the_action_parses(response: str, stop: bool) -> None:
+    config = make_lm_config(stream_actions=True)
+    should_stop = action_stop_condition(
+        config, make_prompt_constructor(config), "id_accessibility_tree"
+    )
+    assert should_stop is not None
+    assert should_stop(response) == stop
+
+
+def test_streamed_usage_is_counted_with_the_tokenizer(
+    monkeypatch: Any,
+) -> None:
+    config = make_lm_config(stream_actions=True)
+    prompt_constructor = make_prompt_constructor(config)
+    page = type("Page", (), {"url": "http://example.com"})()
+    trajectory = [
+        {"observation": {"text": "[1] link 'Home'"}, "info": {"page": page}}
+    ]
+    prompt = prompt_constructor.construct(
+        trajectory, "Go home", {"action_history": ["None"]}
+    )
+    response = f"Let's think. {ANSWER_PHRASE} ```click [1]```"
+    monkeypatch.setattr(
+        agent, "call_llm", lambda config, prompt, should_stop: response
+    )
+    records: list[dict[str, Any]] = []
+    monkeypatch.setattr(accounting, "write_record", records.append)
+
+    action = predict_action(
+        config, prompt_constructor, "id_accessibility_tree", prompt
+    )
+    assert action["action_type"] == ActionTypes.CLICK
+    [record] = records
+    assert record["prompt_tokens"] == prompt_constructor.prompt_length > 0
+    assert record["completion_tokens"] == len(response.split())
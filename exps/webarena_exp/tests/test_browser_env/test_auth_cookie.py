@@ -1,5 +1,6 @@
 import asyncio
 import json
+from typing import Any
 
 from browser_env import *
 
@@ -65,3 +66,48 @@ def test_async_auth_cookie() -> None:
         await env.aclose()
 
     asyncio.run(_test())
+
+
+def test_storage_state_option_overrides_config() -> None:
+    env = ScriptBrowserEnv()
+    json.dump(auth_json, open("/tmp/auth.json", "w"))
+    json.dump({"storage_state": None}, open("/tmp/config.json", "w"))
+    env.reset(
+        options={
+            "config_file": "/tmp/config.json",
+            "storage_state": "/tmp/auth.json",
+        }
+    )
+    _, reward, _, _, info = env.step(
+        create_goto_url_action("https://www.saucedemo.com/inventory.html"),
+    )
+    assert reward == 1
+    assert info["page"].url == "https://www.saucedemo.com/inventory.html"
+    env.close()
+
+
+def test_storage_state_cache_checks_after_ttl(
+    tmp_path: Any, monkeypatch: Any
+) -> None:
+    from browser_env import auto_login
+
+    calls: list[str] = []
+    monkeypatch.setattr(
+        auto_login,
+        "is_comb_expired",
+        lambda storage_state, comb, browser: calls.append("check") or True,
+    )
+    monkeypatch.setattr(
+        auto_login,
+        "renew_comb",
+        lambda comb, auth_folder, browser: calls.append("renew"),
+    )
+    cache = auto_login.StorageStateCache(str(tmp_path), ttl=60)
+    path = cache.get(["gitlab", "reddit"])
+    assert path == str(tmp_path / "gitlab.reddit_state.json")
+    cache.get(["gitlab", "reddit"])
+    assert calls == ["check", "renew"]
+
+    cache.ttl = 0
+    cache.get(["gitlab", "reddit"])
+    assert calls == ["check", "renew", "check", "renew"]
@@ -0,0 +1,153 @@
+import random
+from typing import Any
+
+from browser_env.processors import (
+    TextObervationProcessor,
+    observation_diff,
+    splice_out_nodes,
+)
+
+
+def _browser_info(
+    backend_ids: list[int],
+    node_index: list[int],
+    bounds: list[list[float]],
+    scroll: tuple[float, float] = (0.0, 0.0),
+) -> Any:
+    return {
+        "DOMTree": {
+            "documents": [
+                {
+                    "nodes": {"backendNodeId": backend_ids},
+                    "layout": {"nodeIndex": node_index, "bounds": bounds},
+                }
+            ],
+            "strings": [],
+        },
+        "config": {
+            "win_left_bound": scroll[0],
+            "win_top_bound": scroll[1],
+            "win_width": 1280,
+            "win_height": 720,
+        },
+    }
+
+
+def test_snapshot_bounds_are_viewport_relative() -> None:
+    info = _browser_info(
+        backend_ids=[1, 2, 3],
+        node_index=[0, 1],
+        bounds=[[0, 0, 1280, 3000], [10, 1050, 100, 20]],
+        scroll=(0.0, 1000.0),
+    )
+    bounds = TextObervationProcessor.get_snapshot_bounds(info)
+    assert bounds[1] == [0, -1000, 1280, 3000]
+    assert bounds[2] == [10, 50, 100, 20]
+    # in the DOM but without layout, same as getBoundingClientRect
+    assert bounds[3] == [0.0, 0.0, 0.0, 0.0]
+
+
+def test_snapshot_bounds_union_of_layout_objects() -> None:
+    info = _browser_info(
+        backend_ids=[7],
+        node_index=[0, 0],
+        bounds=[[10, 10, 50, 10], [0, 20, 30, 10]],
+    )
+    bounds = TextObervationProcessor.get_snapshot_bounds(info)
+    assert bounds[7] == [0, 10, 60, 20]
+
+
+def _ax_node(
+    node_id: str, role: str, name: str, child_ids: list[str]
+) -> dict[str, Any]:
+    return {
+        "nodeId": node_id,
+        "role": {"value": role},
+        "name": {"value": name},
+        "childIds": child_ids,
+        "backendDOMNodeId": int(node_id),
+        "union_bound": [0.0, 0.0, 10.0, 10.0],
+    }
+
+
+def test_parse_accessibility_tree_reuses_unchanged_subtrees() -> None:
+    tree = [
+        _ax_node("1", "RootWebArea", "page", ["2", "5"]),
+        _ax_node("2", "generic", "", ["3", "4"]),
+        _ax_node("3", "link", "home", []),
+        _ax_node("4", "button", "submit", []),
+        _ax_node("5", "heading", "title", []),
+    ]
+    cache: dict[int, Any] = {}
+    expected = TextObervationProcessor.parse_accessibility_tree(tree)
+    assert (
+        TextObervationProcessor.parse_accessibility_tree(tree, cache)
+        == expected
+    )
+    assert expected[0] == (
+        "[1] RootWebArea 'page'\n\t[3] link 'home'\n\t[4] button 'submit'"
+        "\n\t[5] heading 'title'"
+    )
+
+    tree[4]["name"]["value"] = "new title"
+    text, nodes_info = TextObervationProcessor.parse_accessibility_tree(
+        tree, cache
+    )
+    assert text.endswith("[5] heading 'new title'")
+    assert set(nodes_info) == {"1", "3", "4", "5"}
+    assert text == TextObervationProcessor.parse_accessibility_tree(tree)[0]
+
+
+def test_observation_diff() -> None:
+    prev = "Tab 0\n\n[1] a\n[2] b\n[3] c"
+    cur = "Tab 0\n\n[1] a\n[2] B\n[3] c\n[4] d"
+    assert observation_diff(prev, cur) == "-[2] b\n+[2] B\n+[4] d"
+    assert observation_diff(cur, cur) == ""
+
+
+def _splice_out_nodes_by_insert(
+    child_ids: list[list[int]], parent_ids: list[int], keep: list[bool]
+) -> tuple[list[int], list[list[int]]]:
+    """The original in-place removal, one node at a time in cursor order"""
+    children = [list(c) for c in child_ids]
+    parents = list(parent_ids)
+    for cursor, kept in enumerate(keep):
+        if kept:
+            continue
+        parent = parents[cursor]
+        index = children[parent].index(cursor)
+        children[parent][index : index + 1] = children[cursor]
+        for child in children[cursor]:
+            parents[child] = parent
+    return parents, children
+
+
+def test_splice_out_nodes_matches_in_place_removal() -> None:
+    rng = random.Random(0)
+    for _ in range(200):
+        num_nodes = rng.randint(1, 60)
+        # cursors in document order, like the CDP dumps
+        parent_ids = [-1] + [rng.randrange(i) for i in range(1, num_nodes)]
+        child_ids: list[list[int]] = [[] for _ in range(num_nodes)]
+        for cursor, parent in enumerate(parent_ids[1:], start=1):
+            child_ids[parent].append(cursor)
+        keep = [True] + [rng.random() < 0.5 for _ in range(num_nodes - 1)]
+
+        parents, children = splice_out_nodes(child_ids, keep)
+        expected_parents, expected_children = _splice_out_nodes_by_insert(
+            child_ids, parent_ids, keep
+        )
+        for cursor in range(num_nodes):
+            if keep[cursor]:
+                assert parents[cursor] == expected_parents[cursor]
+                assert children[cursor] == expected_children[cursor]
+
+
+def test_is_in_viewport() -> None:
+    config: Any = {"win_width": 1280, "win_height": 720}
+    assert TextObervationProcessor.is_in_viewport([0, 0, 100, 20], config)
+    assert not TextObervationProcessor.is_in_viewport(None, config)
+    assert not TextObervationProcessor.is_in_viewport([0, 0, 0, 20], config)
+    assert not TextObervationProcessor.is_in_viewport(
+        [0, 1000, 100, 20], config
+    )
@@ -1,7 +1,9 @@
 import asyncio
 import collections
 import json
+import pickle
 import tempfile
+from pathlib import Path
 from typing import Callable, Dict, Optional, Tuple, Type, Union, cast
 
 import pytest
@@ -187,6 +189,31 @@ def test_accessibility_tree(
     assert s1 in obs["text"] and s2 in obs["text"]
 
 
+@pytest.mark.asyncio
+async def test_async_accessibility_tree() -> None:
+    env = AsyncScriptBrowserEnv(observation_type="accessibility_tree")
+    await env.areset()
+    obs, success, _, _, info = await env.astep(
+        create_goto_url_action("https://russmaxdesign.github.io/exercise/")
+    )
+    assert success
+    assert "checkbox 'Yes'" in obs["text"]
+    assert "button 'Submit'" in obs["text"]
+    # element ids of the observation can be acted on
+    element_id = next(
+        node_id
+        for node_id, node_info in info["observation_metadata"]["text"][
+            "obs_nodes_info"
+        ].items()
+        if "checkbox 'Yes'" in node_info["text"]
+    )
+    obs, success, _, _, _ = await env.astep(
+        create_id_based_action(f"click [{element_id}]")
+    )
+    assert success
+    await env.aclose()
+
+
 def test_accessibility_tree_viewport(
     accessibility_tree_current_viewport_script_browser_env: ScriptBrowserEnv,
 ) -> None:
@@ -234,6 +261,73 @@ def test_multiple_start_url(script_browser_env: ScriptBrowserEnv) -> None:
     ].url
 
 
+def test_reuse_browser_across_resets() -> None:
+    env = ScriptBrowserEnv(reuse_browser=True, recycle_browser_after=2)
+    env.reset()
+    browser = env.browser
+    first_context = env.context
+    env.reset()
+    # same browser process, fresh context
+    assert env.browser is browser
+    assert env.context is not first_context
+    assert first_context not in browser.contexts
+    env.reset()
+    # recycled after two contexts
+    assert env.browser is not browser
+    assert not browser.is_connected()
+    env.close()
+
+
+def test_adaptive_settle_is_bounded() -> None:
+    env = ScriptBrowserEnv(
+        observation_type="accessibility_tree",
+        sleep_after_execution=2.0,
+        adaptive_settle=True,
+    )
+    env.reset()
+    # a page that keeps mutating its DOM never settles
+    action = create_playwright_action(
+        'page.set_content("<div id=t></div><script>setInterval(() => '
+        "document.getElementById('t').textContent = Date.now(), 10)"
+        '</script>")'
+    )
+    _, _, _, _, info = env.step(action)
+    assert 2.0 <= info["settle_time"] < 3.0
+    # a static page settles well before the bound
+    action = create_playwright_action('page.set_content("<p>static</p>")')
+    _, _, _, _, info = env.step(action)
+    assert info["settle_time"] < 1.5
+    env.close()
+
+
+def test_lazy_page_content() -> None:
+    env = ScriptBrowserEnv(
+        observation_type="accessibility_tree", page_content_mode="lazy"
+    )
+    env.reset()
+    _, _, _, _, first = env.step(
+        create_playwright_action('page.set_content("<p>first</p>")')
+    )
+    _, _, _, _, last = env.step(
+        create_playwright_action('page.set_content("<p>last</p>")')
+    )
+    # only the state the page is still in can be read
+    assert first["page"].content == ""
+    assert "last" in last["page"].content
+    assert first["page"].nbytes == 0
+    env.close()
+
+
+def test_detached_page_spilled_to_disk(tmp_path: Path) -> None:
+    page_file = tmp_path / "0.html"
+    page_file.write_text("<p>content</p>")
+    page = DetachedPage("http://example.com", path=page_file)
+    assert page.content == "<p>content</p>"
+    assert page.nbytes == 0
+    page = pickle.loads(pickle.dumps(page))
+    assert page.content == "<p>content</p>"
+
+
 def test_observation_tab_information(
     accessibility_tree_current_viewport_script_browser_env: ScriptBrowserEnv,
 ) -> None:
@@ -0,0 +1,54 @@
+from typing import Any
+
+from evaluation_harness import StringEvaluator, helper_functions, judge_cache
+
+
+def test_llm_judge_is_memoized(tmp_path: Any, monkeypatch: Any) -> None:
+    calls: list[str] = []
+    monkeypatch.setattr(
+        helper_functions,
+        "generate_from_openai_chat_completion",
+        lambda **kwargs: calls.append("judge") or "Correct",
+    )
+    default_path = judge_cache.JUDGE_CACHE_PATH
+    judge_cache.set_judge_cache(tmp_path / "judge.sqlite")
+    try:
+        configs = {
+            "intent": "What is the top-1 best-selling product?",
+            "eval": {"reference_answers": {"fuzzy_match": ["Quest Lumaflex"]}},
+        }
+        evaluator = StringEvaluator()
+        assert evaluator.evaluate_answer("Quest Lumaflex Band", configs) == 1
+        # same judgment up to whitespace
+        assert evaluator.evaluate_answer(" quest  lumaflex band", configs) == 1
+        assert calls == ["judge"]
+
+        # the judgments persist, re-scoring a run calls the judge no more
+        judge_cache.set_judge_cache(tmp_path / "judge.sqlite")
+        assert evaluator.evaluate_answer("Quest Lumaflex Band", configs) == 1
+        assert calls == ["judge"]
+    finally:
+        judge_cache.set_judge_cache(default_path or None)
+
+
+def test_judge_prompt_is_in_key() -> None:
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant"},
+        {"role": "user", "content": "question: q\nstudent answer: a"},
+    ]
+    key = judge_cache.JudgeCache.make_key("fuzzy_match", "gpt-4", messages)
+    reworded = [
+        messages[0],
+        {"role": "user", "content": "Question: q\n\nstudent  answer: A "},
+    ]
+    assert (
+        judge_cache.JudgeCache.make_key("fuzzy_match", "gpt-4", reworded)
+        == key
+    )
+    changed = [
+        messages[0],
+        {"role": "user", "content": "question: q\nanswer of the student: a"},
+    ]
+    assert (
+        judge_cache.JudgeCache.make_key("fuzzy_match", "gpt-4", changed) != key
+    )
@@ -0,0 +1,84 @@
+from typing import Any, AsyncIterator, Iterator
+
+import pytest
+
+from llms import accounting
+from llms.providers.openai_utils import _aread_stream, _read_stream
+
+
+def chat_chunks(texts: list[str]) -> list[dict[str, Any]]:
+    chunks = [{"choices": [{"delta": {"role": "assistant"}}]}]
+    chunks += [{"choices": [{"delta": {"content": text}}]} for text in texts]
+    return chunks + [{"choices": []}]
+
+
+class Stream:
+    def __init__(self, chunks: list[dict[str, Any]]) -> None:
+        self.chunks = chunks
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[dict[str, Any]]:
+        for chunk in self:
+            yield chunk
+
+    def close(self) -> None:
+        self.closed = True
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+TEXTS = [
+    "Let's think. ",
+    "The next action is ",
+    "```click",
+    " [12]```",
+    " done",
+]
+
+
+def test_read_stream_stops_early() -> None:
+    stream = Stream(chat_chunks(TEXTS))
+    answer = _read_stream(stream, lambda text: text.count("```") == 2)
+    assert answer == "".join(TEXTS[:4])
+    assert stream.read == 5
+    assert stream.closed
+
+
+def test_read_stream_reads_completion_chunks() -> None:
+    stream = Stream([{"choices": [{"text": text}]} for text in TEXTS])
+    answer = _read_stream(stream, lambda text: False)
+    assert answer == "".join(TEXTS)
+    assert stream.closed
+
+
+def test_read_stream_records_no_usage() -> None:
+    with accounting.track_call("gpt-4") as call:
+        _read_stream(Stream(chat_chunks(TEXTS)), lambda text: False)
+    assert call["prompt_tokens"] == call["completion_tokens"] == 0
+
+
+def test_read_stream_closes_on_error() -> None:
+    stream = Stream(chat_chunks(TEXTS))
+
+    def should_stop(text: str) -> bool:
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        _read_stream(stream, should_stop)
+    assert stream.closed
+
+
+@pytest.mark.asyncio
+async def test_aread_stream_stops_early() -> None:
+    stream = Stream(chat_chunks(TEXTS))
+    answer = await _aread_stream(stream, lambda text: text.count("```") == 2)
+    assert answer == "".join(TEXTS[:4])
+    assert stream.read == 5
+    assert stream.closed
@@ -0,0 +1,55 @@
+import re
+
+import pytest
+
+from llms.tokenizers import Tokenizer
+
+
+class ChunkTokenizer:
+    """Words cut in chunks of up to 3 characters, a prefix of the text that
+    ends in the middle of a chunk is encoded differently"""
+
+    def __init__(self) -> None:
+        self.vocab: dict[str, int] = {}
+        self.words: list[str] = []
+
+    def encode(self, text: str) -> list[int]:
+        ids = []
+        for word in re.findall(r"\s*\S+|\s+", text):
+            for i in range(0, len(word), 3):
+                chunk = word[i : i + 3]
+                if chunk not in self.vocab:
+                    self.vocab[chunk] = len(self.words)
+                    self.words.append(chunk)
+                ids.append(self.vocab[chunk])
+        return ids
+
+    def decode(self, ids: list[int]) -> str:
+        return "".join(self.words[i] for i in ids)
+
+
+@pytest.fixture
+def tokenizer() -> Tokenizer:
+    tokenizer = Tokenizer.__new__(Tokenizer)
+    tokenizer.tokenizer = ChunkTokenizer()
+    tokenizer.name = "test/chunks"
+    return tokenizer
+
+
+TEXTS = [
+    "",
+    "short",
+    "a b c d e f g h i j k l m n o p q r s t u v w x y z " * 20,
+    "[1234] link 'Customers' [1235] StaticText 'unbelievably long' " * 50,
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("max_length", [1, 5, 33, 100, 2000])
+def test_truncate_is_a_token_prefix(
+    tokenizer: Tokenizer, text: str, max_length: int
+) -> None:
+    ids = tokenizer.encode(text)
+    truncated, length = tokenizer.truncate(text, max_length)
+    assert truncated == tokenizer.decode(ids[:max_length])
+    assert length == min(max_length, len(ids))